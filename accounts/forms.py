@@ -1,11 +1,26 @@
 from django import forms
 from .models import Supplier
+from .services.excel_compare import parse_stock_vocabulary
+
+
+# Supplier files we can read; the actual format is detected from the file content.
+ALLOWED_UPLOAD_EXTENSIONS = ('.xlsx', '.xls', '.csv', '.tsv')
+
+
+def _clean_stock_vocabulary(val):
+    if not isinstance(val, str) or not val.strip():
+        return val
+    try:
+        parse_stock_vocabulary(val)
+    except ValueError as exc:
+        raise forms.ValidationError(str(exc))
+    return val.strip()
 
 
 class SupplierForm(forms.ModelForm):
     class Meta:
         model = Supplier
-        fields = ['name', 'product_name_column', 'product_id_column', 'stock_column', 'price_column', 'stock_in_text', 'stock_out_text', 'current_file']
+        fields = ['name', 'product_name_column', 'product_id_column', 'stock_column', 'price_column', 'stock_in_text', 'stock_out_text', 'stock_vocabulary', 'current_file']
         widgets = {
             'name': forms.TextInput(attrs={'placeholder': 'Supplier name'}),
             'product_name_column': forms.TextInput(attrs={'placeholder': 'e.g. product_name (optional)'}),
@@ -14,18 +29,22 @@ class SupplierForm(forms.ModelForm):
             'price_column': forms.TextInput(attrs={'placeholder': 'e.g. price (optional)'}),
             'stock_in_text': forms.TextInput(attrs={'placeholder': 'e.g. EN STOCK (optional)'}),
             'stock_out_text': forms.TextInput(attrs={'placeholder': 'e.g. AGOTADO (optional)'}),
+            'stock_vocabulary': forms.Textarea(attrs={'rows': 4, 'placeholder': 'DISPONIBLE=1\nCONSULTAR=0\nSIN STOCK=0'}),
         }
 
     def clean_name(self):
         return self.cleaned_data['name'].strip()
 
+    def clean_stock_vocabulary(self):
+        return _clean_stock_vocabulary(self.cleaned_data.get('stock_vocabulary'))
+
     def clean_current_file(self):
         f = self.cleaned_data.get('current_file')
         if not f:
             return f
         name = (getattr(f, 'name', '') or '').lower()
-        if not (name.endswith('.xlsx') or name.endswith('.xls')):
-            raise forms.ValidationError('Please upload an Excel file (.xlsx or .xls).')
+        if not name.endswith(ALLOWED_UPLOAD_EXTENSIONS):
+            raise forms.ValidationError('Please upload an Excel or CSV file (.xlsx, .xls, .csv or .tsv).')
         return f
 
 
@@ -34,17 +53,17 @@ class SupplierUploadForm(forms.Form):
 
     def clean_file(self):
         f = self.cleaned_data['file']
-        # Basic check for Excel extension
+        # Basic check for a supported extension
         name = (getattr(f, 'name', '') or '').lower()
-        if not (name.endswith('.xlsx') or name.endswith('.xls')):
-            raise forms.ValidationError('Please upload an Excel file (.xlsx or .xls).')
+        if not name.endswith(ALLOWED_UPLOAD_EXTENSIONS):
+            raise forms.ValidationError('Please upload an Excel or CSV file (.xlsx, .xls, .csv or .tsv).')
         return f
 
 
 class SupplierConfigForm(forms.ModelForm):
     class Meta:
         model = Supplier
-        fields = ['product_name_column', 'product_id_column', 'stock_column', 'price_column', 'stock_in_text', 'stock_out_text']
+        fields = ['product_name_column', 'product_id_column', 'stock_column', 'price_column', 'stock_in_text', 'stock_out_text', 'stock_vocabulary', 'stock_aggregation', *Supplier.DIFF_RULE_FIELDS]
         widgets = {
             'product_name_column': forms.TextInput(attrs={'placeholder': 'e.g. product_name (optional)'}),
             'product_id_column': forms.TextInput(attrs={'placeholder': 'e.g. sku or product_id'}),
@@ -52,8 +71,20 @@ class SupplierConfigForm(forms.ModelForm):
             'price_column': forms.TextInput(attrs={'placeholder': 'e.g. price (optional)'}),
             'stock_in_text': forms.TextInput(attrs={'placeholder': 'e.g. IN STOCK (optional)'}),
             'stock_out_text': forms.TextInput(attrs={'placeholder': 'e.g. OUT OF STOCK (optional)'}),
+            'stock_vocabulary': forms.Textarea(attrs={'rows': 4, 'placeholder': 'DISPONIBLE=1\nCONSULTAR=0\nSIN STOCK=0'}),
+            'min_price_change_pct': forms.NumberInput(attrs={'placeholder': 'e.g. 5 (optional)', 'min': 0, 'step': '0.01'}),
+            'min_stock_change': forms.NumberInput(attrs={'placeholder': 'e.g. 10 (optional)', 'min': 0}),
         }
 
+    def save(self, commit=True):
+        # Any column change may move the header, so drop the stored sheet layout.
+        # Diff rules only filter comparison results and keep it.
+        if set(self.changed_data) - set(Supplier.DIFF_RULE_FIELDS):
+            self.instance.clear_layout()
+        if 'price_column' in self.changed_data:
+            self.instance.price_decimal_separator = None
+        return super().save(commit=commit)
+
     def clean_product_id_column(self):
         return (self.cleaned_data.get('product_id_column') or '').strip()
 
@@ -75,3 +106,33 @@ class SupplierConfigForm(forms.ModelForm):
     def clean_stock_out_text(self):
         val = self.cleaned_data.get('stock_out_text')
         return val.strip() if isinstance(val, str) else val
+
+    def clean_stock_vocabulary(self):
+        return _clean_stock_vocabulary(self.cleaned_data.get('stock_vocabulary'))
+
+    def clean_min_price_change_pct(self):
+        val = self.cleaned_data.get('min_price_change_pct')
+        if val is not None and val < 0:
+            raise forms.ValidationError('The minimum price change cannot be negative.')
+        return val
+
+
+class VersionCompareForm(forms.Form):
+    old_version = forms.TypedChoiceField(coerce=int, label='Older version')
+    new_version = forms.TypedChoiceField(coerce=int, label='Newer version')
+
+    def __init__(self, *args, versions=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        choices = [
+            (v.number, f"v{v.number} · {v.file_name or 'unknown file'} ({v.created_at:%Y-%m-%d %H:%M})")
+            for v in versions
+        ]
+        self.fields['old_version'].choices = choices
+        self.fields['new_version'].choices = choices
+
+    def clean(self):
+        cleaned = super().clean()
+        old, new = cleaned.get('old_version'), cleaned.get('new_version')
+        if old is not None and old == new:
+            raise forms.ValidationError('Please choose two different versions.')
+        return cleaned
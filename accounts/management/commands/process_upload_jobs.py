@@ -0,0 +1,62 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.services.jobs import process_jobs, requeue_stale_jobs, worker_name
+from accounts.services.writebehind import flush, retry_pending_writes
+
+
+def _stop(signum, frame):
+	raise KeyboardInterrupt
+
+
+class Command(BaseCommand):
+	help = (
+		"Process queued supplier uploads and retry failed write-behind writes. Run one "
+		"or more of these workers on any node; each claims queued jobs from the "
+		"database without blocking the others."
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			"--once",
+			action="store_true",
+			help="Process the jobs queued now and exit instead of waiting for more",
+		)
+		parser.add_argument(
+			"--sleep",
+			type=float,
+			default=2.0,
+			help="Seconds to wait between polls of an empty queue (default: 2)",
+		)
+		parser.add_argument(
+			"--max-jobs",
+			type=int,
+			default=None,
+			help="Exit after processing this many jobs",
+		)
+
+	def handle(self, *args, once, sleep, max_jobs, **options):
+		if sleep <= 0:
+			raise CommandError("--sleep must be positive.")
+		worker = worker_name()
+		# Stop between jobs on SIGTERM too, so queued writes are flushed below.
+		signal.signal(signal.SIGTERM, _stop)
+		self.stdout.write(f"Upload worker {worker} started.")
+		processed = 0
+		try:
+			while max_jobs is None or processed < max_jobs:
+				requeue_stale_jobs()
+				retry_pending_writes()
+				remaining = None if max_jobs is None else max_jobs - processed
+				ran = process_jobs(worker, max_jobs=remaining)
+				processed += ran
+				if once:
+					break
+				if not ran:
+					time.sleep(sleep)
+		except KeyboardInterrupt:
+			pass
+		flush()
+		self.stdout.write(f"Processed {processed} upload jobs.")
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.services.batch import load_manifest, run_batch
+from accounts.services.writebehind import retry_pending_writes
+
+
+class Command(BaseCommand):
+	help = (
+		"Refresh many suppliers at once: compare each file with the supplier's stored "
+		"file and persist it as an upload would. SOURCE is a directory of "
+		"<supplier_id>.<ext> files or a JSON/CSV manifest mapping supplier IDs to files."
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument("source", help="Directory or manifest file")
+		parser.add_argument(
+			"--workers",
+			type=int,
+			default=None,
+			help="Worker processes (default: one per CPU core)",
+		)
+
+	def handle(self, *args, source, workers, **options):
+		try:
+			jobs = load_manifest(source)
+		except (OSError, ValueError) as exc:
+			raise CommandError(f"Could not read {source}: {exc}") from exc
+		if not jobs:
+			raise CommandError(f"No supplier files found in {source}.")
+
+		outcomes = run_batch(jobs, workers=workers)
+		retry_pending_writes()
+		for outcome in outcomes:
+			label = f"{outcome.supplier_id} {outcome.supplier_name}".strip()
+			if outcome.ok:
+				counts = ", ".join(f"{key}={count}" for key, count in outcome.counts.items())
+				self.stdout.write(self.style.SUCCESS(f"OK    {label}: {counts}"))
+			else:
+				self.stdout.write(self.style.ERROR(f"FAIL  {label} ({outcome.path}): {outcome.error}"))
+
+		failed = sum(not outcome.ok for outcome in outcomes)
+		if failed:
+			raise CommandError(f"{failed} of {len(outcomes)} suppliers failed.")
+		self.stdout.write(f"Refreshed {len(outcomes)} suppliers.")
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.services.writebehind import retry_pending_writes
+
+
+class Command(BaseCommand):
+	help = (
+		"Retry due write-behind writes (snapshots and comparison Excels) that failed. "
+		"The upload worker does this between jobs; schedule this command (e.g. with "
+		"cron) when uploads are processed eagerly without a worker."
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			"--limit",
+			type=int,
+			default=50,
+			help="Writes retried per batch (default: 50)",
+		)
+
+	def handle(self, *args, limit, **options):
+		if limit <= 0:
+			raise CommandError("--limit must be positive.")
+		succeeded = 0
+		while True:
+			done = retry_pending_writes(limit)
+			succeeded += done
+			# A short batch means nothing else is due (or the rest failed again).
+			if done < limit:
+				break
+		self.stdout.write(f"Stored {succeeded} pending writes.")
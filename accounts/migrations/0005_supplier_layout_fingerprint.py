@@ -0,0 +1,26 @@
+# Generated manually to store the per-supplier sheet layout fingerprint
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('accounts', '0004_supplier_product_name_column'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplier',
+            name='layout_header_row',
+            field=models.PositiveIntegerField(blank=True, null=True, help_text='0-based index of the header row in the last uploaded file'),
+        ),
+        migrations.AddField(
+            model_name='supplier',
+            name='layout_columns',
+            field=models.JSONField(blank=True, null=True, help_text='Column ordinals of the configured columns in the last uploaded file'),
+        ),
+        migrations.AddField(
+            model_name='supplier',
+            name='layout_header_hash',
+            field=models.CharField(max_length=64, blank=True, null=True, help_text='Hash of the header cells in the last uploaded file'),
+        ),
+    ]
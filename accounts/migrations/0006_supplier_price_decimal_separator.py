@@ -0,0 +1,16 @@
+# Generated manually to remember the supplier's price decimal separator
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('accounts', '0005_supplier_layout_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplier',
+            name='price_decimal_separator',
+            field=models.CharField(max_length=1, blank=True, null=True, choices=[(',', 'Comma'), ('.', 'Dot')], help_text='Decimal separator used in the price column'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated manually to add a multi-word stock text vocabulary
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('accounts', '0006_supplier_price_decimal_separator'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplier',
+            name='stock_vocabulary',
+            field=models.TextField(blank=True, null=True, help_text='Extra stock texts, one per line as TEXT=QUANTITY (e.g., "DISPONIBLE=1", "SIN STOCK=0")'),
+        ),
+    ]
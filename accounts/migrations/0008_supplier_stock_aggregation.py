@@ -0,0 +1,16 @@
+# Generated manually to let suppliers choose how duplicate-ID stock is combined
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('accounts', '0007_supplier_stock_vocabulary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplier',
+            name='stock_aggregation',
+            field=models.CharField(max_length=10, choices=[('sum', 'Sum of all rows'), ('max', 'Highest row'), ('first', 'First row')], default='sum', help_text='How stock is combined when a product ID appears in several rows'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated manually to key the parsed snapshot of the stored supplier file
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('accounts', '0008_supplier_stock_aggregation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplier',
+            name='current_file_digest',
+            field=models.CharField(max_length=64, blank=True, null=True, help_text='SHA-256 of the stored file; keys its parsed snapshot'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated manually to add per-supplier diff rules applied by compare_stock
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('accounts', '0009_supplier_current_file_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplier',
+            name='min_price_change_pct',
+            field=models.DecimalField(max_digits=6, decimal_places=2, blank=True, null=True, help_text='Only report price changes of at least this percentage of the old price'),
+        ),
+        migrations.AddField(
+            model_name='supplier',
+            name='min_stock_change',
+            field=models.PositiveIntegerField(blank=True, null=True, help_text='Ignore stock changes smaller than this many units (in/out of stock transitions are always reported)'),
+        ),
+        migrations.AddField(
+            model_name='supplier',
+            name='stock_transitions_only',
+            field=models.BooleanField(default=False, help_text='Only report stock changes between in stock and out of stock'),
+        ),
+    ]
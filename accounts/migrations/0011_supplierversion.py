@@ -0,0 +1,30 @@
+# Generated manually to keep a versioned history of normalized supplier uploads
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('accounts', '0010_supplier_diff_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SupplierVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(help_text='1-based version number, increasing per supplier')),
+                ('is_checkpoint', models.BooleanField(default=False, help_text='Whether the stored file holds every row instead of a delta')),
+                ('file_name', models.CharField(blank=True, help_text='Original name of the uploaded file', max_length=255, null=True)),
+                ('file_digest', models.CharField(blank=True, help_text='SHA-256 of the uploaded file', max_length=64, null=True)),
+                ('row_count', models.PositiveIntegerField(default=0, help_text='Products in this version')),
+                ('stored_rows', models.PositiveIntegerField(default=0, help_text='Rows in the stored checkpoint or delta file')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='accounts.supplier')),
+            ],
+            options={
+                'ordering': ['-number'],
+                'constraints': [models.UniqueConstraint(fields=('supplier', 'number'), name='unique_supplier_version_number')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated manually to add the per-product stock and price time series
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('accounts', '0011_supplierversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.CharField(help_text='Product identifier as read from the supplier file', max_length=255)),
+                ('recorded_at', models.DateTimeField(help_text='When the upload that produced this change was saved')),
+                ('status', models.CharField(choices=[('new', 'New product'), ('changed', 'Stock or price changed'), ('removed', 'Removed from the file')], default='changed', max_length=10)),
+                ('stock', models.FloatField(blank=True, help_text='Stock after the upload, if it changed', null=True)),
+                ('price', models.DecimalField(blank=True, decimal_places=2, help_text='Price after the upload, if it changed', max_digits=14, null=True)),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_changes', to='accounts.supplier')),
+            ],
+            options={
+                'ordering': ['-recorded_at'],
+                'indexes': [models.Index(fields=['supplier', 'recorded_at'], name='product_change_supplier_time')],
+                'constraints': [models.UniqueConstraint(fields=('supplier', 'product_id', 'recorded_at'), name='unique_supplier_product_change')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated manually to add the database-backed upload job queue
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('accounts', '0012_productchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('stage', models.CharField(blank=True, default='', help_text='Step the job is currently running, shown while polling', max_length=50)),
+                ('file_name', models.CharField(help_text='Storage name of the staged upload', max_length=255)),
+                ('original_name', models.CharField(help_text='Original name of the uploaded file', max_length=255)),
+                ('old_file_name', models.CharField(blank=True, help_text='Name of the file the upload is compared against', max_length=255, null=True)),
+                ('comparison_key', models.CharField(blank=True, help_text='Key of the stored comparison once the job is done', max_length=32, null=True)),
+                ('counts', models.JSONField(blank=True, help_text='Rows per comparison section once the job is done', null=True)),
+                ('error', models.TextField(blank=True, default='', help_text='Message shown to the user when the job failed')),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Times a worker has claimed this job')),
+                ('worker', models.CharField(blank=True, default='', help_text='Worker that claimed the job last', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_jobs', to='accounts.supplier')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='upload_job_status_created')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated manually to add the durable retry table of the write-behind queue
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('accounts', '0013_uploadjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingWrite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('snapshot', 'Parsed snapshot of the stock file'), ('last_comparison', 'Last comparison Excel')], max_length=30)),
+                ('args', models.JSONField(blank=True, default=dict, help_text='What is needed to redo the write from stored data')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Failed attempts so far')),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('next_attempt_at', models.DateTimeField(help_text='When a retry may pick the write up')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_writes', to='accounts.supplier')),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='pending_write_status_due')],
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated manually: history versions are written behind uploads too
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('accounts', '0014_pendingwrite'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pendingwrite',
+            name='kind',
+            field=models.CharField(choices=[('snapshot', 'Parsed snapshot of the stock file'), ('last_comparison', 'Last comparison Excel'), ('version', 'Version history entry')], max_length=30),
+        ),
+    ]
@@ -11,6 +11,13 @@ def supplier_upload_path(instance: "Supplier", filename: str) -> str:
     return os.path.join(f"user_{user_id}", f"supplier_{supplier_id}", "stock.xlsx")
 
 
+STOCK_AGGREGATION_CHOICES = [
+	('sum', 'Sum of all rows'),
+	('max', 'Highest row'),
+	('first', 'First row'),
+]
+
+
 class Supplier(models.Model):
 	owner = models.ForeignKey(
 		settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='suppliers'
@@ -23,13 +30,183 @@ class Supplier(models.Model):
 	# Optional text values for stock when the column is non-numeric
 	stock_in_text = models.CharField(max_length=100, blank=True, null=True, help_text='Text value meaning item is in stock (e.g., "EN STOCK")')
 	stock_out_text = models.CharField(max_length=100, blank=True, null=True, help_text='Text value meaning item is out of stock (e.g., "AGOTADO")')
+	stock_vocabulary = models.TextField(blank=True, null=True, help_text='Extra stock texts, one per line as TEXT=QUANTITY (e.g., "DISPONIBLE=1", "SIN STOCK=0")')
+	stock_aggregation = models.CharField(max_length=10, choices=STOCK_AGGREGATION_CHOICES, default='sum', help_text='How stock is combined when a product ID appears in several rows')
 	last_uploaded_filename = models.CharField(max_length=255, blank=True, null=True, help_text='Original name of the last uploaded file')
 	current_file = models.FileField(upload_to=supplier_upload_path, null=True, blank=True)
+	current_file_digest = models.CharField(max_length=64, blank=True, null=True, help_text='SHA-256 of the stored file; keys its parsed snapshot')
+	# Sheet layout fingerprint learned from the last upload; lets ingestion skip header discovery
+	layout_header_row = models.PositiveIntegerField(blank=True, null=True, help_text='0-based index of the header row in the last uploaded file')
+	layout_columns = models.JSONField(blank=True, null=True, help_text='Column ordinals of the configured columns in the last uploaded file')
+	layout_header_hash = models.CharField(max_length=64, blank=True, null=True, help_text='Hash of the header cells in the last uploaded file')
+	# Decimal separator inferred from the supplier's prices; reused instead of re-inferring per upload
+	price_decimal_separator = models.CharField(max_length=1, blank=True, null=True, choices=[(',', 'Comma'), ('.', 'Dot')], help_text='Decimal separator used in the price column')
+	# Diff rules: filter which changes a comparison reports, without affecting how files are read
+	min_price_change_pct = models.DecimalField(max_digits=6, decimal_places=2, blank=True, null=True, help_text='Only report price changes of at least this percentage of the old price')
+	min_stock_change = models.PositiveIntegerField(blank=True, null=True, help_text='Ignore stock changes smaller than this many units (in/out of stock transitions are always reported)')
+	stock_transitions_only = models.BooleanField(default=False, help_text='Only report stock changes between in stock and out of stock')
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
 		ordering = ['-updated_at']
 
+	LAYOUT_FIELDS = ('layout_header_row', 'layout_columns', 'layout_header_hash')
+	# Format details learned while ingesting uploads; saved alongside each new file
+	LEARNED_FORMAT_FIELDS = LAYOUT_FIELDS + ('price_decimal_separator',)
+	DIFF_RULE_FIELDS = ('min_price_change_pct', 'min_stock_change', 'stock_transitions_only')
+
+	def clear_layout(self) -> None:
+		"""Forget the stored sheet layout so the next upload runs full header detection."""
+		for field in self.LAYOUT_FIELDS:
+			setattr(self, field, None)
+
 	def __str__(self) -> str:
 		return f"{self.name} ({self.owner})"
+
+
+class SupplierVersion(models.Model):
+	"""One normalized upload in a supplier's history (see services/history.py).
+
+	Checkpoints store the whole frame; other versions store only the rows that
+	changed since the previous version.
+	"""
+
+	supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, related_name='versions')
+	number = models.PositiveIntegerField(help_text='1-based version number, increasing per supplier')
+	is_checkpoint = models.BooleanField(default=False, help_text='Whether the stored file holds every row instead of a delta')
+	file_name = models.CharField(max_length=255, blank=True, null=True, help_text='Original name of the uploaded file')
+	file_digest = models.CharField(max_length=64, blank=True, null=True, help_text='SHA-256 of the uploaded file')
+	row_count = models.PositiveIntegerField(default=0, help_text='Products in this version')
+	stored_rows = models.PositiveIntegerField(default=0, help_text='Rows in the stored checkpoint or delta file')
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		ordering = ['-number']
+		constraints = [
+			models.UniqueConstraint(fields=['supplier', 'number'], name='unique_supplier_version_number'),
+		]
+
+	def __str__(self) -> str:
+		return f"{self.supplier.name} v{self.number}"
+
+
+PRODUCT_CHANGE_STATUS_CHOICES = [
+	('new', 'New product'),
+	('changed', 'Stock or price changed'),
+	('removed', 'Removed from the file'),
+]
+
+
+class ProductChange(models.Model):
+	"""One product's stock and/or price after an upload that changed it (see services/timeseries.py).
+
+	Only changed products are stored, so a product's series holds one row per
+	upload that touched it. A null stock or price means it did not change.
+	"""
+
+	supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, related_name='product_changes')
+	product_id = models.CharField(max_length=255, help_text='Product identifier as read from the supplier file')
+	recorded_at = models.DateTimeField(help_text='When the upload that produced this change was saved')
+	status = models.CharField(max_length=10, choices=PRODUCT_CHANGE_STATUS_CHOICES, default='changed')
+	stock = models.FloatField(blank=True, null=True, help_text='Stock after the upload, if it changed')
+	price = models.DecimalField(max_digits=14, decimal_places=2, blank=True, null=True, help_text='Price after the upload, if it changed')
+
+	class Meta:
+		ordering = ['-recorded_at']
+		constraints = [
+			# Also serves per-product history lookups (supplier, product_id, time range).
+			models.UniqueConstraint(fields=['supplier', 'product_id', 'recorded_at'], name='unique_supplier_product_change'),
+		]
+		indexes = [
+			# All changes of a supplier in a time window.
+			models.Index(fields=['supplier', 'recorded_at'], name='product_change_supplier_time'),
+		]
+
+	def __str__(self) -> str:
+		return f"{self.product_id} @ {self.recorded_at:%Y-%m-%d %H:%M}"
+
+
+UPLOAD_JOB_STATUS_CHOICES = [
+	('queued', 'Queued'),
+	('running', 'Running'),
+	('done', 'Done'),
+	('failed', 'Failed'),
+]
+
+
+class UploadJob(models.Model):
+	"""An upload waiting for, or processed by, the `process_upload_jobs` worker (see services/jobs.py).
+
+	A queued upload is staged in storage under `file_name` until the job
+	finishes; uploads processed eagerly in the request are not staged. Workers claim queued jobs with `SELECT ... FOR UPDATE SKIP LOCKED`.
+	"""
+
+	supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, related_name='upload_jobs')
+	status = models.CharField(max_length=10, choices=UPLOAD_JOB_STATUS_CHOICES, default='queued')
+	stage = models.CharField(max_length=50, blank=True, default='', help_text='Step the job is currently running, shown while polling')
+	file_name = models.CharField(max_length=255, help_text='Storage name of the staged upload')
+	original_name = models.CharField(max_length=255, help_text='Original name of the uploaded file')
+	old_file_name = models.CharField(max_length=255, blank=True, null=True, help_text='Name of the file the upload is compared against')
+	comparison_key = models.CharField(max_length=32, blank=True, null=True, help_text='Key of the stored comparison once the job is done')
+	counts = models.JSONField(blank=True, null=True, help_text='Rows per comparison section once the job is done')
+	error = models.TextField(blank=True, default='', help_text='Message shown to the user when the job failed')
+	attempts = models.PositiveIntegerField(default=0, help_text='Times a worker has claimed this job')
+	worker = models.CharField(max_length=100, blank=True, default='', help_text='Worker that claimed the job last')
+	created_at = models.DateTimeField(auto_now_add=True)
+	started_at = models.DateTimeField(blank=True, null=True)
+	finished_at = models.DateTimeField(blank=True, null=True)
+
+	class Meta:
+		ordering = ['-created_at']
+		indexes = [
+			# Workers pick the oldest queued job.
+			models.Index(fields=['status', 'created_at'], name='upload_job_status_created'),
+		]
+
+	@property
+	def finished(self) -> bool:
+		return self.status in ('done', 'failed')
+
+	def __str__(self) -> str:
+		return f"{self.supplier.name} {self.original_name} ({self.status})"
+
+
+PENDING_WRITE_KIND_CHOICES = [
+	('snapshot', 'Parsed snapshot of the stock file'),
+	('last_comparison', 'Last comparison Excel'),
+	('version', 'Version history entry'),
+]
+PENDING_WRITE_STATUS_CHOICES = [
+	('pending', 'Pending'),
+	('failed', 'Failed'),
+]
+
+
+class PendingWrite(models.Model):
+	"""A storage write handed to the write-behind queue (see services/writebehind.py).
+
+	The row exists until the write succeeds or is superseded by a newer one,
+	so writes lost with their process are retried. A write that keeps failing
+	is marked failed and shown to the supplier's owner.
+	"""
+
+	supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, related_name='pending_writes')
+	kind = models.CharField(max_length=30, choices=PENDING_WRITE_KIND_CHOICES)
+	args = models.JSONField(default=dict, blank=True, help_text='What is needed to redo the write from stored data')
+	status = models.CharField(max_length=10, choices=PENDING_WRITE_STATUS_CHOICES, default='pending')
+	attempts = models.PositiveIntegerField(default=0, help_text='Failed attempts so far')
+	last_error = models.TextField(blank=True, default='')
+	next_attempt_at = models.DateTimeField(help_text='When a retry may pick the write up')
+	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		ordering = ['created_at']
+		indexes = [
+			# Retries pick due pending writes.
+			models.Index(fields=['status', 'next_attempt_at'], name='pending_write_status_due'),
+		]
+
+	def __str__(self) -> str:
+		return f"{self.supplier.name} {self.kind} ({self.status})"
@@ -0,0 +1,251 @@
+"""DataFrame backends for the normalize/compare pipeline.
+
+A backend implements the heavy steps of ingestion and comparison:
+normalizing a raw sheet (`normalize_columns`) and dropping unchanged rows
+and aligning ids inside `compare_stock`. Every backend takes and returns
+pandas frames in the compact schema of `excel_compare.compact_frame`, so
+snapshots, history and comparison results do not depend on the backend.
+
+`PandasBackend` is the default. `PolarsBackend` runs the same steps with
+multi-threaded Arrow-native Polars expressions and is selected with
+`settings.STOCK_DATAFRAME_BACKEND = 'polars'`.
+"""
+import logging
+from functools import lru_cache
+from typing import Dict, Mapping, Optional, Tuple, Type
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .comparison_result import ComparisonResult
+from .excel_compare import (
+    _PRICE_SAMPLE_SIZE,
+    _PRICE_TOKEN_RE,
+    ROW_HASH_COLUMN,
+    STOCK_AGGREGATIONS,
+    DiffRules,
+    align_ids,
+    compact_frame,
+    compare_stock,
+    DEFAULT_NORMALIZE_CHUNK_ROWS,
+    compile_stock_vocabulary,
+    drop_unchanged_rows,
+    infer_decimal_separator,
+    normalize_columns_parallel,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_BACKEND = 'pandas'
+
+
+class PandasBackend:
+    """The reference implementation: the pandas functions of `excel_compare`."""
+
+    name = 'pandas'
+
+    def normalize_columns(self, df: pd.DataFrame, product_id: str, stock_col: str, price_col: Optional[str], **options) -> pd.DataFrame:
+        """See `excel_compare.normalize_columns`.
+
+        Sheets longer than `settings.STOCK_NORMALIZE_CHUNK_ROWS` are split into
+        chunks normalized by `settings.STOCK_NORMALIZE_WORKERS` processes.
+        """
+        return normalize_columns_parallel(
+            df, product_id, stock_col, price_col,
+            workers=getattr(settings, 'STOCK_NORMALIZE_WORKERS', 1),
+            chunk_rows=getattr(settings, 'STOCK_NORMALIZE_CHUNK_ROWS', DEFAULT_NORMALIZE_CHUNK_ROWS),
+            **options,
+        )
+
+    def drop_unchanged_rows(self, old_df: pd.DataFrame, new_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        return drop_unchanged_rows(old_df, new_df)
+
+    def align_ids(self, old_df: pd.DataFrame, new_df: pd.DataFrame) -> pd.DataFrame:
+        return align_ids(old_df, new_df)
+
+    def compare_stock(self, old_df: Optional[pd.DataFrame], new_df: pd.DataFrame, rules: Optional[DiffRules] = None) -> ComparisonResult:
+        """`excel_compare.compare_stock` with this backend's row filter and id alignment."""
+        return compare_stock(old_df, new_df, rules, backend=self)
+
+
+def _is_text(values: pd.Series) -> bool:
+    """Whether a raw column holds only strings and missing values, as sheet readers return."""
+    return pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty')
+
+
+class PolarsBackend(PandasBackend):
+    """Polars implementation of the pipeline steps.
+
+    Results are identical to `PandasBackend`: frames cross over through
+    Arrow, and the final compaction and row fingerprints stay in pandas.
+    Raw columns that do not hold only text are normalized with pandas.
+    """
+
+    name = 'polars'
+
+    def __init__(self):
+        try:
+            import polars
+        except ImportError as exc:  # pragma: no cover - depends on environment
+            raise ValueError("The 'polars' DataFrame backend requires the 'polars' package.") from exc
+        # replace_strict, full joins with coalesce and str.strip_chars need polars 1.x.
+        if int(polars.__version__.split('.')[0]) != 1:
+            raise ValueError(f"The 'polars' DataFrame backend requires polars 1.x, not {polars.__version__}.")
+        self.pl = polars
+
+    def normalize_columns(
+        self,
+        df: pd.DataFrame,
+        product_id: str,
+        stock_col: str,
+        price_col: Optional[str],
+        name_col: Optional[str] = None,
+        stock_in_text: Optional[str] = None,
+        stock_out_text: Optional[str] = None,
+        price_decimal: Optional[str] = None,
+        stock_vocabulary: Optional[Mapping[str, float]] = None,
+        stock_agg: str = 'sum',
+    ) -> pd.DataFrame:
+        pl = self.pl
+        rename_map = {product_id: 'id', stock_col: 'stock'}
+        if price_col:
+            rename_map[price_col] = 'price'
+        if name_col:
+            rename_map[name_col] = 'name'
+        cols = list(rename_map)
+        if len(set(rename_map.values())) != len(cols) or not all(c in df.columns and _is_text(df[c]) for c in cols):
+            return super().normalize_columns(
+                df, product_id, stock_col, price_col,
+                name_col=name_col, stock_in_text=stock_in_text, stock_out_text=stock_out_text,
+                price_decimal=price_decimal, stock_vocabulary=stock_vocabulary, stock_agg=stock_agg,
+            )
+        if stock_agg not in STOCK_AGGREGATIONS:
+            raise ValueError(f"Unknown stock aggregation '{stock_agg}'; expected one of {STOCK_AGGREGATIONS}.")
+
+        frame = pl.from_pandas(df[cols].rename(columns=rename_map))
+        # Remove section/separator rows: a single non-empty cell across the relevant columns
+        nonempty = pl.sum_horizontal([
+            (pl.col(c).str.strip_chars() != '').fill_null(False).cast(pl.Int64) for c in frame.columns
+        ])
+        keep = frame.select(nonempty > 1).to_series()
+        removed_sep = len(keep) - int(keep.sum())
+        if removed_sep:
+            logger.info("Filtering %d separator-like rows (single non-empty cell).", removed_sep)
+        frame = frame.filter(keep)
+
+        raw_stock = pl.col('stock')
+        stripped_stock = raw_stock.str.strip_chars()
+        stock = stripped_stock.cast(pl.Float64, strict=False)
+        # Overflowing numbers (e.g. "1e400") are not a usable stock; read them as text.
+        stock = pl.when(stock.is_infinite()).then(None).otherwise(stock)
+        table = compile_stock_vocabulary(stock_in_text, stock_out_text, stock_vocabulary)
+        if table:
+            is_text = (stock.is_null() | stock.is_nan()) & raw_stock.is_not_null()
+            mapped = stripped_stock.str.to_lowercase().replace_strict(table, default=None, return_dtype=pl.Float64)
+            stock = pl.when(is_text).then(mapped).otherwise(stock)
+        columns = [
+            pl.col('id').fill_null('nan').str.strip_chars(),
+            stock.fill_nan(0.0).fill_null(0.0).alias('stock'),
+        ]
+        if 'price' in frame.columns:
+            columns.append(self._parse_prices(frame['price'], price_decimal).alias('price'))
+        if 'name' in frame.columns:
+            name = pl.col('name').str.strip_chars()
+            columns.append(pl.when(name == '').then(None).otherwise(name).alias('name'))
+        columns.append(stripped_stock.alias('stock_raw'))
+        frame = frame.select(columns)
+
+        # Deduplicate IDs: aggregate stock and keep the last non-null price/name/raw stock
+        if frame['id'].is_duplicated().any():
+            logger.info("Duplicate product IDs detected; aggregating by id (stock: %s).", stock_agg)
+            agg = [getattr(pl.col('stock'), stock_agg)()]
+            agg += [pl.col(c).drop_nulls().last() for c in frame.columns if c not in ('id', 'stock')]
+            frame = frame.group_by('id').agg(agg).sort('id')
+
+        out = frame.filter(pl.col('id') != '').to_pandas()
+        if 'price' in out.columns:
+            # Rounded in numpy (half to even), exactly like `parse_prices`.
+            out['price'] = out['price'].round(2)
+        return compact_frame(out)
+
+    def _parse_prices(self, values, decimal: Optional[str]):
+        """Polars expression for `excel_compare.parse_prices` over the 'price' column."""
+        pl = self.pl
+        token = pl.col('price').str.strip_chars().str.extract(_PRICE_TOKEN_RE, 1)
+        if decimal is None and values.str.strip_chars().str.contains(_PRICE_TOKEN_RE).any():
+            sample = values.drop_nulls().head(_PRICE_SAMPLE_SIZE).to_pandas()
+            decimal = infer_decimal_separator(sample)
+        # The rightmost separator is the first one found in the reversed token.
+        reversed_token = token.str.reverse()
+        comma_at = reversed_token.str.find(',', literal=True)
+        dot_at = reversed_token.str.find('.', literal=True)
+        comma_is_decimal = comma_at.is_not_null() & (dot_at.is_null() | (comma_at < dot_at))
+        if decimal in (',', '.'):
+            other = '.' if decimal == ',' else ','
+            contrary = token.str.contains(other, literal=True) & (comma_is_decimal != (decimal == ','))
+        else:
+            decimal, other = '.', ','
+            contrary = comma_is_decimal
+
+        def apply_decimal(sep: str):
+            if sep == ',':
+                return token.str.replace_all('.', '', literal=True).str.replace_all(',', '.', literal=True)
+            return token.str.replace_all(',', '', literal=True)
+
+        cleaned = pl.when(contrary).then(apply_decimal(other)).otherwise(apply_decimal(decimal))
+        return cleaned.cast(pl.Float64, strict=False)
+
+    def drop_unchanged_rows(self, old_df: pd.DataFrame, new_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        pl = self.pl
+        old_hashes = pl.Series(old_df[ROW_HASH_COLUMN].to_numpy())
+        new_hashes = pl.Series(new_df[ROW_HASH_COLUMN].to_numpy())
+        changed_old = (~old_hashes.is_in(new_hashes)).to_numpy()
+        changed_new = (~new_hashes.is_in(old_hashes)).to_numpy()
+        logger.info(
+            "Fingerprint pre-filter: %d of %d new rows unchanged",
+            len(new_df) - int(changed_new.sum()),
+            len(new_df),
+        )
+        return old_df[changed_old], new_df[changed_new]
+
+    def align_ids(self, old_df: pd.DataFrame, new_df: pd.DataFrame) -> pd.DataFrame:
+        pl = self.pl
+        old_ids = pl.DataFrame({'id': pl.from_pandas(old_df['id'].reset_index(drop=True)), '_old': np.arange(len(old_df))})
+        new_ids = pl.DataFrame({'id': pl.from_pandas(new_df['id'].reset_index(drop=True)), '_new': np.arange(len(new_df))})
+        aligned = old_ids.join(new_ids, on='id', how='full', coalesce=True).with_columns(
+            pl.when(pl.col('_new').is_null()).then(pl.lit('left_only'))
+            .when(pl.col('_old').is_null()).then(pl.lit('right_only'))
+            .otherwise(pl.lit('both')).alias('_origin'),
+            pl.col('_old').fill_null(-1),
+            pl.col('_new').fill_null(-1),
+        )
+        return pd.DataFrame({
+            'id': aligned['id'].to_pandas(),
+            '_old': aligned['_old'].to_numpy().astype(np.intp),
+            '_new': aligned['_new'].to_numpy().astype(np.intp),
+            '_origin': aligned['_origin'].to_numpy().astype(object),
+        })
+
+
+BACKENDS: Dict[str, Type[PandasBackend]] = {
+    PandasBackend.name: PandasBackend,
+    PolarsBackend.name: PolarsBackend,
+}
+
+
+@lru_cache(maxsize=None)
+def _backend(name: str) -> PandasBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown DataFrame backend '{name}'; expected one of {tuple(BACKENDS)}.")
+    return BACKENDS[name]()
+
+
+def get_backend(name: Optional[str] = None) -> PandasBackend:
+    """Return the backend called `name`, by default `settings.STOCK_DATAFRAME_BACKEND`.
+
+    Raises ValueError for an unknown name or a backend whose package is missing.
+    """
+    return _backend(name or getattr(settings, 'STOCK_DATAFRAME_BACKEND', DEFAULT_BACKEND))
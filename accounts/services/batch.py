@@ -0,0 +1,137 @@
+import csv
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional
+
+from django.core.files import File
+from django.db import close_old_connections, connections
+
+from .jobs import run_upload
+from .writebehind import flush
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchOutcome:
+	"""Result of refreshing one supplier in a batch."""
+
+	supplier_id: int
+	path: str
+	ok: bool
+	supplier_name: str = ""
+	error: str = ""
+	# Rows per comparison section, e.g. {'new_products': 3}
+	counts: Dict[str, int] = field(default_factory=dict)
+	# UploadJob that processed the file; its page shows the comparison.
+	job_id: Optional[int] = None
+
+
+def load_manifest(source: str) -> Dict[int, str]:
+	"""Map supplier IDs to files from a directory or a manifest file.
+
+	- A directory maps every file named `<supplier_id>.<ext>` (e.g. `12.xlsx`).
+	- A `.json` manifest holds an object of `{"<supplier_id>": "<path>"}`.
+	- Any other file is read as CSV rows of `supplier_id,path`.
+
+	Relative paths in a manifest are resolved against its directory.
+	Raises ValueError on malformed entries.
+	"""
+	if os.path.isdir(source):
+		jobs = {}
+		for name in sorted(os.listdir(source)):
+			stem, _ext = os.path.splitext(name)
+			path = os.path.join(source, name)
+			if stem.isdigit() and os.path.isfile(path):
+				jobs[int(stem)] = path
+		return jobs
+
+	base = os.path.dirname(os.path.abspath(source))
+	with open(source, newline="", encoding="utf-8") as fh:
+		if source.lower().endswith(".json"):
+			entries = list(json.load(fh).items())
+		else:
+			entries = [row for row in csv.reader(fh) if row and not row[0].startswith("#")]
+	jobs = {}
+	for lineno, entry in enumerate(entries, start=1):
+		if len(entry) != 2 or not str(entry[0]).strip().isdigit():
+			raise ValueError(f"Manifest entry {lineno}: expected supplier_id and path, got {entry!r}.")
+		supplier_id, path = int(str(entry[0]).strip()), str(entry[1]).strip()
+		jobs[supplier_id] = path if os.path.isabs(path) else os.path.join(base, path)
+	return jobs
+
+
+def refresh_supplier(supplier_id: int, path: str) -> BatchOutcome:
+	"""Compare `path` with the supplier's stored file and persist it like an upload.
+
+	The file is processed as an eager upload job (`run_upload`), so the new
+	file, its snapshot, the stored comparison and the last comparison Excel
+	are persisted exactly as `SupplierUploadView` persists them, and the
+	comparison can be opened from the job's page. Errors are reported in the
+	outcome instead of raised.
+	"""
+	# Imported here: spawned workers load this module before `django.setup()`.
+	from ..models import Supplier
+
+	close_old_connections()
+	outcome = BatchOutcome(supplier_id=supplier_id, path=path, ok=False)
+	try:
+		supplier = Supplier.objects.get(pk=supplier_id)
+		outcome.supplier_name = supplier.name
+		new_name = os.path.basename(path)
+		with open(path, "rb") as fh:
+			job = run_upload(supplier, File(fh, name=new_name), new_name)
+		# Pool workers may exit without running exit handlers; finish the writes behind the job now.
+		flush()
+	except Exception as exc:
+		logger.exception("Batch refresh failed for supplier %s (%s): %s", supplier_id, path, exc)
+		outcome.error = str(exc) or type(exc).__name__
+		return outcome
+	outcome.job_id = job.pk
+	if job.status != 'done':
+		outcome.error = job.error
+		return outcome
+	outcome.ok = True
+	outcome.counts = job.counts
+	logger.info("Batch refresh completed for supplier %s: %s", supplier.name, outcome.counts)
+	return outcome
+
+
+def _init_worker() -> None:
+	"""Set up Django in a spawned worker process."""
+	import django
+
+	django.setup()
+
+
+def run_batch(jobs: Mapping[int, str], workers: Optional[int] = None) -> List[BatchOutcome]:
+	"""Refresh many suppliers, one process per core, returning outcomes in job order.
+
+	`jobs` maps supplier IDs to file paths (see `load_manifest`). With a
+	single worker (or a single job) everything runs in this process.
+	"""
+	items = list(jobs.items())
+	workers = min(workers or os.cpu_count() or 1, len(items)) or 1
+	logger.info("Refreshing %d suppliers with %d worker(s)", len(items), workers)
+	if workers == 1:
+		return [refresh_supplier(supplier_id, path) for supplier_id, path in items]
+
+	# Workers open their own database connections; inherited ones must not be shared.
+	connections.close_all()
+	context = multiprocessing.get_context("spawn")
+	with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+		futures = [pool.submit(refresh_supplier, supplier_id, path) for supplier_id, path in items]
+		outcomes = []
+		for (supplier_id, path), future in zip(items, futures):
+			try:
+				outcomes.append(future.result())
+			except Exception as exc:
+				# The worker itself died (e.g. out of memory); report it like any failure.
+				logger.exception("Batch worker failed for supplier %s: %s", supplier_id, exc)
+				outcomes.append(BatchOutcome(supplier_id=supplier_id, path=path, ok=False, error=str(exc) or type(exc).__name__))
+	return outcomes
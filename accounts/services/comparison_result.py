@@ -0,0 +1,138 @@
+"""Columnar result of a stock comparison.
+
+`compare_stock` returns a `ComparisonResult`: one DataFrame per section,
+readable like the plain dict it replaces. Rows are only turned into Python
+dicts for the slice a caller asks for, so a large diff can be counted,
+paged through and exported without building a list of records first.
+"""
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+import pandas as pd
+
+
+COMPARISON_SECTIONS = ('removed_or_out_of_stock', 'new_products', 'stock_changes', 'price_changes')
+# Rows converted to records at a time by `ComparisonResult.iter_records`.
+RECORD_BATCH_ROWS = 1000
+
+SectionSource = Union[pd.DataFrame, Callable[[], pd.DataFrame]]
+
+
+def clean_record_value(value):
+    """Normalize values for JSON/session storage and template rendering.
+
+    Converts NaN-like values to None and strips simple string wrappers while
+    leaving valid numbers and strings intact.
+    """
+    try:
+        if value is None:
+            return None
+        # Convert NaN / <NA> textual representations to None
+        s = str(value).strip().lower()
+        if s in ("nan", "<na>"):
+            return None
+        return value
+    except Exception:
+        return None
+
+
+class ComparisonResult(Mapping):
+    """The four comparison sections, kept as DataFrames.
+
+    A section may also be given as a zero-argument loader, called the first
+    time the section's rows are needed; `counts` then supplies its row count
+    so counting never loads it.
+    """
+
+    def __init__(self, sections: Dict[str, SectionSource], counts: Optional[Dict[str, int]] = None):
+        missing = [section for section in COMPARISON_SECTIONS if section not in sections]
+        if missing:
+            raise ValueError(f"Missing comparison sections: {', '.join(missing)}")
+        self._frames: Dict[str, pd.DataFrame] = {}
+        self._loaders: Dict[str, Callable[[], pd.DataFrame]] = {}
+        for section in COMPARISON_SECTIONS:
+            source = sections[section]
+            if isinstance(source, pd.DataFrame):
+                self._frames[section] = source
+            else:
+                self._loaders[section] = source
+        self._counts = dict(counts or {})
+
+    def __getitem__(self, section: str) -> pd.DataFrame:
+        if section not in self._frames:
+            if section not in self._loaders:
+                raise KeyError(section)
+            self._frames[section] = self._loaders.pop(section)()
+        return self._frames[section]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(COMPARISON_SECTIONS)
+
+    def __len__(self) -> int:
+        return len(COMPARISON_SECTIONS)
+
+    def count(self, section: str) -> int:
+        """Number of rows in `section`, without loading or converting them."""
+        if section in self._frames:
+            return len(self._frames[section])
+        if section in self._counts:
+            return self._counts[section]
+        return len(self[section])
+
+    def counts(self) -> Dict[str, int]:
+        return {section: self.count(section) for section in COMPARISON_SECTIONS}
+
+    def records(self, section: str, start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Cleaned dict records for rows `start:stop` of `section`."""
+        count = self.count(section)
+        start, stop, _step = slice(start, stop).indices(count)
+        if start >= stop:
+            return []
+        rows = self[section].iloc[start:stop].to_dict('records')
+        return [{key: clean_record_value(value) for key, value in row.items()} for row in rows]
+
+    def iter_records(self, section: str, batch_rows: int = RECORD_BATCH_ROWS) -> Iterator[Dict[str, Any]]:
+        """Yield every record of `section`, converting `batch_rows` rows at a time."""
+        for start in range(0, self.count(section), batch_rows):
+            yield from self.records(section, start, start + batch_rows)
+
+    def blocks(self) -> Iterator['ComparisonResult']:
+        """Yield the result as consecutive id ranges, each a `ComparisonResult`.
+
+        Lets a consumer handle a large (spilled) result one piece at a time;
+        an in-memory result is a single block.
+        """
+        yield self
+
+    def section_records(self, section: str) -> 'SectionRecords':
+        """A lazy sequence over `section`'s records, e.g. for a Paginator."""
+        return SectionRecords(self, section)
+
+
+class SectionRecords:
+    """Read-only sequence of one section's records, converted slice by slice.
+
+    Supports `len()`, indexing and slicing, which is what
+    `django.core.paginator.Paginator` needs to page through a section.
+    """
+
+    def __init__(self, result: ComparisonResult, section: str):
+        self.result = result
+        self.section = section
+
+    def __len__(self) -> int:
+        return self.result.count(self.section)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                raise ValueError("SectionRecords slices do not support a step")
+            return self.result.records(self.section, index.start or 0, index.stop)
+        count = len(self)
+        position = index + count if index < 0 else index
+        if not 0 <= position < count:
+            raise IndexError(index)
+        return self.result.records(self.section, position, position + 1)[0]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self.result.iter_records(self.section)
@@ -1,101 +1,770 @@
+import codecs
+import csv
+import hashlib
+import io
 import logging
-from typing import Optional, Dict, Any
+import multiprocessing
 import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from itertools import chain, islice
+from typing import Optional, Dict, Any, Callable, Iterator, List, Mapping, Sequence, Tuple
 from io import BytesIO
+import numpy as np
 import pandas as pd
+from pandas._libs.parsers import STR_NA_VALUES
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+from openpyxl.reader.excel import ExcelReader
+
+from .comparison_result import ComparisonResult
 
 logger = logging.getLogger(__name__)
 
 
-def _find_header_row(df_no_header: pd.DataFrame, key_col_name: str) -> Optional[int]:
+# How many leading rows are searched for the header before giving up.
+DEFAULT_HEADER_SCAN_ROWS = 50
+
+
+def _find_header_row(
+    df_no_header: pd.DataFrame,
+    key_col_name: str,
+    max_rows: int = DEFAULT_HEADER_SCAN_ROWS,
+) -> Optional[int]:
     """
-    Scan the DataFrame (read with header=None) to locate the row index
-    that contains the key column name. Matching is case-insensitive and trims spaces.
+    Scan the first `max_rows` rows of a DataFrame (read with header=None) to locate
+    the row index that contains the key column name. Matching is case-insensitive
+    and trims spaces. The whole window is checked in one vectorized pass.
     Returns the row index or None if not found.
     """
     target = str(key_col_name).strip().lower()
-    for i in range(len(df_no_header)):
-        row_values = df_no_header.iloc[i].astype(str).str.strip().str.lower().tolist()
-        if target in row_values:
-            logger.info("Detected header row at index %d for key '%s'", i, key_col_name)
-            return i
-    logger.warning("Header row not found for key '%s'", key_col_name)
-    return None
+    window = df_no_header.iloc[:max_rows]
+    n_cols = window.shape[1]
+    if window.empty or n_cols == 0:
+        logger.warning("Header row not found for key '%s' within %d rows", key_col_name, max_rows)
+        return None
+    cells = pd.Series(window.to_numpy(dtype=object).ravel())
+    filled = cells.notna().to_numpy()
+    hits = np.zeros(len(cells), dtype=bool)
+    hits[filled] = cells[filled].astype(str).str.strip().str.lower().eq(target).to_numpy()
+    if not hits.any():
+        logger.warning("Header row not found for key '%s' within %d rows", key_col_name, max_rows)
+        return None
+    i = int(hits.argmax()) // n_cols
+    logger.info("Detected header row at index %d for key '%s'", i, key_col_name)
+    return i
+
 
+@dataclass(frozen=True)
+class SheetLayout:
+    """Where the header and configured columns sit in a supplier's sheet.
 
-def read_excel_dynamic(file_obj, key_col_name: str) -> pd.DataFrame:
+    `columns` maps header names to their 0-based ordinal and `header_hash`
+    fingerprints the header cells so a stored layout can be validated cheaply.
     """
-    Read an Excel file where headers may not be on the first row.
+
+    header_row: int
+    columns: Dict[str, int]
+    header_hash: str
+
+
+def read_excel_dynamic(
+    file_obj,
+    key_col_name: str,
+    columns: Optional[Sequence[str]] = None,
+    max_header_rows: int = DEFAULT_HEADER_SCAN_ROWS,
+) -> pd.DataFrame:
+    """
+    Read a supplier sheet (xlsx, xls or CSV/TSV) where headers may not be on the first row.
     Detect the header row by searching for the key column name.
     Returns a DataFrame with proper column names and data rows only.
-    Raises ValueError if header row cannot be detected.
+    Raises ValueError if header row cannot be detected within the first
+    `max_header_rows` rows.
+
+    Rows are streamed (openpyxl's read-only iterator for xlsx). When
+    `columns` is given, only those header names are materialized (columns that
+    are not present in the header are skipped, so `normalize_columns` can
+    report them), keeping memory proportional to the projected columns.
+    """
+    df, _layout = read_sheet_with_layout(file_obj, key_col_name, columns=columns, max_header_rows=max_header_rows)
+    return df
+
+
+def read_sheet_with_layout(
+    file_obj,
+    key_col_name: str,
+    columns: Optional[Sequence[str]] = None,
+    max_header_rows: int = DEFAULT_HEADER_SCAN_ROWS,
+    layout: Optional[SheetLayout] = None,
+) -> Tuple[pd.DataFrame, SheetLayout]:
+    """
+    Same as `read_excel_dynamic`, but also return the detected `SheetLayout`.
+
+    The file format (xlsx, legacy xls or delimited text) is detected from its
+    leading bytes and the matching reader registered in `_READERS` is used;
+    every reader returns the same string-typed frame.
+
+    When a previously stored `layout` is given and the cells at its header row
+    still hash to the same fingerprint, header discovery is skipped and data
+    rows are read straight away. Any mismatch falls back to full detection.
     """
     # Pandas sometimes can't infer the Excel engine when the input is a file-like
     # object with no filename/extension (common with remote storage downloads).
-    # Ensure we operate on a seekable buffer and specify engine explicitly.
+    # Ensure we operate on a seekable buffer and pick the reader from its content.
     buffer = _coerce_excel_buffer(file_obj)
-    # Read entire sheet without headers
-    df_raw = pd.read_excel(buffer, header=None, dtype=str, engine="openpyxl")
-    header_row = _find_header_row(df_raw, key_col_name)
+    fmt = detect_file_format(buffer)
+    frames, detected = _READERS[fmt](
+        buffer,
+        key_col_name,
+        columns=columns,
+        max_header_rows=max_header_rows,
+        layout=layout,
+        chunk_rows=None,
+    )
+    parts = list(frames)
+    df = parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+    logger.info("%s read complete: %d rows, %d columns", fmt.upper(), len(df), len(df.columns))
+    return df, detected
+
+
+# Rows per frame produced by `read_sheet_chunks`.
+DEFAULT_CHUNK_ROWS = 100_000
+
+
+def read_sheet_chunks(
+    file_obj,
+    key_col_name: str,
+    columns: Optional[Sequence[str]] = None,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    max_header_rows: int = DEFAULT_HEADER_SCAN_ROWS,
+    layout: Optional[SheetLayout] = None,
+) -> Tuple[Iterator[pd.DataFrame], SheetLayout]:
+    """
+    Like `read_sheet_with_layout`, but return the data rows lazily as frames of
+    at most `chunk_rows` rows, so a sheet never has to be materialized at once.
+
+    The header is located before returning (errors are raised here); the
+    frames are read while the iterator is consumed.
+    """
+    buffer = _coerce_excel_buffer(file_obj)
+    fmt = detect_file_format(buffer)
+    return _READERS[fmt](
+        buffer,
+        key_col_name,
+        columns=columns,
+        max_header_rows=max_header_rows,
+        layout=layout,
+        chunk_rows=chunk_rows,
+    )
+
+
+# Sheet readers keyed by format name. Each takes a seekable binary buffer and
+# returns (frames, layout): the header is located eagerly and `frames` lazily
+# yields frames of at most `chunk_rows` rows (a single frame when None). Frames
+# hold strings or NaN, one column per projected header name.
+_READERS: Dict[str, Callable[..., Tuple[Iterator[pd.DataFrame], SheetLayout]]] = {}
+
+_XLSX_MAGIC = b"PK\x03\x04"
+_XLS_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+
+def register_reader(fmt: str):
+    """Register the decorated function as the sheet reader for `fmt`."""
+    def decorator(func):
+        _READERS[fmt] = func
+        return func
+    return decorator
+
+
+def detect_file_format(buffer) -> str:
+    """Return 'xlsx', 'xls' or 'csv' from the buffer's magic bytes; the buffer is rewound."""
+    head = buffer.read(len(_XLS_MAGIC))
+    buffer.seek(0)
+    if head.startswith(_XLSX_MAGIC):
+        return "xlsx"
+    if head.startswith(_XLS_MAGIC):
+        return "xls"
+    # Anything else is treated as delimited text (CSV/TSV exports).
+    return "csv"
+
+
+_COUNT_CHUNK_BYTES = 1024 * 1024
+# Opening tag of a worksheet row, with or without a namespace prefix.
+_XLSX_ROW_TAG = re.compile(rb"<(?:\w+:)?row[\s/>]")
+
+
+def estimate_row_count(file_obj) -> int:
+    """Count the rows of a supplier sheet without parsing its cells.
+
+    xlsx row elements are counted in the streamed worksheet XML, xls uses the
+    sheet's row count and text files count line breaks. Header, preamble and
+    blank rows are included, so this is an upper bound of the data rows.
+    """
+    buffer = _coerce_excel_buffer(file_obj)
+    fmt = detect_file_format(buffer)
+    if fmt == "xlsx":
+        reader = ExcelReader(buffer, read_only=True)
+        try:
+            # Only the workbook part is parsed; shared strings are not loaded.
+            reader.read_manifest()
+            reader.read_workbook()
+            _sheet, rel = next(reader.parser.find_sheets())
+            count, tail = 0, b""
+            with reader.archive.open(rel.target) as xml:
+                for chunk in iter(lambda: xml.read(_COUNT_CHUNK_BYTES), b""):
+                    window = tail + chunk
+                    count += len(_XLSX_ROW_TAG.findall(window))
+                    # Keep a short tail so a tag split across chunks is seen once.
+                    tail = window[-16:]
+                    count -= len(_XLSX_ROW_TAG.findall(tail))
+            return count + len(_XLSX_ROW_TAG.findall(tail))
+        finally:
+            reader.archive.close()
+            buffer.seek(0)
+    if fmt == "xls":
+        try:
+            import xlrd
+        except ImportError as exc:  # pragma: no cover - depends on environment
+            raise ValueError("Reading legacy .xls files requires the 'xlrd' package.") from exc
+        book = xlrd.open_workbook(file_contents=buffer.read(), on_demand=True)
+        try:
+            return book.sheet_by_index(0).nrows
+        finally:
+            book.release_resources()
+    count, last = 0, b""
+    for chunk in iter(lambda: buffer.read(_COUNT_CHUNK_BYTES), b""):
+        count += chunk.count(b"\n")
+        last = chunk
+    # A final line without a trailing newline is still a row.
+    return count + (1 if last and not last.endswith(b"\n") else 0)
+
+
+def _locate_header(
+    rows: Iterator[Sequence[Any]],
+    key_col_name: str,
+    max_header_rows: int,
+    layout: Optional[SheetLayout],
+) -> Tuple[List[Sequence[Any]], int, bool]:
+    """Consume leading rows until the header is known.
+
+    Returns (prefix, header_row, layout_matched) where `prefix` holds every row
+    read so far; rows after `header_row` in it are data rows.
+    """
+    prefix: List[Sequence[Any]] = []
+    if layout is not None:
+        prefix = list(islice(rows, layout.header_row + 1))
+        if len(prefix) == layout.header_row + 1 and _header_hash(prefix[-1]) == layout.header_hash:
+            logger.info("Stored sheet layout matched; header row at index %d", layout.header_row)
+            return prefix, layout.header_row, True
+        logger.info("Stored sheet layout is stale for key '%s'; detecting header.", key_col_name)
+
+    # Only the leading window is buffered; the stream is not read past it
+    # when the header is missing.
+    if len(prefix) < max_header_rows:
+        prefix.extend(islice(rows, max_header_rows - len(prefix)))
+    header_row = _find_header_row(pd.DataFrame(prefix[:max_header_rows]), key_col_name, max_rows=max_header_rows)
     if header_row is None:
-        raise ValueError(f"Could not detect header row containing '{key_col_name}'.")
-
-    # Build DataFrame with detected header
-    header = df_raw.iloc[header_row].astype(str).str.strip()
-    df = df_raw.iloc[header_row + 1:].copy()
-    df.columns = header
-    # Drop fully empty rows
-    df = df.dropna(how='all')
-    logger.info("Excel read complete: %d rows, %d columns", len(df), len(df.columns))
-    return df
+        raise ValueError(
+            f"Could not detect header row containing '{key_col_name}' "
+            f"within the first {max_header_rows} rows."
+        )
+    return prefix, header_row, False
+
+
+def _resolve_columns(
+    header: Sequence[Any],
+    columns: Optional[Sequence[str]],
+    layout: Optional[SheetLayout],
+    layout_matched: bool,
+) -> Tuple[List[str], List[int]]:
+    """Pick projected names/positions, trusting the stored layout when it matched."""
+    if layout_matched and columns is not None and all(c in layout.columns for c in columns if c):
+        names = list(dict.fromkeys(c for c in columns if c))
+        return names, [layout.columns[c] for c in names]
+    return _project_header(header, columns)
+
+
+def _start_rows(
+    rows: Iterator[Sequence[Any]],
+    key_col_name: str,
+    columns: Optional[Sequence[str]],
+    max_header_rows: int,
+    layout: Optional[SheetLayout],
+) -> Tuple[Iterator[Sequence[Any]], List[str], List[int], SheetLayout]:
+    """Locate the header in an iterator of raw cell tuples.
+
+    Returns (data_rows, names, positions, layout) where `data_rows` continues
+    right after the header row.
+    """
+    prefix, header_row, matched = _locate_header(rows, key_col_name, max_header_rows, layout)
+    header = prefix[header_row]
+    names, positions = _resolve_columns(header, columns, layout, matched)
+    detected = SheetLayout(
+        header_row=header_row,
+        columns=dict(zip(names, positions)),
+        header_hash=_header_hash(header),
+    )
+    return chain(prefix[header_row + 1:], rows), names, positions, detected
+
+
+def _frames_from_rows(
+    rows: Iterator[Sequence[Any]],
+    names: List[str],
+    positions: List[int],
+    chunk_rows: Optional[int],
+) -> Iterator[pd.DataFrame]:
+    """Build projected frames of at most `chunk_rows` rows (one frame when None).
+
+    At least one frame is yielded, so an empty sheet still has its columns.
+    """
+    data = {name: [] for name in names}
+    buffered = 0
+    yielded = False
+    for row in rows:
+        values = [_cell_to_str(row[pos]) if pos < len(row) else _EMPTY for pos in positions]
+        # Drop fully empty rows
+        if all(v is _EMPTY for v in values):
+            continue
+        for name, value in zip(names, values):
+            data[name].append(value)
+        buffered += 1
+        if chunk_rows and buffered >= chunk_rows:
+            yield pd.DataFrame(data, columns=names, dtype=object)
+            data = {name: [] for name in names}
+            buffered = 0
+            yielded = True
+    if buffered or not yielded:
+        yield pd.DataFrame(data, columns=names, dtype=object)
+
+
+def _chunks_from_rows(
+    rows: Iterator[Sequence[Any]],
+    key_col_name: str,
+    columns: Optional[Sequence[str]],
+    max_header_rows: int,
+    layout: Optional[SheetLayout],
+    chunk_rows: Optional[int],
+) -> Tuple[Iterator[pd.DataFrame], SheetLayout]:
+    """Locate the header eagerly, then build projected frames lazily."""
+    data_rows, names, positions, detected = _start_rows(rows, key_col_name, columns, max_header_rows, layout)
+    return _frames_from_rows(data_rows, names, positions, chunk_rows), detected
+
+
+def _header_hash(header: Sequence[Any]) -> str:
+    """Fingerprint header cells (trimmed, trailing blanks ignored) as a hex digest."""
+    cells = ["" if v is None else str(v).strip() for v in header]
+    while cells and cells[-1] == "":
+        cells.pop()
+    return hashlib.sha1("\x1f".join(cells).encode("utf-8")).hexdigest()
+
+
+# Missing cell marker; a single shared object so emptiness checks can use `is`.
+_EMPTY = float("nan")
+# Strings read as missing: Excel error codes and pandas' default NA strings
+# ('NA', 'N/A', 'null', 'None', ...), which `pd.read_excel` also treats as missing.
+_MISSING_STRINGS = frozenset(ERROR_CODES) | frozenset(STR_NA_VALUES)
+
+
+@register_reader("xlsx")
+def _read_xlsx(buffer, key_col_name, *, columns, max_header_rows, layout, chunk_rows):
+    """Stream the first worksheet with openpyxl's read-only values iterator."""
+    rows = _iter_xlsx_rows(buffer)
+    try:
+        frames, detected = _chunks_from_rows(rows, key_col_name, columns, max_header_rows, layout, chunk_rows)
+    except BaseException:
+        rows.close()
+        raise
+    return _closing(frames, rows.close), detected
+
+
+def _closing(frames: Iterator[pd.DataFrame], close: Callable[[], None]) -> Iterator[pd.DataFrame]:
+    """Yield from `frames`, then call `close` (also when the consumer stops early)."""
+    try:
+        yield from frames
+    finally:
+        close()
+
+
+def _iter_xlsx_rows(buffer) -> Iterator[tuple]:
+    """Yield the raw cell values of the first worksheet, one tuple per row."""
+    workbook = load_workbook(buffer, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        # Some writers store wrong dimensions; read-only mode trusts them otherwise.
+        sheet.reset_dimensions()
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+@register_reader("xls")
+def _read_xls(buffer, key_col_name, *, columns, max_header_rows, layout, chunk_rows):
+    """Read the first sheet of a legacy BIFF workbook with xlrd."""
+    try:
+        import xlrd
+    except ImportError as exc:  # pragma: no cover - depends on environment
+        raise ValueError("Reading legacy .xls files requires the 'xlrd' package.") from exc
+
+    try:
+        book = xlrd.open_workbook(file_contents=buffer.read(), on_demand=True)
+    except xlrd.XLRDError as exc:
+        raise ValueError(f"Could not read .xls file: {exc}") from exc
+    try:
+        sheet = book.sheet_by_index(0)
+
+        def convert(cell):
+            if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+                return None
+            if cell.ctype == xlrd.XL_CELL_DATE:
+                return xlrd.xldate.xldate_as_datetime(cell.value, book.datemode)
+            if cell.ctype == xlrd.XL_CELL_BOOLEAN:
+                return bool(cell.value)
+            return cell.value
+
+        rows = (tuple(convert(c) for c in sheet.row(i)) for i in range(sheet.nrows))
+        frames, detected = _chunks_from_rows(rows, key_col_name, columns, max_header_rows, layout, chunk_rows)
+    except BaseException:
+        book.release_resources()
+        raise
+    return _closing(frames, book.release_resources), detected
+
+
+@register_reader("csv")
+def _read_delimited(buffer, key_col_name, *, columns, max_header_rows, layout, chunk_rows):
+    """Read CSV/TSV text: the header window goes through `csv`, the body through pandas' C parser."""
+    sample = buffer.read(_TEXT_SAMPLE_BYTES)
+    buffer.seek(0)
+    encoding = _sniff_encoding(sample)
+    text = io.TextIOWrapper(buffer, encoding=encoding, errors="replace", newline="")
+    try:
+        delimiter = _sniff_delimiter(sample.decode(encoding, errors="ignore"))
+        prefix, header_row, matched = _locate_header(
+            csv.reader(text, delimiter=delimiter), key_col_name, max_header_rows, layout
+        )
+    except BaseException:
+        # Do not let the wrapper close the caller's buffer.
+        text.detach()
+        raise
+    header = prefix[header_row]
+    names, positions = _resolve_columns(header, columns, layout, matched)
+    detected = SheetLayout(
+        header_row=header_row,
+        columns=dict(zip(names, positions)),
+        header_hash=_header_hash(header),
+    )
+    frames = _delimited_frames(text, delimiter, header, prefix[header_row + 1:], names, positions, chunk_rows)
+    return _closing(frames, text.detach), detected
+
+
+def _delimited_frames(text, delimiter, header, head_rows, names, positions, chunk_rows) -> Iterator[pd.DataFrame]:
+    """Yield the data rows of a delimited file, `chunk_rows` at a time (all at once when None)."""
+    # Rows already consumed while looking for the header.
+    head = pd.DataFrame(
+        [[row[pos] if pos < len(row) else None for pos in positions] for row in head_rows],
+        columns=names,
+        dtype=object,
+    ).replace("", np.nan)
+    # The C parser continues from where the csv reader stopped. Naming every
+    # column up to the widest needed one keeps ragged rows aligned.
+    width = max([len(header)] + [p + 1 for p in positions])
+    body = pd.read_csv(
+        text,
+        sep=delimiter,
+        header=None,
+        names=list(range(width)),
+        usecols=positions,
+        dtype=str,
+        keep_default_na=False,
+        na_values=[""],
+        engine="c",
+        chunksize=chunk_rows,
+    )
+
+    def project(part: pd.DataFrame) -> pd.DataFrame:
+        part = part[positions]
+        part.columns = names
+        return part.astype(object)
+
+    if not chunk_rows:
+        df = pd.concat([head, project(body)], ignore_index=True) if len(head) else project(body)
+        yield df.dropna(how="all").reset_index(drop=True)
+        return
+    parts = chain(
+        (head.iloc[start:start + chunk_rows] for start in range(0, len(head), chunk_rows)),
+        (project(part) for part in body),
+    )
+    yielded = False
+    for part in parts:
+        yielded = True
+        yield part.dropna(how="all").reset_index(drop=True)
+    if not yielded:
+        yield head
+
+
+_TEXT_SAMPLE_BYTES = 64 * 1024
+_CSV_DELIMITERS = ",;\t|"
+
+
+def _sniff_encoding(sample: bytes) -> str:
+    """Guess the text encoding: UTF-8 (with or without BOM), else Windows-1252."""
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # Incremental decoding tolerates a multi-byte character cut at the sample end.
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+
+def _sniff_delimiter(sample: str) -> str:
+    """Detect the field delimiter of a text sample, defaulting to a comma."""
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=_CSV_DELIMITERS).delimiter
+    except csv.Error:
+        counts = {d: sample.count(d) for d in _CSV_DELIMITERS}
+        best = max(counts, key=counts.get)
+        return best if counts[best] else ","
+
+
+def _cell_to_str(value: Any) -> Any:
+    """Render a cell the way `pd.read_excel(dtype=str)` does; missing cells become `_EMPTY`."""
+    if value is None or value == "":
+        return _EMPTY
+    if isinstance(value, str):
+        return _EMPTY if value in _MISSING_STRINGS else value
+    if isinstance(value, float):
+        if value != value:
+            return _EMPTY
+        if value.is_integer():
+            return str(int(value))
+    return str(value)
+
+
+def _project_header(header: Sequence[Any], columns: Optional[Sequence[str]]) -> Tuple[List[str], List[int]]:
+    """Map header cells to (names, positions), limited to `columns` when given.
+
+    Header names are trimmed; when a name repeats, the first occurrence wins.
+    """
+    names = [str(v).strip() if v is not None else "nan" for v in header]
+    if columns is None:
+        return names, list(range(len(names)))
+    wanted = []
+    for col in columns:
+        if col and col not in wanted:
+            wanted.append(col)
+    projected_names, positions = [], []
+    for col in wanted:
+        if col in names:
+            projected_names.append(col)
+            positions.append(names.index(col))
+    return projected_names, positions
+
+
+# Unseekable streams are copied to a temporary file kept in memory up to this size.
+_SPOOL_MAX_BYTES = 16 * 1024 * 1024
 
 
 def _coerce_excel_buffer(file_obj):
-    """Return a seekable file-like object suitable for `pd.read_excel`.
+    """Return a seekable file-like object suitable for the sheet readers, seeked to 0.
 
     Accepts bytes/bytearray/memoryview, Django file objects, UploadedFile,
-    or any file-like object. Ensures the returned buffer is seeked to 0.
+    or any file-like object. Seekable file objects (uploads, files opened
+    from storage) are returned as they are rather than copied, so a large
+    workbook is not held in memory again; only unseekable streams are copied,
+    to a temporary file that spills to disk past `_SPOOL_MAX_BYTES`.
     """
     if file_obj is None:
         raise ValueError("Excel file object is None")
 
     # Fast path for raw bytes.
     if isinstance(file_obj, (bytes, bytearray, memoryview)):
-        bio = BytesIO(bytes(file_obj))
-        bio.seek(0)
+        bio = BytesIO(file_obj)
         logger.info("Coerced Excel input from bytes (size=%d).", len(bio.getbuffer()))
         return bio
 
-    # If it's a file-like object that can be read, keep it unless it's not seekable.
-    if hasattr(file_obj, "read"):
-        # Try to rewind if possible
-        if hasattr(file_obj, "seek"):
-            try:
-                file_obj.seek(0)
-            except Exception:
-                # We'll fall back to buffering below
-                pass
-
-        # Some wrappers are technically seekable but behave oddly after network reads;
-        # buffering into memory makes behaviour deterministic.
+    if not hasattr(file_obj, "read"):
+        raise ValueError(f"Unsupported Excel input type: {type(file_obj)!r}")
+
+    try:
+        seekable = file_obj.seekable() if hasattr(file_obj, "seekable") else hasattr(file_obj, "seek")
+        if seekable:
+            file_obj.seek(0)
+            return file_obj
+    except Exception:
+        # Wrappers that claim to be seekable but fail are copied like streams.
+        pass
+
+    spool = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_BYTES)
+    try:
+        for chunk in iter(lambda: file_obj.read(_COUNT_CHUNK_BYTES), b""):
+            spool.write(chunk)
+    except Exception as exc:
+        spool.close()
+        logger.exception("Failed reading Excel stream: %s", exc)
+        raise
+    size = spool.tell()
+    spool.seek(0)
+    logger.info("Coerced Excel input from stream (size=%d).", size)
+    return spool
+
+
+def parse_stock_vocabulary(text: Optional[str]) -> Dict[str, float]:
+    """Parse 'TEXT=QUANTITY' lines into a mapping; blank lines are ignored.
+
+    The quantity may use a decimal comma. Raises ValueError on malformed lines.
+    """
+    vocabulary: Dict[str, float] = {}
+    for lineno, line in enumerate((text or '').splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        word, sep, level = line.rpartition('=')
+        word = word.strip()
+        if not sep or not word:
+            raise ValueError(f"Line {lineno}: expected TEXT=QUANTITY, got '{line}'.")
         try:
-            data = file_obj.read()
-        except Exception as exc:
-            logger.exception("Failed reading Excel stream into memory: %s", exc)
-            raise
-
-        if hasattr(file_obj, "seek"):
-            try:
-                file_obj.seek(0)
-            except Exception:
-                pass
-
-        bio = BytesIO(data)
-        bio.seek(0)
-        logger.info("Coerced Excel input from stream (size=%d).", len(data))
-        return bio
+            vocabulary[word] = float(level.strip().replace(',', '.'))
+        except ValueError:
+            raise ValueError(f"Line {lineno}: '{level.strip()}' is not a number.") from None
+    return vocabulary
+
+
+def compile_stock_vocabulary(
+    stock_in_text: Optional[str] = None,
+    stock_out_text: Optional[str] = None,
+    vocabulary: Optional[Mapping[str, float]] = None,
+) -> Dict[str, float]:
+    """Build the lookup table used to map text stock values to numbers.
+
+    Keys are trimmed and lowercased once here so cells only need the same
+    normalization. The dedicated in/out words take precedence over the
+    vocabulary, and the in-stock word wins if both are equal.
+    """
+    table: Dict[str, float] = {}
+    for word, level in (vocabulary or {}).items():
+        key = str(word).strip().lower()
+        if key:
+            table[key] = float(level)
+    if stock_out_text and str(stock_out_text).strip():
+        table[str(stock_out_text).strip().lower()] = 0.0
+    if stock_in_text and str(stock_in_text).strip():
+        table[str(stock_in_text).strip().lower()] = 1.0
+    return table
+
+
+# First numeric token of a price cell (avoids concatenating fragments like times).
+_PRICE_TOKEN_RE = r"(\d[\d.,]*\d|\d)"
+_PRICE_SAMPLE_SIZE = 1000
 
-    raise ValueError(f"Unsupported Excel input type: {type(file_obj)!r}")
+
+def _price_tokens(values: pd.Series) -> pd.Series:
+    """Extract the first numeric token of each non-empty cell; NaN where there is none."""
+    present = values.notna().to_numpy()
+    tokens = np.full(len(values), np.nan, dtype=object)
+    if present.any():
+        tokens[present] = values[present].astype(str).str.strip().str.extract(_PRICE_TOKEN_RE, expand=False).to_numpy()
+    return pd.Series(tokens, index=values.index, dtype=object)
+
+
+def _comma_is_decimal(tokens: pd.Series) -> pd.Series:
+    """Per-token reading: the rightmost separator is the decimal one."""
+    return tokens.str.rfind(',') > tokens.str.rfind('.')
+
+
+def _apply_decimal(tokens: pd.Series, decimal: str) -> pd.Series:
+    """Turn tokens into dot-decimal strings, dropping the other separator as thousands."""
+    if decimal == ',':
+        return tokens.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    return tokens.str.replace(',', '', regex=False)
+
+
+def infer_decimal_separator(values: pd.Series, sample_size: int = _PRICE_SAMPLE_SIZE) -> Optional[str]:
+    """Guess a supplier's decimal separator (',' or '.') from a sample of price cells.
+
+    Only tokens that contain a separator vote; returns None when none does.
+    """
+    sample = values.dropna().head(sample_size)
+    tokens = _price_tokens(sample).dropna()
+    tokens = tokens[tokens.str.contains('[.,]', regex=True)]
+    if tokens.empty:
+        return None
+    comma_votes = int(_comma_is_decimal(tokens).sum())
+    decimal = ',' if comma_votes * 2 >= len(tokens) else '.'
+    logger.info("Inferred price decimal separator '%s' from %d sampled prices.", decimal, len(tokens))
+    return decimal
+
+
+def parse_prices(values: pd.Series, decimal: Optional[str] = None) -> pd.Series:
+    """Parse price cells into floats rounded to two decimals.
+
+    Tokens are parsed in bulk with the supplier's `decimal` convention
+    (inferred when not given). Tokens whose own separators contradict the
+    convention (e.g. '12.5' in a comma-decimal file) fall back to the
+    per-token reading where the rightmost separator is the decimal one, so
+    results never depend on the convention.
+    """
+    tokens = _price_tokens(values)
+    found = tokens.notna().to_numpy()
+    cleaned = np.full(len(values), np.nan, dtype=object)
+    if found.any():
+        tokens = tokens[found]
+        if decimal is None:
+            decimal = infer_decimal_separator(values)
+        if decimal in (',', '.'):
+            other = '.' if decimal == ',' else ','
+            # Only tokens holding the other separator can disagree with the convention.
+            contrary = tokens.str.contains(other, regex=False).to_numpy()
+            if contrary.any():
+                contrary[contrary] = (_comma_is_decimal(tokens[contrary]) != (decimal == ',')).to_numpy()
+        else:
+            decimal, other = '.', ','
+            contrary = _comma_is_decimal(tokens).to_numpy()
+        parsed = _apply_decimal(tokens[~contrary], decimal).to_numpy()
+        fallback = _apply_decimal(tokens[contrary], other).to_numpy()
+        found_idx = np.flatnonzero(found)
+        cleaned[found_idx[~contrary]] = parsed
+        cleaned[found_idx[contrary]] = fallback
+    prices = pd.to_numeric(pd.Series(cleaned, index=values.index), errors='coerce')
+    # Currency normalization: keep two decimal places
+    return prices.round(2)
+
+
+# How duplicate rows of one product id combine their stock.
+STOCK_AGGREGATIONS = ('sum', 'max', 'first')
+
+
+def aggregate_duplicate_ids(frame: pd.DataFrame, stock_agg: str = 'sum') -> pd.DataFrame:
+    """Collapse rows sharing an 'id' into one row per id, sorted by id.
+
+    Stock is combined with `stock_agg` (one of STOCK_AGGREGATIONS); price
+    (or price cents), name and raw stock keep their last non-null value.
+    Only built-in reductions are used, so pandas runs every column through
+    its cythonized groupby path instead of calling back into Python per group.
+    """
+    if stock_agg not in STOCK_AGGREGATIONS:
+        raise ValueError(f"Unknown stock aggregation '{stock_agg}'; expected one of {STOCK_AGGREGATIONS}.")
+    agg = {'stock': stock_agg}
+    for col in ('price', 'price_cents', 'name', 'stock_raw'):
+        if col in frame.columns:
+            agg[col] = 'last'
+    return frame.groupby('id', as_index=False, sort=True).agg(agg)
+
+
+def _nonempty_counts(frame: pd.DataFrame) -> pd.Series:
+    """Count, per row, the cells that are not null and not blank after stripping."""
+    counts = np.zeros(len(frame), dtype=np.int64)
+    for i in range(frame.shape[1]):
+        col = frame.iloc[:, i]
+        filled = col.notna().to_numpy()
+        if not filled.any():
+            continue
+        nonblank = np.zeros(len(col), dtype=bool)
+        nonblank[filled] = col[filled].astype(str).str.strip().ne('').to_numpy()
+        counts += nonblank
+    return pd.Series(counts, index=frame.index)
 
 
 def normalize_columns(
@@ -106,11 +775,39 @@ def normalize_columns(
     name_col: Optional[str] = None,
     stock_in_text: Optional[str] = None,
     stock_out_text: Optional[str] = None,
+    price_decimal: Optional[str] = None,
+    stock_vocabulary: Optional[Mapping[str, float]] = None,
+    stock_agg: str = 'sum',
 ) -> pd.DataFrame:
     """
     Keep only relevant columns and normalize names to 'id', 'stock', 'price'.
     Coerce 'stock' and 'price' to numeric where possible.
+    `price_decimal` is the supplier's decimal separator (',' or '.') when
+    known; otherwise it is inferred from the price column.
+    Text stock values are mapped through `stock_vocabulary` plus the single
+    `stock_in_text` (1) / `stock_out_text` (0) words; see `compile_stock_vocabulary`.
+    Rows sharing an id are merged with `aggregate_duplicate_ids`.
     """
+    out = _normalize_rows(
+        df, product_id, stock_col, price_col, name_col,
+        stock_in_text, stock_out_text, price_decimal, stock_vocabulary,
+    )
+    return _reduce_normalized(out, stock_agg)
+
+
+def _normalize_rows(
+    df: pd.DataFrame,
+    product_id: str,
+    stock_col: str,
+    price_col: Optional[str],
+    name_col: Optional[str] = None,
+    stock_in_text: Optional[str] = None,
+    stock_out_text: Optional[str] = None,
+    price_decimal: Optional[str] = None,
+    stock_vocabulary: Optional[Mapping[str, float]] = None,
+) -> pd.DataFrame:
+    """The row-local part of `normalize_columns`: every row is handled on its own,
+    so row chunks can be processed separately (see `normalize_columns_parallel`)."""
     cols = [product_id, stock_col]
     if price_col:
         cols.append(price_col)
@@ -122,12 +819,7 @@ def normalize_columns(
 
     out = df[cols].copy()
     # Remove section/separator rows: rows that have only a single non-empty value across relevant columns
-    def _is_nonempty(v: Any) -> bool:
-        if pd.isna(v):
-            return False
-        s = str(v).strip()
-        return s != ''
-    nonempty_counts = out.apply(lambda r: sum(_is_nonempty(r[c]) for c in out.columns), axis=1)
+    nonempty_counts = _nonempty_counts(out)
     removed_sep = int((nonempty_counts <= 1).sum())
     if removed_sep:
         logger.info("Filtering %d separator-like rows (single non-empty cell).", removed_sep)
@@ -151,174 +843,421 @@ def normalize_columns(
     # Preserve raw stock for display in text-based suppliers
     out['stock_raw'] = stock_series.apply(lambda v: v.strip() if isinstance(v, str) else v)
     numeric_stock = pd.to_numeric(stock_series, errors='coerce')
-    out['stock'] = numeric_stock
+    # Overflowing numbers (e.g. "1e400") are not a usable stock; read them as text.
+    out['stock'] = numeric_stock.where(np.isfinite(numeric_stock.astype('float64')))
 
-    # Prepare text mapping for non-numeric entries
-    if stock_in_text or stock_out_text:
-        def map_text_stock(val: Any) -> Optional[float]:
-            if pd.isna(val):
-                return None
-            s = str(val).strip().lower()
-            if stock_in_text and s == str(stock_in_text).strip().lower():
-                return 1.0
-            if stock_out_text and s == str(stock_out_text).strip().lower():
-                return 0.0
-            return None
-
-        # Fill where numeric is NaN using text mapping
-        mask_nan = out['stock'].isna()
-        mapped = stock_series[mask_nan].map(map_text_stock)
-        out.loc[mask_nan & mapped.notna(), 'stock'] = mapped[mapped.notna()]
+    # Map non-numeric entries through the supplier's compiled text vocabulary
+    table = compile_stock_vocabulary(stock_in_text, stock_out_text, stock_vocabulary)
+    if table:
+        mask_text = (out['stock'].isna() & stock_series.notna()).to_numpy()
+        if mask_text.any():
+            keys = stock_series[mask_text].astype(str).str.strip().str.lower()
+            stock_values = out['stock'].to_numpy(copy=True)
+            stock_values[mask_text] = keys.map(table).to_numpy(dtype=float)
+            out['stock'] = stock_values
 
     # Default missing stock to 0
     out['stock'] = out['stock'].fillna(0)
 
-    # Deduplicate IDs: aggregate stock and keep last price if present
-    if out['id'].duplicated().any():
-        logger.info("Duplicate product IDs detected; aggregating by id.")
-        agg = {'stock': 'sum'}
-        if 'price' in out.columns:
-            agg['price'] = 'last'
-        if 'name' in out.columns:
-            agg['name'] = lambda s: s.dropna().iloc[-1] if s.dropna().shape[0] else pd.NA
-        if 'stock_raw' in out.columns:
-            agg['stock_raw'] = lambda s: s.dropna().iloc[-1] if s.dropna().shape[0] else pd.NA
-        out = out.groupby('id', as_index=False).agg(agg)
     if 'price' in out.columns:
-        def _clean_price(val: Any) -> Optional[str]:
-            if pd.isna(val):
-                return None
-            s = str(val).strip()
-            if not s:
-                return None
-            # Extract the first numeric token (avoid concatenating multiple numeric fragments like times)
-            m = re.search(r"\d[\d.,]*\d|\d", s)
-            if not m:
-                return None
-            token = m.group(0)
-            # Decide decimal separator using the rightmost separator within the token
-            has_comma = ',' in token
-            has_dot = '.' in token
-            if has_comma and has_dot:
-                last_comma = token.rfind(',')
-                last_dot = token.rfind('.')
-                if last_comma > last_dot:
-                    # Comma is decimal: drop dots (thousands), use dot as decimal
-                    cleaned = token.replace('.', '').replace(',', '.')
-                else:
-                    # Dot is decimal: drop commas (thousands)
-                    cleaned = token.replace(',', '')
-            elif has_comma and not has_dot:
-                # Only comma present: treat as decimal
-                cleaned = token.replace(',', '.')
-            else:
-                # Only dots or only digits
-                cleaned = token
-            return cleaned
-
-        out['price'] = out['price'].map(_clean_price)
-        out['price'] = pd.to_numeric(out['price'], errors='coerce')
-        # Currency normalization: keep two decimal places
-        out['price'] = out['price'].round(2)
+        out['price'] = parse_prices(out['price'], decimal=price_decimal)
+
+    return out
+
+
+def _reduce_normalized(out: pd.DataFrame, stock_agg: str = 'sum') -> pd.DataFrame:
+    """The final pass of `normalize_columns` over all normalized rows."""
+    # Deduplicate IDs: aggregate stock and keep the last non-null price/name/raw stock
+    if out['id'].duplicated().any():
+        logger.info("Duplicate product IDs detected; aggregating by id (stock: %s).", stock_agg)
+        out = aggregate_duplicate_ids(out, stock_agg=stock_agg)
 
     # Drop rows with empty id
     out = out[out['id'] != '']
+    return compact_frame(out)
+
+
+# Rows per chunk when `normalize_columns_parallel` splits a sheet.
+DEFAULT_NORMALIZE_CHUNK_ROWS = 100_000
+# Passed to the chunks when the sheet's sample reveals no separator, so they
+# read each price token on its own instead of sampling again per chunk.
+_NO_DECIMAL = ''
+
+
+def _sample_prices(df: pd.DataFrame, columns: Sequence[str], price_col: str, chunk_rows: int) -> pd.Series:
+    """The first price cells of non-separator rows, as `parse_prices` samples them."""
+    sample: List[pd.Series] = []
+    found = 0
+    for start in range(0, len(df), chunk_rows):
+        part = df[list(columns)].iloc[start:start + chunk_rows]
+        prices = part.loc[(_nonempty_counts(part) > 1).to_numpy(), price_col].dropna()
+        sample.append(prices.head(_PRICE_SAMPLE_SIZE - found))
+        found += len(sample[-1])
+        if found >= _PRICE_SAMPLE_SIZE:
+            break
+    return pd.concat(sample) if sample else pd.Series(dtype=object)
+
+
+def normalize_columns_parallel(
+    df: pd.DataFrame,
+    product_id: str,
+    stock_col: str,
+    price_col: Optional[str],
+    name_col: Optional[str] = None,
+    stock_in_text: Optional[str] = None,
+    stock_out_text: Optional[str] = None,
+    price_decimal: Optional[str] = None,
+    stock_vocabulary: Optional[Mapping[str, float]] = None,
+    stock_agg: str = 'sum',
+    workers: int = 1,
+    chunk_rows: int = DEFAULT_NORMALIZE_CHUNK_ROWS,
+) -> pd.DataFrame:
+    """`normalize_columns` over row chunks processed by `workers` processes.
+
+    Each chunk of `chunk_rows` rows is stripped, filtered, mapped and parsed
+    in a worker; duplicate ids are then aggregated across chunks in one final
+    pass, so the result is identical to `normalize_columns`. The price
+    decimal separator is inferred once for the whole sheet. Sheets that fit
+    in a single chunk, or a single worker, use the serial path.
+    """
+    if workers <= 1 or len(df) <= chunk_rows:
+        return normalize_columns(
+            df, product_id, stock_col, price_col, name_col, stock_in_text, stock_out_text,
+            price_decimal, stock_vocabulary, stock_agg,
+        )
+    cols = [c for c in (product_id, stock_col, price_col, name_col) if c]
+    missing = [c for c in cols if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing expected columns in Excel: {missing}")
+    if price_col and price_decimal is None:
+        price_decimal = infer_decimal_separator(_sample_prices(df, cols, price_col, chunk_rows)) or _NO_DECIMAL
+
+    chunks = [df[cols].iloc[start:start + chunk_rows] for start in range(0, len(df), chunk_rows)]
+    normalize_chunk = partial(
+        _normalize_rows,
+        product_id=product_id,
+        stock_col=stock_col,
+        price_col=price_col,
+        name_col=name_col,
+        stock_in_text=stock_in_text,
+        stock_out_text=stock_out_text,
+        price_decimal=price_decimal,
+        stock_vocabulary=stock_vocabulary,
+    )
+    workers = min(workers, len(chunks))
+    logger.info("Normalizing %d rows in %d chunks with %d workers", len(df), len(chunks), workers)
+    # Spawned workers only import this module; they never touch Django or the database.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        parts = list(pool.map(normalize_chunk, chunks))
+    # Chunks of separator rows only come back empty; leave them out of the concatenation.
+    return _reduce_normalized(pd.concat([part for part in parts if len(part)] or parts[:1]), stock_agg)
+
+
+# Storage dtypes of normalized frames (see `compact_frame`).
+STRING_DTYPE = pd.StringDtype("pyarrow")
+PRICE_CENTS_DTYPE = "Int64"
+# Per-row content fingerprint stored with every normalized frame.
+ROW_HASH_COLUMN = 'row_hash'
+_FINGERPRINT_COLUMNS = ('id', 'stock', 'price_cents', 'name')
+
+
+def compact_frame(out: pd.DataFrame) -> pd.DataFrame:
+    """Convert a normalized frame to its compact schema.
+
+    - 'id' and 'name' become Arrow-backed strings,
+    - 'stock_raw' (few distinct texts) becomes categorical,
+    - 'stock' becomes int32/int64 when every value is integral,
+    - 'price' is replaced by 'price_cents', a nullable integer,
+    - a uint64 'row_hash' fingerprint is added (see `row_fingerprints`).
+
+    Prices are already rounded to two decimals, so cents are exact and
+    comparisons no longer depend on float equality.
+    """
+    out = out.reset_index(drop=True)
+    out['id'] = out['id'].astype(STRING_DTYPE)
+    if 'name' in out.columns:
+        out['name'] = out['name'].astype(STRING_DTYPE)
+    if 'stock_raw' in out.columns:
+        out['stock_raw'] = out['stock_raw'].astype('category')
+    out['stock'] = _compact_stock(out['stock'])
+    if 'price' in out.columns:
+        cents = (out['price'] * 100).round().astype(PRICE_CENTS_DTYPE)
+        out.insert(out.columns.get_loc('price'), 'price_cents', cents)
+        out = out.drop(columns=['price'])
+    out[ROW_HASH_COLUMN] = row_fingerprints(out)
     return out
 
 
-def compare_stock(old_df: Optional[pd.DataFrame], new_df: pd.DataFrame) -> Dict[str, Any]:
+def row_fingerprints(frame: pd.DataFrame) -> pd.Series:
+    """Return a 64-bit content hash per row over id, stock, price and name.
+
+    Stock is hashed as float64 so frames whose stock was compacted to
+    different integer widths still produce equal fingerprints.
+    """
+    columns = [c for c in _FINGERPRINT_COLUMNS if c in frame.columns]
+    values = frame[columns].astype({'stock': 'float64'})
+    return pd.util.hash_pandas_object(values, index=False)
+
+
+def _compact_stock(stock: pd.Series) -> pd.Series:
+    """Return stock as the narrowest signed integer that fits, or float64 if fractional.
+
+    Infinite values become NaN (and the column float64) rather than being
+    cast to meaningless integers; so do integers beyond the int64 range.
+    """
+    values = stock.to_numpy(dtype='float64', copy=True)
+    values[~np.isfinite(values)] = np.nan
+    if len(values) and not np.array_equal(values, np.round(values)):
+        return pd.Series(values, index=stock.index)
+    info = np.iinfo(np.int32)
+    fits = not len(values) or (values.min() >= info.min and values.max() <= info.max)
+    if not fits and len(values) and not (-2.0 ** 63 <= values.min() and values.max() < 2.0 ** 63):
+        return pd.Series(values, index=stock.index)
+    return pd.Series(values.astype(np.int32 if fits else np.int64), index=stock.index)
+
+
+def restore_compact_dtypes(frame: pd.DataFrame) -> pd.DataFrame:
+    """Re-apply the Arrow string backing of 'id'/'name' after a Parquet round trip."""
+    for column in ('id', 'name'):
+        if column in frame.columns:
+            frame[column] = frame[column].astype(STRING_DTYPE)
+    return frame
+
+
+def cents_to_price(cents: pd.Series) -> pd.Series:
+    """Turn a 'price_cents' column back into float currency units (NaN when missing)."""
+    return pd.Series(cents.to_numpy(dtype='float64', na_value=np.nan) / 100, index=cents.index)
+
+
+def display_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Return `df` as shown to users: a float 'price' instead of 'price_cents'
+    and without the internal 'row_hash' column."""
+    df = df.drop(columns=[ROW_HASH_COLUMN], errors='ignore')
+    if 'price_cents' not in df.columns:
+        return df
+    df = df.copy()
+    df.insert(df.columns.get_loc('price_cents'), 'price', cents_to_price(df['price_cents']))
+    return df.drop(columns=['price_cents'])
+
+
+def drop_unchanged_rows(old_df: pd.DataFrame, new_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Drop rows whose fingerprint appears on both sides.
+
+    The fingerprint covers the id, so a shared hash means the same product
+    with the same stock, price and name; such rows cannot show up in any
+    comparison section. Row order of what remains is preserved.
+    """
+    old_hashes = old_df[ROW_HASH_COLUMN]
+    new_hashes = new_df[ROW_HASH_COLUMN]
+    changed_old = ~old_hashes.isin(new_hashes).to_numpy()
+    changed_new = ~new_hashes.isin(old_hashes).to_numpy()
+    logger.info(
+        "Fingerprint pre-filter: %d of %d new rows unchanged",
+        len(new_df) - int(changed_new.sum()),
+        len(new_df),
+    )
+    return old_df[changed_old], new_df[changed_new]
+
+
+def align_ids(old_df: pd.DataFrame, new_df: pd.DataFrame) -> pd.DataFrame:
+    """Outer-join the 'id' columns of two frames, hashing the IDs once.
+
+    Returns one row per distinct ID with '_old'/'_new' row positions (-1 when
+    absent) and an '_origin' indicator ('left_only', 'right_only' or 'both').
     """
-    Compare two normalized DataFrames with columns: 'id', 'stock', optional 'price'.
-    Returns a dict of DataFrames:
+    aligned = pd.merge(
+        pd.DataFrame({'id': old_df['id'].reset_index(drop=True), '_old': np.arange(len(old_df))}),
+        pd.DataFrame({'id': new_df['id'].reset_index(drop=True), '_new': np.arange(len(new_df))}),
+        on='id',
+        how='outer',
+        indicator='_origin',
+    )
+    for column in ('_old', '_new'):
+        aligned[column] = aligned[column].fillna(-1).astype(np.intp)
+    aligned['_origin'] = aligned['_origin'].astype(str)
+    return aligned
+
+
+def _take(df: pd.DataFrame, column: str, positions: np.ndarray) -> pd.Series:
+    """Gather `column` at row `positions`, keeping its dtype, on a fresh RangeIndex."""
+    if column not in df.columns:
+        return pd.Series(pd.NA, index=range(len(positions)), dtype=object)
+    return df[column].take(positions).reset_index(drop=True)
+
+
+@dataclass(frozen=True)
+class DiffRules:
+    """Filters on which matched-row changes `compare_stock` reports.
+
+    - `min_price_change_pct`: report a price change only when it moves at
+      least this percentage of the old price (any change from 0 counts).
+    - `min_stock_change`: ignore stock changes smaller than this many units.
+    - `stock_transitions_only`: report only stock changes between in stock
+      (> 0) and out of stock (<= 0).
+
+    In/out transitions are always reported, whatever `min_stock_change` is.
+    New, removed and out-of-stock rows are never filtered.
+    """
+
+    min_price_change_pct: Optional[float] = None
+    min_stock_change: Optional[float] = None
+    stock_transitions_only: bool = False
+
+    def stock_mask(self, old_stock: np.ndarray, new_stock: np.ndarray) -> np.ndarray:
+        """Which aligned stock pairs (already known to differ) are worth reporting."""
+        transition = (old_stock > 0) != (new_stock > 0)
+        if self.stock_transitions_only:
+            return transition
+        if self.min_stock_change:
+            return transition | (np.abs(new_stock - old_stock) >= self.min_stock_change)
+        return np.ones(len(old_stock), dtype=bool)
+
+    def price_mask(self, old_cents: np.ndarray, new_cents: np.ndarray) -> np.ndarray:
+        """Which aligned price pairs (in cents, NaN when missing) are worth reporting."""
+        if not self.min_price_change_pct:
+            return np.ones(len(old_cents), dtype=bool)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative = np.abs(new_cents - old_cents) * 100 / np.abs(old_cents)
+        # Moves from a zero price have an infinite relative change and are kept.
+        return relative >= self.min_price_change_pct
+
+
+def _with_price_cents(df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+    """Return `df` in the compact schema if it still carries a float 'price' column.
+
+    Frames written before prices became cents (old snapshots, callers that
+    skip `compact_frame`) would otherwise look as if they had no prices.
+    """
+    if df is None or 'price' not in df.columns or 'price_cents' in df.columns:
+        return df
+    logger.info("Converting a frame with a legacy 'price' column to 'price_cents'.")
+    return compact_frame(df)
+
+
+def compare_stock(
+    old_df: Optional[pd.DataFrame],
+    new_df: pd.DataFrame,
+    rules: Optional[DiffRules] = None,
+    backend=None,
+) -> ComparisonResult:
+    """
+    Compare two normalized DataFrames with columns: 'id', 'stock', optional 'price_cents'.
+    Prices are compared as integer cents and reported in currency units
+    ('price', 'old_price', 'new_price').
+    `rules` narrows the reported stock and price changes (see `DiffRules`);
+    they are applied as masks in the same pass that classifies matched rows.
+    When both frames carry a 'row_hash', rows with identical fingerprints are
+    dropped first, so only changed rows are aligned. IDs are aligned with a
+    single outer merge (see `align_ids`); every matched row is then classified
+    with vectorized masks over the aligned columns.
+    `backend` (see `services.backends`) may supply its own
+    `drop_unchanged_rows` and `align_ids`; the pandas versions are the default.
+    Frames with a legacy float 'price' column are converted with `compact_frame`.
+    Returns a `ComparisonResult`, a mapping of section name to DataFrame:
       - removed_or_out_of_stock
       - new_products
       - stock_changes
       - price_changes
     """
+    old_df, new_df = _with_price_cents(old_df), _with_price_cents(new_df)
     if old_df is None or old_df.empty:
         logger.info("No previous file; treating all rows as new products.")
-        return {
+        return ComparisonResult({
             'removed_or_out_of_stock': pd.DataFrame(columns=['id', 'old_stock', 'new_stock']),
-            'new_products': new_df.copy(),
+            'new_products': display_frame(new_df.copy()),
             'stock_changes': pd.DataFrame(columns=['id', 'old_stock', 'new_stock']),
             'price_changes': pd.DataFrame(columns=['id', 'old_price', 'new_price']),
-        }
-
-    # Index by id for easy comparison
-    old_idx = old_df.set_index('id')
-    new_idx = new_df.set_index('id')
-
-    # Removed: present before but missing now
-    missing_now = old_idx[~old_idx.index.isin(new_idx.index)].copy()
-    missing_now['old_stock'] = missing_now['stock']
-    missing_now['new_stock'] = pd.NA
-    if 'name' in old_idx.columns:
-        missing_now = missing_now.rename(columns={'name': 'name'})
-
-    # Became out of stock: new_stock <= 0 and previously had stock > 0
-    cols_to_join = ['stock']
-    if 'name' in new_idx.columns:
-        cols_to_join.append('name')
-    joined = new_idx[cols_to_join].join(old_idx[['stock']], how='left', rsuffix='_old')
-    joined = joined.rename(columns={'stock': 'new_stock', 'stock_old': 'old_stock'})
-    out_of_stock = joined[(joined['new_stock'] <= 0) & (joined['old_stock'] > 0)].reset_index()
-    keep_cols = ['id', 'old_stock', 'new_stock'] + (['name'] if 'name' in joined.columns else [])
-    out_of_stock = out_of_stock[keep_cols]
-
-    # Build a consistent set of columns for concatenation
-    base_cols = ['id', 'old_stock', 'new_stock']
-    if 'name' in missing_now.columns or ('name' in out_of_stock.columns):
-        base_cols.append('name')
-    left = missing_now.reset_index()
-    if 'name' not in left.columns and 'name' in base_cols:
-        left['name'] = pd.NA
-    right = out_of_stock.copy()
-    if 'name' not in right.columns and 'name' in base_cols:
-        right['name'] = pd.NA
-    removed_or_out = pd.concat([
-        left[base_cols],
-        right[base_cols]
-    ], ignore_index=True)
+        })
+
+    if ROW_HASH_COLUMN in old_df.columns and ROW_HASH_COLUMN in new_df.columns:
+        old_df, new_df = (backend.drop_unchanged_rows if backend else drop_unchanged_rows)(old_df, new_df)
+
+    aligned = (backend.align_ids if backend else align_ids)(old_df, new_df)
+    origin = aligned['_origin'].to_numpy()
+    removed_pos = np.sort(aligned['_old'].to_numpy()[origin == 'left_only'])
+    added_pos = np.sort(aligned['_new'].to_numpy()[origin == 'right_only'])
+    in_both = origin == 'both'
+    old_pos = aligned['_old'].to_numpy()[in_both]
+    new_pos = aligned['_new'].to_numpy()[in_both]
+    order = np.argsort(old_pos, kind='stable')
+    old_pos, new_pos = old_pos[order], new_pos[order]
+
+    # Classify every matched pair in one pass over aligned arrays
+    old_stock = old_df['stock'].to_numpy()[old_pos]
+    new_stock = new_df['stock'].to_numpy()[new_pos]
+    stock_changed = old_stock != new_stock
+    went_out = (new_stock <= 0) & (old_stock > 0)
+    if rules is not None:
+        stock_changed &= rules.stock_mask(old_stock, new_stock)
+    has_prices = 'price_cents' in old_df.columns and 'price_cents' in new_df.columns
+    if has_prices:
+        old_cents = old_df['price_cents'].to_numpy(dtype='float64', na_value=np.nan)[old_pos]
+        new_cents = new_df['price_cents'].to_numpy(dtype='float64', na_value=np.nan)[new_pos]
+        # Only rows where both old and new prices are known can change price
+        price_changed = ~np.isnan(old_cents) & ~np.isnan(new_cents) & (old_cents != new_cents)
+        if rules is not None:
+            price_changed &= rules.price_mask(old_cents, new_cents)
+
+    with_name = 'name' in old_df.columns or 'name' in new_df.columns
+
+    # Removed: present before but missing now (old row order)
+    removed = pd.DataFrame({
+        'id': _take(old_df, 'id', removed_pos),
+        'old_stock': _take(old_df, 'stock', removed_pos),
+        'new_stock': pd.Series(pd.NA, index=range(len(removed_pos)), dtype=object),
+    })
+    if with_name:
+        removed['name'] = _take(old_df, 'name', removed_pos)
+
+    # Became out of stock: new_stock <= 0 and previously had stock > 0 (new row order)
+    out_order = np.argsort(new_pos[went_out], kind='stable')
+    out_old, out_new = old_pos[went_out][out_order], new_pos[went_out][out_order]
+    out_of_stock = pd.DataFrame({
+        'id': _take(new_df, 'id', out_new),
+        'old_stock': _take(old_df, 'stock', out_old),
+        'new_stock': _take(new_df, 'stock', out_new),
+    })
+    if with_name:
+        out_of_stock['name'] = _take(new_df, 'name', out_new)
+    removed_or_out = pd.concat([removed, out_of_stock], ignore_index=True)
 
     # New products: in new but not in old
-    new_products = new_idx[~new_idx.index.isin(old_idx.index)].reset_index()
+    new_products = display_frame(new_df.iloc[added_pos].reset_index(drop=True))
 
     # Stock changes: id in both and stock changed
-    common_ids = old_idx.index.intersection(new_idx.index)
-    stock_compare = pd.DataFrame({
-        'old_stock': old_idx.loc[common_ids, 'stock'],
-        'new_stock': new_idx.loc[common_ids, 'stock'],
-    }, index=common_ids)
-    if 'stock_raw' in old_idx.columns:
-        stock_compare['old_stock_raw'] = old_idx.loc[common_ids, 'stock_raw']
-    if 'stock_raw' in new_idx.columns:
-        stock_compare['new_stock_raw'] = new_idx.loc[common_ids, 'stock_raw']
-    if 'name' in new_idx.columns:
-        stock_compare = stock_compare.join(new_idx[['name']], how='left')
-    stock_compare = stock_compare.reset_index()
-    stock_changes = stock_compare[stock_compare['old_stock'] != stock_compare['new_stock']]
+    changed_old, changed_new = old_pos[stock_changed], new_pos[stock_changed]
+    stock_changes = pd.DataFrame({
+        'id': _take(old_df, 'id', changed_old),
+        'old_stock': _take(old_df, 'stock', changed_old),
+        'new_stock': _take(new_df, 'stock', changed_new),
+    })
+    if 'stock_raw' in old_df.columns:
+        stock_changes['old_stock_raw'] = _take(old_df, 'stock_raw', changed_old)
+    if 'stock_raw' in new_df.columns:
+        stock_changes['new_stock_raw'] = _take(new_df, 'stock_raw', changed_new)
+    if 'name' in new_df.columns:
+        stock_changes['name'] = _take(new_df, 'name', changed_new)
 
     # Price changes: if both have price
-    if 'price' in old_idx.columns and 'price' in new_idx.columns:
-        price_compare = pd.DataFrame({
-            'old_price': old_idx.loc[common_ids, 'price'],
-            'new_price': new_idx.loc[common_ids, 'price'],
-        }, index=common_ids)
-        if 'name' in new_idx.columns:
-            price_compare = price_compare.join(new_idx[['name']], how='left')
-        price_compare = price_compare.reset_index()
-        # Only consider rows where both old and new prices are numeric (not NaN)
-        price_compare = price_compare.dropna(subset=['old_price', 'new_price'])
-        price_changes = price_compare[price_compare['old_price'] != price_compare['new_price']]
+    if has_prices:
+        changed_old, changed_new = old_pos[price_changed], new_pos[price_changed]
+        price_changes = pd.DataFrame({
+            'id': _take(old_df, 'id', changed_old),
+            'old_price': old_cents[price_changed] / 100,
+            'new_price': new_cents[price_changed] / 100,
+        })
+        if 'name' in new_df.columns:
+            price_changes['name'] = _take(new_df, 'name', changed_new)
     else:
         price_changes = pd.DataFrame(columns=['id', 'old_price', 'new_price'])
 
-    result = {
+    result = ComparisonResult({
         'removed_or_out_of_stock': removed_or_out,
         'new_products': new_products,
         'stock_changes': stock_changes,
         'price_changes': price_changes,
-    }
+    })
     logger.info(
         "Comparison summary: removed/out=%d, new=%d, stock_changes=%d, price_changes=%d",
         len(result['removed_or_out_of_stock']),
@@ -0,0 +1,344 @@
+"""Out-of-core comparison for supplier catalogs that do not fit in memory.
+
+Normalized chunks of each side are sorted by id and spilled to Parquet files
+("runs"). The runs are then merged with a streaming merge-join that buffers a
+bounded number of rows, so memory use does not grow with the catalog size.
+Each merged id range is compared with `compare_stock`, which emits the usual
+four result sections incrementally; those are spilled to Parquet as well and
+read back lazily, so the result never has to fit in memory either.
+"""
+import functools
+import logging
+import os
+import shutil
+import tempfile
+import weakref
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .comparison_result import COMPARISON_SECTIONS, ComparisonResult
+from .excel_compare import (
+    ROW_HASH_COLUMN,
+    STRING_DTYPE,
+    DiffRules,
+    aggregate_duplicate_ids,
+    compare_stock,
+    restore_compact_dtypes,
+    row_fingerprints,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# Rows buffered across all runs while merging, and rows per compared block.
+DEFAULT_MERGE_BUFFER_ROWS = 200_000
+# Smallest batch read from one run, so merges of many runs still make progress.
+_MIN_BATCH_ROWS = 1024
+# Parquet row group size of a run; batches are decoded one row group at a time.
+_RUN_ROW_GROUP_ROWS = 4096
+
+def _write_run(chunk: pd.DataFrame, directory: str, prefix: str, index: int) -> str:
+    path = os.path.join(directory, f"{prefix}-{index:05d}.parquet")
+    table = pa.Table.from_pandas(chunk.sort_values('id', kind='stable'), preserve_index=False)
+    pq.write_table(table, path, row_group_size=_RUN_ROW_GROUP_ROWS)
+    return path
+
+
+def spill_sorted_runs(chunks: Iterable[pd.DataFrame], directory: str, prefix: str) -> List[str]:
+    """Sort each normalized chunk by id and write it to its own Parquet run.
+
+    Returns the run paths in chunk order. Empty chunks are skipped, except
+    that when every chunk is empty one empty run keeps the columns, so the
+    result sections get the same columns as `compare_stock` would give them.
+    """
+    paths: List[str] = []
+    empty: Optional[pd.DataFrame] = None
+    for chunk in chunks:
+        if chunk.empty:
+            if empty is None:
+                empty = chunk
+            continue
+        paths.append(_write_run(chunk, directory, prefix, len(paths)))
+    if not paths and empty is not None:
+        paths.append(_write_run(empty, directory, prefix, 0))
+    logger.info("Spilled %d sorted '%s' runs to %s", len(paths), prefix, directory)
+    return paths
+
+
+class _RunReader:
+    """Sequential reader over one sorted run, holding at most one batch."""
+
+    def __init__(self, path: str, batch_rows: int):
+        self._file = pq.ParquetFile(path)
+        self._batches = self._file.iter_batches(batch_size=batch_rows)
+        self.frame: Optional[pd.DataFrame] = None
+        self.ids: Optional[np.ndarray] = None
+
+    def fill(self) -> bool:
+        """Load the next batch if the buffer is empty; False once the run is exhausted."""
+        while self.ids is None or not len(self.ids):
+            batch = next(self._batches, None)
+            if batch is None:
+                return False
+            self.frame = restore_compact_dtypes(batch.to_pandas())
+            self.ids = self.frame['id'].to_numpy(dtype=object)
+        return True
+
+    def take_through(self, last_id: str) -> pd.DataFrame:
+        """Remove and return the buffered rows whose id is <= `last_id`."""
+        stop = int(np.searchsorted(self.ids, last_id, side='right'))
+        taken = self.frame.iloc[:stop]
+        self.frame, self.ids = self.frame.iloc[stop:], self.ids[stop:]
+        return taken
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _empty_frame(paths: List[str]) -> pd.DataFrame:
+    """An empty normalized frame with the schema of the first run in `paths`."""
+    if paths:
+        return restore_compact_dtypes(pq.read_schema(paths[0]).empty_table().to_pandas())
+    return pd.DataFrame({'id': pd.Series(dtype=STRING_DTYPE), 'stock': pd.Series(dtype='int32')})
+
+
+def _combine(pieces: List[pd.DataFrame], empty: pd.DataFrame, stock_agg: str) -> pd.DataFrame:
+    """Join the pieces of one id range into a frame with unique ids, sorted by id.
+
+    Pieces come in run order (file order), so ids repeated across runs are
+    combined exactly as `normalize_columns` combines them within one frame.
+    """
+    if not pieces:
+        return empty
+    frame = pd.concat(pieces, ignore_index=True) if len(pieces) > 1 else pieces[0].reset_index(drop=True)
+    if not frame['id'].duplicated().any():
+        return frame.sort_values('id', kind='stable', ignore_index=True)
+    combined = aggregate_duplicate_ids(frame, stock_agg=stock_agg)
+    if ROW_HASH_COLUMN in frame.columns:
+        combined[ROW_HASH_COLUMN] = row_fingerprints(combined)
+    return combined
+
+
+def iter_merged_blocks(
+    old_runs: List[str],
+    new_runs: List[str],
+    stock_agg: str = 'sum',
+    buffer_rows: int = DEFAULT_MERGE_BUFFER_ROWS,
+) -> Iterator[Tuple[pd.DataFrame, pd.DataFrame]]:
+    """Merge-join sorted runs into (old, new) frame pairs in ascending id order.
+
+    Each pair holds every row of a contiguous id range for both sides, so it
+    can be compared on its own. At most `buffer_rows` rows are buffered from
+    the runs plus about as many in the block being assembled.
+    """
+    batch_rows = max(_MIN_BATCH_ROWS, buffer_rows // max(1, len(old_runs) + len(new_runs)))
+    empty = {
+        'old': _empty_frame(old_runs or new_runs),
+        'new': _empty_frame(new_runs or old_runs),
+    }
+    readers = [('old', _RunReader(path, batch_rows)) for path in old_runs]
+    readers += [('new', _RunReader(path, batch_rows)) for path in new_runs]
+    pending: Dict[str, List[pd.DataFrame]] = {'old': [], 'new': []}
+    pending_rows = 0
+    try:
+        while True:
+            live = [(side, reader) for side, reader in readers if reader.fill()]
+            if not live:
+                break
+            # Ids are unique within a run and runs are sorted, so once the rows up
+            # to the smallest buffered maximum are taken, that id range is complete.
+            watermark = min(reader.ids[-1] for _, reader in live)
+            for side, reader in live:
+                piece = reader.take_through(watermark)
+                if len(piece):
+                    pending[side].append(piece)
+                    pending_rows += len(piece)
+            if pending_rows >= buffer_rows:
+                yield _combine(pending['old'], empty['old'], stock_agg), _combine(pending['new'], empty['new'], stock_agg)
+                pending = {'old': [], 'new': []}
+                pending_rows = 0
+        if pending_rows:
+            yield _combine(pending['old'], empty['old'], stock_agg), _combine(pending['new'], empty['new'], stock_agg)
+    finally:
+        for _, reader in readers:
+            reader.close()
+
+
+def iter_compare_runs(
+    old_runs: Optional[List[str]],
+    new_runs: List[str],
+    stock_agg: str = 'sum',
+    buffer_rows: int = DEFAULT_MERGE_BUFFER_ROWS,
+    rules: Optional[DiffRules] = None,
+    backend=None,
+) -> Iterator[ComparisonResult]:
+    """Yield `compare_stock` results block by block, in ascending id order.
+
+    `old_runs` is None (or empty) when there is no previous file.
+    """
+    for old_block, new_block in iter_merged_blocks(old_runs or [], new_runs, stock_agg, buffer_rows):
+        yield compare_stock(old_block if old_runs else None, new_block, rules, backend=backend)
+
+
+def _load_parts(paths: List[str], schema: pa.Schema, template: pd.DataFrame, owner=None) -> pd.DataFrame:
+    """Read spilled section parts as one frame, each part cast to `schema`.
+
+    `template` is returned when there are no parts. `owner`, the result the
+    parts belong to, is only held so its spill directory stays in place.
+    """
+    if not paths:
+        return template.copy()
+    table = pa.concat_tables([pq.read_table(path).cast(schema) for path in paths])
+    return restore_compact_dtypes(table.to_pandas())
+
+
+def _decode_dictionaries(schema: pa.Schema) -> pa.Schema:
+    """`schema` with dictionary (categorical) columns replaced by their value type."""
+    for index, field in enumerate(schema):
+        if pa.types.is_dictionary(field.type):
+            schema = schema.set(index, field.with_type(field.type.value_type))
+    return schema
+
+
+class SpilledComparison(ComparisonResult):
+    """A comparison whose sections are Parquet parts in a spill directory.
+
+    Part `i` of every section comes from the `i`-th compared block, so the
+    parts of one section are already in id order and `blocks()` yields the
+    result one id range at a time. A section is only read when asked for,
+    and the directory is removed once the result is garbage collected.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        parts: Dict[str, List[Optional[str]]],
+        counts: Dict[str, int],
+        templates: Dict[str, pd.DataFrame],
+    ):
+        self._directory = directory
+        self._parts = parts
+        self._templates = templates
+        self._schemas = {section: self._unified_schema(section) for section in COMPARISON_SECTIONS}
+        super().__init__({section: self._loader(section) for section in COMPARISON_SECTIONS}, counts=counts)
+        self._cleanup = weakref.finalize(self, shutil.rmtree, directory, True)
+
+    def _unified_schema(self, section: str) -> pa.Schema:
+        # Blocks may differ in column types (e.g. int8 and int32 stock, or a
+        # float column where one block had missing values); widen to fit all.
+        schemas = [pa.Schema.from_pandas(self._templates[section], preserve_index=False)]
+        schemas += [pq.read_schema(path) for path in self._parts[section] if path]
+        try:
+            return pa.unify_schemas(schemas, promote_options='permissive')
+        except pa.ArrowTypeError:
+            # A categorical column in one block can be plain text in another.
+            return pa.unify_schemas([_decode_dictionaries(schema) for schema in schemas], promote_options='permissive')
+
+    def _loader(self, section: str, index: Optional[int] = None):
+        # A loader of the whole section must not reference `self`, or the
+        # result would only be freed (and its directory removed) by the cycle
+        # collector; a block's loader keeps its parent so the parts outlive it.
+        parts = self._parts[section] if index is None else self._parts[section][index:index + 1]
+        paths = [path for path in parts if path]
+        owner = self if index is not None else None
+        return functools.partial(_load_parts, paths, self._schemas[section], self._templates[section], owner)
+
+    def blocks(self) -> Iterator[ComparisonResult]:
+        for index in range(len(self._parts[COMPARISON_SECTIONS[0]])):
+            yield ComparisonResult(
+                {section: self._loader(section, index) for section in COMPARISON_SECTIONS},
+                counts={section: self._block_count(section, index) for section in COMPARISON_SECTIONS},
+            )
+
+    def _block_count(self, section: str, index: int) -> int:
+        path = self._parts[section][index]
+        return pq.ParquetFile(path).metadata.num_rows if path else 0
+
+    def write_section(self, section: str, where, metadata: Optional[Mapping[bytes, bytes]] = None) -> None:
+        """Stream `section` into one Parquet file at `where`, a part at a time."""
+        schema = self._schemas[section].with_metadata({**(self._schemas[section].metadata or {}), **(metadata or {})})
+        with pq.ParquetWriter(where, schema) as writer:
+            for path in self._parts[section]:
+                if path:
+                    writer.write_table(pq.read_table(path).cast(schema))
+            if not any(self._parts[section]):
+                writer.write_table(schema.empty_table())
+
+
+class _SectionSpill:
+    """Writes each compared block's sections to their own Parquet parts."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.parts: Dict[str, List[Optional[str]]] = {section: [] for section in COMPARISON_SECTIONS}
+        self.counts: Dict[str, int] = {section: 0 for section in COMPARISON_SECTIONS}
+        self.templates: Dict[str, pd.DataFrame] = {}
+
+    def add(self, part: Mapping[str, pd.DataFrame]) -> None:
+        for section in COMPARISON_SECTIONS:
+            frame = part[section]
+            self.templates.setdefault(section, frame.iloc[:0].copy())
+            if not len(frame):
+                self.parts[section].append(None)
+                continue
+            path = os.path.join(self.directory, f"{section}-{len(self.parts[section]):05d}.parquet")
+            pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), path)
+            self.parts[section].append(path)
+            self.counts[section] += len(frame)
+
+    def finish(self, empty: Optional[Mapping[str, pd.DataFrame]] = None) -> SpilledComparison:
+        """The spilled result; `empty` supplies the section columns when no block was compared."""
+        templates = self.templates or {section: empty[section].iloc[:0] for section in COMPARISON_SECTIONS}
+        result = SpilledComparison(self.directory, self.parts, self.counts, templates)
+        logger.info(
+            "Out-of-core comparison summary: removed/out=%d, new=%d, stock_changes=%d, price_changes=%d",
+            self.counts['removed_or_out_of_stock'],
+            self.counts['new_products'],
+            self.counts['stock_changes'],
+            self.counts['price_changes'],
+        )
+        return result
+
+
+def compare_stock_out_of_core(
+    old_chunks: Optional[Iterable[pd.DataFrame]],
+    new_chunks: Iterable[pd.DataFrame],
+    stock_agg: str = 'sum',
+    buffer_rows: int = DEFAULT_MERGE_BUFFER_ROWS,
+    spill_dir: Optional[str] = None,
+    rules: Optional[DiffRules] = None,
+    backend=None,
+) -> SpilledComparison:
+    """
+    Compare two streams of normalized chunks without holding either side in memory.
+
+    Chunks are spilled as sorted runs to a temporary directory (under
+    `spill_dir` when given) that is removed once they are merged. Ids repeated
+    across chunks are combined with `stock_agg`, as `normalize_columns` does.
+    `rules` filters reported changes and `backend` aligns each block, as in `compare_stock`.
+    Each block's sections are written straight to Parquet next to the runs,
+    so the returned result is lazy: it has the same sections and columns as
+    `compare_stock` and reads them back on demand. Blocks follow each other
+    in id order; within a block rows are ordered as `compare_stock` orders them.
+    """
+    directory = tempfile.mkdtemp(prefix='stacktracker-compare-', dir=spill_dir)
+    try:
+        spill = _SectionSpill(directory)
+        with tempfile.TemporaryDirectory(prefix='runs-', dir=directory) as runs_dir:
+            old_runs = spill_sorted_runs(old_chunks, runs_dir, 'old') if old_chunks is not None else None
+            new_runs = spill_sorted_runs(new_chunks, runs_dir, 'new')
+            for part in iter_compare_runs(old_runs, new_runs, stock_agg=stock_agg, buffer_rows=buffer_rows, rules=rules, backend=backend):
+                spill.add(part)
+            empty = None
+            if not spill.templates:
+                empty_old = _empty_frame(old_runs) if old_runs else None
+                empty = compare_stock(empty_old, _empty_frame(new_runs), rules, backend=backend)
+        return spill.finish(empty)
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
@@ -0,0 +1,275 @@
+"""Versioned history of a supplier's normalized uploads.
+
+Every upload is stored as a new version. Most versions keep only a delta
+against the previous one: rows that are new or changed, plus the rows that
+disappeared (flagged as deleted). Every few versions a full checkpoint is
+written so reconstructing a version replays a short chain. Old versions are
+compacted away by turning the oldest kept version into a checkpoint.
+
+Versions are rebuilt from these files alone, so any two can be compared
+without the original spreadsheets.
+"""
+import logging
+from io import BytesIO
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+
+from .backends import get_backend
+from .comparison_result import ComparisonResult
+from .excel_compare import ROW_HASH_COLUMN, restore_compact_dtypes, row_fingerprints
+from .ingestion import diff_rules
+
+
+logger = logging.getLogger(__name__)
+
+
+# A full checkpoint is written at least every this many versions.
+DEFAULT_CHECKPOINT_EVERY = 10
+# Versions kept per supplier; older ones are compacted away (0 keeps all).
+DEFAULT_MAX_VERSIONS = 90
+DELETED_COLUMN = "_deleted"
+HISTORY_KIND_METADATA = b"stacktracker.history_kind"
+# Times a save retries when overlapping saves take the version number it picked.
+_RESERVE_ATTEMPTS = 5
+
+
+class VersionUnavailableError(Exception):
+	"""A requested version does not exist or its files cannot be read."""
+
+
+def version_path(supplier, number: int) -> str:
+	"""Storage name of one stored version (checkpoint or delta)."""
+	return f"user_{supplier.owner_id}/supplier_{supplier.id}/history/v{number:06d}.parquet"
+
+
+def _with_fingerprints(frame: pd.DataFrame) -> pd.DataFrame:
+	if ROW_HASH_COLUMN in frame.columns:
+		return frame
+	return frame.assign(**{ROW_HASH_COLUMN: row_fingerprints(frame).to_numpy()})
+
+
+def _same_schema(previous: pd.DataFrame, current: pd.DataFrame) -> bool:
+	"""Whether rows of both frames can live in one delta file."""
+	if list(previous.columns) != list(current.columns):
+		return False
+	return all(str(previous[c].dtype) == str(current[c].dtype) for c in current.columns)
+
+
+def _concat(frames) -> pd.DataFrame:
+	"""Concatenate frames with the same columns, skipping empty ones so dtypes are kept."""
+	parts = [frame for frame in frames if len(frame)]
+	if not parts:
+		return frames[0].iloc[:0].reset_index(drop=True)
+	return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0].reset_index(drop=True)
+
+
+def encode_delta(previous: pd.DataFrame, current: pd.DataFrame) -> pd.DataFrame:
+	"""Rows of `current` that are new or changed since `previous`, plus deleted rows.
+
+	Rows of `previous` whose id is gone are kept with their old values and
+	`_deleted` set, so the delta has the same columns and dtypes as the frames.
+	Both frames must carry row fingerprints and unique ids.
+	"""
+	positions = pd.Index(previous['id']).get_indexer(current['id'])
+	previous_hash = previous[ROW_HASH_COLUMN].to_numpy()
+	current_hash = current[ROW_HASH_COLUMN].to_numpy()
+	known = positions >= 0
+	changed = ~known
+	changed[known] = previous_hash[positions[known]] != current_hash[known]
+	gone = ~previous['id'].isin(current['id']).to_numpy()
+	delta = _concat([
+		current[changed].assign(**{DELETED_COLUMN: False}),
+		previous[gone].assign(**{DELETED_COLUMN: True}),
+	])
+	return delta.sort_values('id', kind='stable', ignore_index=True)
+
+
+def apply_delta(base: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+	"""Rebuild the next version from `base` and the delta encoded against it."""
+	kept = base[~base['id'].isin(delta['id'])]
+	upserts = delta[~delta[DELETED_COLUMN].to_numpy(dtype=bool)].drop(columns=DELETED_COLUMN)
+	frame = _concat([kept, upserts]).sort_values('id', kind='stable', ignore_index=True)
+	for column, dtype in base.dtypes.items():
+		# Concatenating categoricals with different categories falls back to object.
+		if isinstance(dtype, pd.CategoricalDtype) and column in frame.columns:
+			frame[column] = frame[column].astype('category')
+	return frame
+
+
+def _version_bytes(frame: pd.DataFrame, kind: str) -> bytes:
+	table = pa.Table.from_pandas(frame, preserve_index=False)
+	metadata = dict(table.schema.metadata or {})
+	metadata[HISTORY_KIND_METADATA] = kind.encode("utf-8")
+	buffer = BytesIO()
+	pq.write_table(table.replace_schema_metadata(metadata), buffer)
+	return buffer.getvalue()
+
+
+def _write_version(supplier, number: int, frame: pd.DataFrame, kind: str) -> None:
+	if kind == "checkpoint":
+		frame = frame.assign(**{DELETED_COLUMN: False}).sort_values('id', kind='stable', ignore_index=True)
+	name = version_path(supplier, number)
+	storage = supplier.current_file.storage
+	storage.delete(name)
+	storage.save(name, ContentFile(_version_bytes(frame, kind)))
+
+
+def _read_version(supplier, number: int):
+	"""Return (kind, frame) of a stored version file."""
+	try:
+		with supplier.current_file.storage.open(version_path(supplier, number), "rb") as fh:
+			table = pq.read_table(fh)
+	except Exception as exc:
+		raise VersionUnavailableError(f"Version {number} could not be read: {exc}") from exc
+	kind = (table.schema.metadata or {}).get(HISTORY_KIND_METADATA, b"").decode("utf-8")
+	return kind, restore_compact_dtypes(table.to_pandas())
+
+
+def load_version(supplier, number: int) -> pd.DataFrame:
+	"""Rebuild the normalized frame of version `number`, ordered by id.
+
+	Replays the deltas after the closest checkpoint. Raises
+	VersionUnavailableError when the version or a file in its chain is missing.
+	"""
+	if not supplier.versions.filter(number=number).exists():
+		raise VersionUnavailableError(f"Supplier {supplier.id} has no version {number}.")
+	checkpoint = supplier.versions.filter(is_checkpoint=True, number__lte=number).order_by('-number').first()
+	if checkpoint is None:
+		raise VersionUnavailableError(f"No checkpoint precedes version {number}.")
+	frame = None
+	for current in range(checkpoint.number, number + 1):
+		kind, stored = _read_version(supplier, current)
+		if kind == "checkpoint" or frame is None:
+			frame = stored.drop(columns=DELETED_COLUMN)
+		else:
+			frame = apply_delta(frame, stored)
+	return frame
+
+
+def _encode_against_latest(supplier, latest, number: int, frame: pd.DataFrame) -> Optional[pd.DataFrame]:
+	"""Delta of `frame` against version `latest`, or None when a checkpoint should be written."""
+	if latest is None:
+		return None
+	every = getattr(settings, "STOCK_HISTORY_CHECKPOINT_EVERY", DEFAULT_CHECKPOINT_EVERY)
+	last_checkpoint = supplier.versions.filter(is_checkpoint=True).order_by('-number').first()
+	if last_checkpoint is None or number - last_checkpoint.number >= every:
+		return None
+	try:
+		previous = _with_fingerprints(load_version(supplier, latest.number))
+	except VersionUnavailableError as exc:
+		# Also the case while a concurrent save is still writing `latest`.
+		logger.warning("Writing a checkpoint for supplier %s: %s", supplier.name, exc)
+		return None
+	if not _same_schema(previous, frame):
+		return None
+	delta = encode_delta(previous, frame)
+	return None if len(delta) > len(frame) // 2 else delta
+
+
+def record_version(supplier, frame: pd.DataFrame, file_name: Optional[str] = None):
+	"""Append `frame` (a normalized upload) to the supplier's history (best-effort).
+
+	A delta is stored when the previous version can be rebuilt with the same
+	schema, otherwise (and every `STOCK_HISTORY_CHECKPOINT_EVERY` versions,
+	or when most rows changed) a full checkpoint. Old versions are then
+	compacted. Returns the new SupplierVersion, or None on failure.
+
+	The version row is created before its file is written, so the unique
+	(supplier, number) constraint hands overlapping saves distinct numbers
+	and no save overwrites the file of a version another one committed.
+	"""
+	try:
+		frame = _with_fingerprints(frame)
+		for _attempt in range(_RESERVE_ATTEMPTS):
+			latest = supplier.versions.order_by('-number').first()
+			number = latest.number + 1 if latest else 1
+			delta = _encode_against_latest(supplier, latest, number, frame)
+			stored = frame if delta is None else delta
+			try:
+				with transaction.atomic():
+					version = supplier.versions.create(
+						number=number,
+						is_checkpoint=delta is None,
+						file_name=file_name,
+						file_digest=supplier.current_file_digest,
+						row_count=len(frame),
+						stored_rows=len(stored),
+					)
+				break
+			except IntegrityError:
+				# Another save took this number; build against the new latest version.
+				continue
+		else:
+			raise RuntimeError(f"could not reserve a version number after {_RESERVE_ATTEMPTS} attempts")
+		try:
+			_write_version(supplier, number, stored, "checkpoint" if delta is None else "delta")
+		except BaseException:
+			version.delete()
+			raise
+		logger.info(
+			"Recorded version %d for supplier %s (%s, %d of %d rows stored)",
+			number, supplier.name, "checkpoint" if delta is None else "delta", len(stored), len(frame),
+		)
+	except Exception as exc:
+		logger.warning("Failed to record version for supplier %s: %s", supplier.name, exc)
+		return None
+	compact_history(supplier)
+	return version
+
+
+def compact_history(supplier, max_versions: Optional[int] = None) -> int:
+	"""Drop versions beyond the newest `max_versions`, returning how many were removed.
+
+	The oldest kept version becomes a checkpoint first, so every kept
+	version can still be rebuilt. Errors are logged and nothing is removed.
+	"""
+	if max_versions is None:
+		max_versions = getattr(settings, "STOCK_HISTORY_MAX_VERSIONS", DEFAULT_MAX_VERSIONS)
+	if not max_versions:
+		return 0
+	numbers = list(supplier.versions.order_by('-number').values_list('number', flat=True))
+	if len(numbers) <= max_versions:
+		return 0
+	oldest_kept = numbers[max_versions - 1]
+	try:
+		version = supplier.versions.get(number=oldest_kept)
+		if not version.is_checkpoint:
+			frame = load_version(supplier, oldest_kept)
+			_write_version(supplier, oldest_kept, frame, "checkpoint")
+			version.is_checkpoint = True
+			version.stored_rows = len(frame)
+			version.save(update_fields=['is_checkpoint', 'stored_rows'])
+	except Exception as exc:
+		logger.warning("Failed to compact history for supplier %s: %s", supplier.name, exc)
+		return 0
+	dropped = numbers[max_versions:]
+	for number in dropped:
+		try:
+			supplier.current_file.storage.delete(version_path(supplier, number))
+		except Exception as exc:
+			logger.warning("Failed to delete version %d of supplier %s: %s", number, supplier.name, exc)
+	supplier.versions.filter(number__lt=oldest_kept).delete()
+	logger.info("Compacted history of supplier %s: dropped %d versions", supplier.name, len(dropped))
+	return len(dropped)
+
+
+def compare_versions(supplier, old_number: int, new_number: int) -> ComparisonResult:
+	"""Compare two stored versions with the supplier's current diff rules."""
+	old_df = load_version(supplier, old_number)
+	new_df = load_version(supplier, new_number)
+	return get_backend().compare_stock(old_df, new_df, diff_rules(supplier))
+
+
+def delete_history(supplier) -> None:
+	"""Remove every stored version file of the supplier, ignoring storage errors."""
+	for number in supplier.versions.values_list('number', flat=True):
+		try:
+			supplier.current_file.storage.delete(version_path(supplier, number))
+		except Exception as exc:
+			logger.warning("Failed to delete version %d of supplier %s: %s", number, supplier.name, exc)
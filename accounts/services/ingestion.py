@@ -0,0 +1,186 @@
+import copy
+import logging
+from typing import Iterator, List, Mapping, Optional
+
+import pandas as pd
+from django.conf import settings
+
+from .backends import get_backend
+from .comparison_result import ComparisonResult
+from .excel_compare import (
+	DEFAULT_CHUNK_ROWS,
+	DEFAULT_HEADER_SCAN_ROWS,
+	DiffRules,
+	SheetLayout,
+	estimate_row_count,
+	infer_decimal_separator,
+	parse_stock_vocabulary,
+	read_sheet_chunks,
+	read_sheet_with_layout,
+)
+from .external_compare import compare_stock_out_of_core
+from .snapshots import iter_snapshot_chunks
+
+
+logger = logging.getLogger(__name__)
+
+
+# Sheets with more rows than this are compared out of core (see `exceeds_in_memory_rows`).
+DEFAULT_OUT_OF_CORE_ROWS = 500_000
+
+
+def supplier_columns(supplier) -> List[str]:
+	"""Return the sheet columns configured for `supplier`, key column first."""
+	columns = [supplier.product_id_column, supplier.stock_column]
+	if supplier.price_column:
+		columns.append(supplier.price_column)
+	if supplier.product_name_column:
+		columns.append(supplier.product_name_column)
+	return columns
+
+
+def diff_rules(supplier) -> DiffRules:
+	"""Return the change filters configured for `supplier` (see `DiffRules`)."""
+	pct = supplier.min_price_change_pct
+	return DiffRules(
+		min_price_change_pct=float(pct) if pct is not None else None,
+		min_stock_change=supplier.min_stock_change,
+		stock_transitions_only=supplier.stock_transitions_only,
+	)
+
+
+def stored_layout(supplier) -> Optional[SheetLayout]:
+	"""Return the sheet layout fingerprint stored on `supplier`, if complete."""
+	if supplier.layout_header_row is None or not supplier.layout_header_hash or not supplier.layout_columns:
+		return None
+	return SheetLayout(
+		header_row=supplier.layout_header_row,
+		columns=dict(supplier.layout_columns),
+		header_hash=supplier.layout_header_hash,
+	)
+
+
+def remember_layout(supplier, layout: SheetLayout) -> None:
+	"""Copy `layout` onto the supplier instance; the caller decides when to save."""
+	supplier.layout_header_row = layout.header_row
+	supplier.layout_columns = dict(layout.columns)
+	supplier.layout_header_hash = layout.header_hash
+
+
+def _learn_price_decimal(supplier, df_raw: pd.DataFrame) -> None:
+	"""Infer the supplier's price decimal separator from `df_raw` when still unknown."""
+	if supplier.price_column and not supplier.price_decimal_separator and supplier.price_column in df_raw.columns:
+		supplier.price_decimal_separator = infer_decimal_separator(df_raw[supplier.price_column])
+
+
+def _normalize_for_supplier(supplier, df_raw: pd.DataFrame, vocabulary: Mapping[str, float]) -> pd.DataFrame:
+	"""Run the backend's `normalize_columns` with the supplier's column and stock settings."""
+	return get_backend().normalize_columns(
+		df_raw,
+		product_id=supplier.product_id_column,
+		stock_col=supplier.stock_column,
+		price_col=supplier.price_column,
+		name_col=supplier.product_name_column,
+		stock_in_text=supplier.stock_in_text,
+		stock_out_text=supplier.stock_out_text,
+		price_decimal=supplier.price_decimal_separator,
+		stock_vocabulary=vocabulary,
+		stock_agg=supplier.stock_aggregation,
+	)
+
+
+def load_supplier_frame(supplier, file_obj) -> pd.DataFrame:
+	"""Read a supplier file and normalize it using the supplier's column config.
+
+	Only the configured columns are materialized while reading the sheet. The
+	supplier's stored layout fingerprint and price decimal separator are
+	reused; the layout found in this file and a newly inferred separator are
+	copied back onto the instance (not saved).
+	Raises ValueError when the header or an expected column cannot be found.
+	"""
+	df_raw, layout = read_sheet_with_layout(
+		file_obj,
+		supplier.product_id_column,
+		columns=supplier_columns(supplier),
+		max_header_rows=getattr(settings, "STOCK_HEADER_SCAN_ROWS", DEFAULT_HEADER_SCAN_ROWS),
+		layout=stored_layout(supplier),
+	)
+	remember_layout(supplier, layout)
+	_learn_price_decimal(supplier, df_raw)
+	return _normalize_for_supplier(supplier, df_raw, parse_stock_vocabulary(supplier.stock_vocabulary))
+
+
+def iter_supplier_chunks(supplier, file_obj, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+	"""Chunked counterpart of `load_supplier_frame` for sheets too large to load at once.
+
+	Returns an iterator of normalized frames built from at most `chunk_rows`
+	sheet rows each. An id may appear in several chunks;
+	`compare_stock_out_of_core` combines them. Layout and decimal separator
+	are learned as in `load_supplier_frame`, the separator from the first
+	chunk whose prices reveal it.
+	The header is located and the configured columns checked before this
+	returns, so a bad file raises ValueError before any chunk is consumed.
+	"""
+	columns = supplier_columns(supplier)
+	frames, layout = read_sheet_chunks(
+		file_obj,
+		supplier.product_id_column,
+		columns=columns,
+		chunk_rows=chunk_rows,
+		max_header_rows=getattr(settings, "STOCK_HEADER_SCAN_ROWS", DEFAULT_HEADER_SCAN_ROWS),
+		layout=stored_layout(supplier),
+	)
+	missing = [column for column in columns if column not in layout.columns]
+	if missing:
+		raise ValueError(f"Missing expected columns in Excel: {missing}")
+	remember_layout(supplier, layout)
+	vocabulary = parse_stock_vocabulary(supplier.stock_vocabulary)
+
+	def normalized() -> Iterator[pd.DataFrame]:
+		for df_raw in frames:
+			_learn_price_decimal(supplier, df_raw)
+			yield _normalize_for_supplier(supplier, df_raw, vocabulary)
+
+	return normalized()
+
+
+def exceeds_in_memory_rows(file_obj) -> bool:
+	"""Whether `file_obj` has more rows than `settings.STOCK_OUT_OF_CORE_ROWS`.
+
+	A threshold of 0 disables out-of-core comparison. Files whose rows cannot
+	be counted are left to the in-memory path, which reports read errors.
+	"""
+	threshold = getattr(settings, "STOCK_OUT_OF_CORE_ROWS", DEFAULT_OUT_OF_CORE_ROWS)
+	if not threshold:
+		return False
+	try:
+		rows = estimate_row_count(file_obj)
+	except Exception as exc:
+		logger.warning("Could not count rows of uploaded file: %s", exc)
+		return False
+	if rows > threshold:
+		logger.info("Upload has %d rows (threshold %d); comparing out of core.", rows, threshold)
+		return True
+	return False
+
+
+def compare_supplier_out_of_core(supplier, file_obj) -> ComparisonResult:
+	"""Compare `file_obj` with the supplier's stored file without loading either at once.
+
+	The previous side is streamed from the parsed snapshot when it is fresh,
+	otherwise from the stored file read in chunks. The upload's header is
+	checked first, so a bad upload is rejected before the previous side is spilled.
+	"""
+	chunk_rows = getattr(settings, "STOCK_CHUNK_ROWS", DEFAULT_CHUNK_ROWS)
+	new_chunks = iter_supplier_chunks(supplier, file_obj, chunk_rows)
+	options = {"stock_agg": supplier.stock_aggregation, "rules": diff_rules(supplier), "backend": get_backend()}
+	if not supplier.current_file or not supplier.current_file.name:
+		return compare_stock_out_of_core(None, new_chunks, **options)
+	old_chunks = iter_snapshot_chunks(supplier, chunk_rows)
+	if old_chunks is not None:
+		logger.info("Streaming previous snapshot for supplier %s", supplier.name)
+		return compare_stock_out_of_core(old_chunks, new_chunks, **options)
+	with supplier.current_file.open("rb") as previous_file:
+		# A copy reads the previous file: only the layout the upload learned is saved.
+		old_chunks = iter_supplier_chunks(copy.copy(supplier), previous_file, chunk_rows)
+		return compare_stock_out_of_core(old_chunks, new_chunks, **options)
@@ -0,0 +1,253 @@
+"""Database-backed queue of uploads processed outside the web request.
+
+When `settings.STOCK_UPLOAD_JOBS_EAGER` is on (the default) the upload view
+runs the job itself on the uploaded file (`run_upload`). Otherwise it
+stages the file in storage and enqueues an UploadJob, and
+`manage.py process_upload_jobs` workers claim queued jobs with
+`SELECT ... FOR UPDATE SKIP LOCKED`, so any number of workers on any number
+of nodes can share the queue without a broker. A job runs the same steps
+the view used to run inline (compare, save the file, store the comparison
+and its Excel) and records its progress in `stage` for status polling.
+"""
+import logging
+import os
+import socket
+import uuid
+from datetime import timedelta
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .uploads import (
+	PreviousFileError,
+	compare_upload,
+	comparison_payload,
+	load_comparison,
+	queue_last_comparison,
+	save_comparison,
+	save_upload,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds a running job may go without finishing before it is considered abandoned.
+DEFAULT_UPLOAD_JOB_TIMEOUT = 1800
+# Times an abandoned job is handed to another worker before it is failed.
+MAX_JOB_ATTEMPTS = 3
+
+STAGE_QUEUED = 'queued'
+STAGE_COMPARING = 'comparing'
+STAGE_SAVING = 'saving'
+STAGE_STORING = 'storing comparison'
+STAGE_DONE = 'done'
+
+PREVIOUS_FILE_ERROR = (
+	'No se pudo leer el archivo anterior para comparar. Intenta volver a subir el archivo. '
+	'Si el problema persiste, revisa que el archivo sea un .xlsx válido.'
+)
+SAVE_ERROR = 'Failed to save uploaded file.'
+STORE_ERROR = 'The file was saved, but the comparison could not be stored.'
+ABANDONED_ERROR = 'The upload could not be processed. Please upload the file again.'
+
+
+def job_file_path(supplier, token: str) -> str:
+	"""Storage name of an upload staged for a job."""
+	return f"user_{supplier.owner_id}/supplier_{supplier.id}/jobs/{token}"
+
+
+def worker_name() -> str:
+	"""Identify this worker process in claimed jobs."""
+	return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_upload(supplier, upload_file, original_name: str):
+	"""Stage `upload_file` in storage and queue a job to process it.
+
+	The extension of `original_name` is kept so the file is read with the
+	right reader. Storage errors propagate.
+	"""
+	_stem, ext = os.path.splitext(original_name)
+	name = supplier.current_file.storage.save(job_file_path(supplier, f"{uuid.uuid4().hex}{ext.lower()}"), upload_file)
+	job = supplier.upload_jobs.create(
+		file_name=name,
+		original_name=original_name,
+		old_file_name=supplier.last_uploaded_filename,
+		stage=STAGE_QUEUED,
+	)
+	logger.info('Queued upload job %s for supplier %s (%s)', job.pk, supplier.name, original_name)
+	return job
+
+
+def claim_next_job(worker: str = ''):
+	"""Mark the oldest queued job as running and return it, or None if the queue is empty.
+
+	Rows locked by another worker's claim are skipped rather than waited for.
+	"""
+	# Imported here like in batch.py: services stay importable before `django.setup()`.
+	from ..models import UploadJob
+
+	with transaction.atomic():
+		job = (
+			UploadJob.objects.select_for_update(skip_locked=True)
+			.filter(status='queued')
+			.order_by('created_at')
+			.first()
+		)
+		if job is None:
+			return None
+		job.status = 'running'
+		job.worker = worker
+		job.attempts += 1
+		job.started_at = timezone.now()
+		job.save(update_fields=['status', 'worker', 'attempts', 'started_at'])
+	return job
+
+
+def _set_stage(job, stage: str) -> None:
+	job.stage = stage
+	job.save(update_fields=['stage'])
+
+
+def _finish(job, status: str, error: str = '') -> None:
+	job.status = status
+	job.error = error
+	job.finished_at = timezone.now()
+	job.save(update_fields=['status', 'error', 'stage', 'comparison_key', 'counts', 'finished_at'])
+
+
+def _process(job, upload, get_service: Optional[Callable[[], Any]] = None) -> None:
+	"""Compare `upload`, save it and store the comparison, recording the outcome on `job`."""
+	supplier = job.supplier
+	_set_stage(job, STAGE_COMPARING)
+	try:
+		result = compare_upload(supplier, upload)
+	except PreviousFileError:
+		return _finish(job, 'failed', PREVIOUS_FILE_ERROR)
+	except Exception as exc:
+		logger.exception('Error reading uploaded Excel for job %s: %s', job.pk, exc)
+		return _finish(job, 'failed', f'Error reading Excel file: {exc}')
+
+	_set_stage(job, STAGE_SAVING)
+	try:
+		save_upload(supplier, upload, job.original_name, result)
+	except Exception as exc:
+		logger.exception('Failed to save uploaded file for job %s: %s', job.pk, exc)
+		return _finish(job, 'failed', SAVE_ERROR)
+
+	_set_stage(job, STAGE_STORING)
+	try:
+		job.comparison_key = save_comparison(supplier, result.comparison)
+	except Exception as exc:
+		logger.exception('Failed to store comparison for supplier %s: %s', supplier.name, exc)
+		return _finish(job, 'failed', STORE_ERROR)
+	job.counts = result.comparison.counts()
+	# The job is done once the comparison is stored; the Excel copy is written behind it.
+	queue_last_comparison(supplier, job.comparison_key, result.comparison, get_service)
+	job.stage = STAGE_DONE
+	_finish(job, 'done')
+	logger.info('Upload job %s for supplier %s done: %s', job.pk, supplier.name, job.counts)
+
+
+def run_job(job, get_service: Optional[Callable[[], Any]] = None):
+	"""Process a claimed job: compare the staged file, save it and store the comparison.
+
+	Failures are recorded on the job as the message shown to the user; they
+	are not raised. The staged file is removed once the job finishes.
+	The comparison Excel is written behind the job; `get_service` builds
+	its storage service.
+	"""
+	storage = job.supplier.current_file.storage
+	try:
+		with storage.open(job.file_name, 'rb') as fh:
+			_process(job, File(fh, name=job.original_name), get_service)
+	except Exception as exc:
+		# The staged file itself could not be read.
+		logger.exception('Upload job %s failed: %s', job.pk, exc)
+		_finish(job, 'failed', f'Error reading Excel file: {exc}')
+	finally:
+		try:
+			storage.delete(job.file_name)
+		except Exception as exc:
+			logger.warning('Failed to delete staged upload %s: %s', job.file_name, exc)
+
+
+def run_upload(supplier, upload_file, original_name: str, get_service: Optional[Callable[[], Any]] = None):
+	"""Process `upload_file` in this process, as a job that is never staged or queued.
+
+	Used when jobs run eagerly: the upload is compared and saved straight
+	from `upload_file`, with no round trip through storage. Returns the
+	finished job, whose comparison is shown like a worker's.
+	"""
+	job = supplier.upload_jobs.create(
+		file_name='',
+		original_name=original_name,
+		old_file_name=supplier.last_uploaded_filename,
+		status='running',
+		stage=STAGE_QUEUED,
+		attempts=1,
+		worker=worker_name(),
+		started_at=timezone.now(),
+	)
+	try:
+		_process(job, upload_file, get_service)
+	except Exception as exc:
+		logger.exception('Upload job %s failed: %s', job.pk, exc)
+		_finish(job, 'failed', f'Error reading Excel file: {exc}')
+	return job
+
+
+def requeue_stale_jobs(timeout: Optional[int] = None) -> int:
+	"""Return abandoned jobs (a worker died while comparing) to the queue.
+
+	Jobs running for more than `timeout` seconds are queued again while they
+	have attempts left and had not started saving; the rest are failed, since
+	their upload may already have replaced the stored file. Returns how many
+	jobs were requeued.
+	"""
+	from ..models import UploadJob
+
+	if timeout is None:
+		timeout = getattr(settings, 'STOCK_UPLOAD_JOB_TIMEOUT', DEFAULT_UPLOAD_JOB_TIMEOUT)
+	stale = UploadJob.objects.filter(status='running', started_at__lt=timezone.now() - timedelta(seconds=timeout))
+	retry = stale.filter(attempts__lt=MAX_JOB_ATTEMPTS, stage__in=(STAGE_QUEUED, STAGE_COMPARING))
+	requeued = retry.update(status='queued', stage=STAGE_QUEUED, worker='')
+	failed = stale.update(status='failed', error=ABANDONED_ERROR, finished_at=timezone.now())
+	if requeued or failed:
+		logger.warning('Requeued %d and failed %d abandoned upload jobs', requeued, failed)
+	return requeued
+
+
+def process_jobs(worker: str = '', max_jobs: Optional[int] = None) -> int:
+	"""Claim and run queued jobs until the queue is empty (or `max_jobs` ran); return how many ran."""
+	processed = 0
+	while max_jobs is None or processed < max_jobs:
+		close_old_connections()
+		job = claim_next_job(worker)
+		if job is None:
+			break
+		run_job(job)
+		processed += 1
+	return processed
+
+
+def job_payload(job) -> Dict[str, Any]:
+	"""Session data (see `comparison_payload`) for the comparison stored by a finished job."""
+	result = load_comparison(job.supplier, job.comparison_key, job.counts)
+	return comparison_payload(job.supplier, result, job.comparison_key, job.old_file_name, job.original_name)
+
+
+def job_status(job) -> Dict[str, Any]:
+	"""JSON-serializable progress of a job for status polling."""
+	return {
+		'id': job.pk,
+		'status': job.status,
+		'stage': job.stage,
+		'finished': job.finished,
+		'error': job.error,
+		'counts': job.counts,
+	}
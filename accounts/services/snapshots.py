@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+from io import BytesIO
+from typing import Iterator, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.core.files.base import ContentFile
+
+from .excel_compare import restore_compact_dtypes
+
+
+logger = logging.getLogger(__name__)
+
+
+# Bump when the normalized frame schema changes so older snapshots are ignored.
+SNAPSHOT_FORMAT_VERSION = 2
+SNAPSHOT_KEY_METADATA = b"stacktracker.snapshot_key"
+# Supplier settings that change what normalize_columns produces for the same file.
+SNAPSHOT_CONFIG_FIELDS = (
+	"product_id_column",
+	"stock_column",
+	"price_column",
+	"product_name_column",
+	"stock_in_text",
+	"stock_out_text",
+	"stock_vocabulary",
+	"stock_aggregation",
+	"price_decimal_separator",
+)
+_DIGEST_CHUNK_SIZE = 1024 * 1024
+
+
+def snapshot_path(supplier) -> str:
+	"""Storage name of the parsed snapshot, next to the supplier's stock.xlsx."""
+	return f"user_{supplier.owner_id}/supplier_{supplier.id}/stock.snapshot.parquet"
+
+
+def file_digest(file_obj) -> str:
+	"""Return the SHA-256 hex digest of `file_obj`, leaving it rewound."""
+	digest = hashlib.sha256()
+	if hasattr(file_obj, "seek"):
+		file_obj.seek(0)
+	for chunk in iter(lambda: file_obj.read(_DIGEST_CHUNK_SIZE), b""):
+		digest.update(chunk)
+	if hasattr(file_obj, "seek"):
+		file_obj.seek(0)
+	return digest.hexdigest()
+
+
+def snapshot_key(supplier, digest: str) -> str:
+	"""Combine a file digest with the supplier's parsing config into one cache key."""
+	config = {field: getattr(supplier, field) for field in SNAPSHOT_CONFIG_FIELDS}
+	config["version"] = SNAPSHOT_FORMAT_VERSION
+	config_hash = hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+	return f"{digest}:{config_hash}"
+
+
+def frame_to_snapshot_bytes(frame: pd.DataFrame, key: str) -> bytes:
+	"""Serialize a normalized frame to Parquet with `key` in the file metadata."""
+	table = pa.Table.from_pandas(frame, preserve_index=False)
+	metadata = dict(table.schema.metadata or {})
+	metadata[SNAPSHOT_KEY_METADATA] = key.encode("utf-8")
+	buffer = BytesIO()
+	pq.write_table(table.replace_schema_metadata(metadata), buffer)
+	return buffer.getvalue()
+
+
+def frame_from_snapshot(file_obj, key: str) -> Optional[pd.DataFrame]:
+	"""Read a Parquet snapshot, returning None when it was written for another key."""
+	table = pq.read_table(file_obj)
+	if _stored_key(table.schema) != key:
+		return None
+	# Parquet keeps strings but not their Arrow backing; restore the compact schema.
+	return restore_compact_dtypes(table.to_pandas())
+
+
+def _stored_key(schema: pa.Schema) -> str:
+	return (schema.metadata or {}).get(SNAPSHOT_KEY_METADATA, b"").decode("utf-8")
+
+
+def load_snapshot(supplier) -> Optional[pd.DataFrame]:
+	"""Return the parsed frame of the supplier's stored file, or None if missing/stale."""
+	if not supplier.current_file or not supplier.current_file_digest:
+		return None
+	key = snapshot_key(supplier, supplier.current_file_digest)
+	try:
+		with supplier.current_file.storage.open(snapshot_path(supplier), "rb") as fh:
+			frame = frame_from_snapshot(fh, key)
+	except Exception as exc:
+		logger.info("No usable snapshot for supplier %s: %s", supplier.name, exc)
+		return None
+	if frame is None:
+		logger.info("Snapshot for supplier %s is stale; re-reading the stored file", supplier.name)
+	return frame
+
+
+def iter_snapshot_chunks(supplier, chunk_rows: int) -> Optional[Iterator[pd.DataFrame]]:
+	"""Like `load_snapshot`, but yield the frame lazily in batches of `chunk_rows` rows.
+
+	The key is checked up front; None is returned when the snapshot is missing or stale.
+	"""
+	if not supplier.current_file or not supplier.current_file_digest:
+		return None
+	key = snapshot_key(supplier, supplier.current_file_digest)
+	try:
+		fh = supplier.current_file.storage.open(snapshot_path(supplier), "rb")
+	except Exception as exc:
+		logger.info("No usable snapshot for supplier %s: %s", supplier.name, exc)
+		return None
+	try:
+		parquet = pq.ParquetFile(fh)
+		fresh = _stored_key(parquet.schema_arrow) == key
+	except Exception as exc:
+		fh.close()
+		logger.info("No usable snapshot for supplier %s: %s", supplier.name, exc)
+		return None
+	if not fresh:
+		fh.close()
+		logger.info("Snapshot for supplier %s is stale; re-reading the stored file", supplier.name)
+		return None
+	return _snapshot_batches(parquet, fh, chunk_rows)
+
+
+def _snapshot_batches(parquet: pq.ParquetFile, fh, chunk_rows: int) -> Iterator[pd.DataFrame]:
+	try:
+		for batch in parquet.iter_batches(batch_size=chunk_rows):
+			yield restore_compact_dtypes(batch.to_pandas())
+	finally:
+		fh.close()
+
+
+def write_snapshot(supplier, frame: pd.DataFrame) -> None:
+	"""Persist `frame` as the snapshot of the supplier's current file; storage errors propagate."""
+	if not supplier.current_file_digest:
+		return
+	name = snapshot_path(supplier)
+	content = frame_to_snapshot_bytes(frame, snapshot_key(supplier, supplier.current_file_digest))
+	storage = supplier.current_file.storage
+	storage.delete(name)
+	storage.save(name, ContentFile(content))
+	logger.info("Stored parsed snapshot for supplier %s at %s", supplier.name, name)
+
+
+def save_snapshot(supplier, frame: pd.DataFrame) -> None:
+	"""Like `write_snapshot`, but best-effort: errors are logged."""
+	try:
+		write_snapshot(supplier, frame)
+	except Exception as exc:
+		logger.warning("Failed to store parsed snapshot for %s: %s", supplier.name, exc)
+
+
+def delete_snapshot(supplier) -> None:
+	"""Remove the supplier's snapshot, ignoring storage errors."""
+	try:
+		supplier.current_file.storage.delete(snapshot_path(supplier))
+	except Exception as exc:
+		logger.warning("Failed to delete parsed snapshot for %s: %s", supplier.name, exc)
@@ -1,7 +1,13 @@
+import base64
 import io
 import logging
+import mimetypes
 import os
-from typing import Optional
+import tempfile
+import time
+from contextlib import closing
+from typing import Optional, Tuple
+from urllib.parse import urljoin
 
 import requests
 from django.conf import settings
@@ -10,6 +16,24 @@ from django.conf import settings
 logger = logging.getLogger(__name__)
 
 
+# Supabase's resumable (TUS) endpoint requires 6 MiB parts, except the last one.
+DEFAULT_UPLOAD_CHUNK_SIZE = 6 * 1024 * 1024
+# Objects larger than this go through the resumable protocol.
+DEFAULT_RESUMABLE_THRESHOLD = 6 * 1024 * 1024
+# Retries per part (or per single-request upload) before giving up.
+DEFAULT_UPLOAD_RETRIES = 3
+DEFAULT_UPLOAD_TIMEOUT = 60
+TUS_VERSION = "1.0.0"
+# Downloads are kept in memory up to this size, then spooled to a temporary file.
+DEFAULT_DOWNLOAD_SPOOL_SIZE = 16 * 1024 * 1024
+_DOWNLOAD_BLOCK_SIZE = 64 * 1024
+_RETRY_BACKOFF_SECONDS = 0.5
+
+
+class _RetryableUploadError(Exception):
+	"""A part upload failed in a way worth retrying (network error or 5xx)."""
+
+
 class SupabaseStorageError(Exception):
 	"""Custom exception for Supabase storage-related issues."""
 
@@ -21,7 +45,19 @@ class SupabaseStorageService:
 	consumiendo directamente la API de Storage vía requests.
 	"""
 
-	def __init__(self, base_url: str, api_key: str, bucket: str):
+	def __init__(
+		self,
+		base_url: str,
+		api_key: str,
+		bucket: str,
+		*,
+		chunk_size: int = DEFAULT_UPLOAD_CHUNK_SIZE,
+		resumable_threshold: int = DEFAULT_RESUMABLE_THRESHOLD,
+		max_retries: int = DEFAULT_UPLOAD_RETRIES,
+		timeout: float = DEFAULT_UPLOAD_TIMEOUT,
+		retry_backoff: float = _RETRY_BACKOFF_SECONDS,
+		download_spool_size: int = DEFAULT_DOWNLOAD_SPOOL_SIZE,
+	):
 		if not bucket:
 			raise ValueError("Supabase bucket name must be provided.")
 		if not base_url or not api_key:
@@ -29,6 +65,12 @@ class SupabaseStorageService:
 		self._base_url = base_url.rstrip("/")
 		self._api_key = api_key
 		self._bucket = bucket
+		self._chunk_size = chunk_size
+		self._resumable_threshold = resumable_threshold
+		self._max_retries = max_retries
+		self._timeout = timeout
+		self._retry_backoff = retry_backoff
+		self._download_spool_size = download_spool_size
 		self._session = requests.Session()
 		self._session.headers.update({
 			"apikey": api_key,
@@ -69,7 +111,16 @@ class SupabaseStorageService:
 			)
 
 		logger.info("Supabase HTTP storage client initialised for bucket '%s'", bucket)
-		return cls(base_url=url, api_key=api_key, bucket=bucket)
+		return cls(
+			base_url=url,
+			api_key=api_key,
+			bucket=bucket,
+			chunk_size=getattr(settings, "SUPABASE_UPLOAD_CHUNK_SIZE", DEFAULT_UPLOAD_CHUNK_SIZE),
+			resumable_threshold=getattr(settings, "SUPABASE_RESUMABLE_THRESHOLD", DEFAULT_RESUMABLE_THRESHOLD),
+			max_retries=getattr(settings, "SUPABASE_UPLOAD_RETRIES", DEFAULT_UPLOAD_RETRIES),
+			timeout=getattr(settings, "SUPABASE_TIMEOUT", DEFAULT_UPLOAD_TIMEOUT),
+			download_spool_size=getattr(settings, "SUPABASE_DOWNLOAD_SPOOL_SIZE", DEFAULT_DOWNLOAD_SPOOL_SIZE),
+		)
 
 	def _object_url(self, path: str, *, public: bool = False) -> str:
 		base = f"{self._base_url}/storage/v1/object"
@@ -81,60 +132,237 @@ class SupabaseStorageService:
 	def upload(self, path: str, content) -> str:
 		"""Upload a file-like object or bytes to Supabase storage.
 
-		Returns the stored path (key) on success.
+		The content is streamed from the file object, never read whole. Objects
+		up to the resumable threshold are sent in one streamed PUT; larger ones
+		through Supabase's resumable (TUS) endpoint in `chunk_size` parts, each
+		retried on its own after a network error. File objects are rewound
+		afterwards. Returns the stored path (key) on success.
 		"""
 		if not path:
 			raise SupabaseStorageError("A non-empty storage path is required for upload.")
 
 		# Normalise to POSIX-style paths for Supabase
 		normalized_path = path.replace("\\", "/").lstrip("/")
-
-		if hasattr(content, "read"):
-			try:
-				data = content.read()
-				if hasattr(content, "seek"):
+		stream, size, spooled = self._upload_stream(content, normalized_path)
+		try:
+			if size > self._resumable_threshold:
+				self._upload_resumable(normalized_path, stream, size)
+			else:
+				self._upload_single(normalized_path, stream, size)
+		finally:
+			if spooled:
+				stream.close()
+			elif hasattr(content, "seek"):
+				try:
 					content.seek(0)
-			except Exception as exc:
-				logger.exception("Failed to read upload content for '%s': %s", normalized_path, exc)
-				raise SupabaseStorageError("Unable to read upload content.") from exc
-		else:
-			data = content
-
-		if isinstance(data, str):
-			data = data.encode("utf-8")
-
-		if not isinstance(data, (bytes, bytearray, memoryview)):
+				except Exception:  # pragma: no cover - unseekable streams are spooled
+					pass
+		logger.info("Uploaded file to Supabase at '%s' (%d bytes)", normalized_path, size)
+		return normalized_path
+
+	def _upload_stream(self, content, normalized_path: str) -> Tuple[object, int, bool]:
+		"""Return (seekable stream positioned at 0, size, whether it is a spooled copy)."""
+		if isinstance(content, str):
+			content = content.encode("utf-8")
+		if isinstance(content, (bytes, bytearray, memoryview)):
+			data = bytes(content)
+			return io.BytesIO(data), len(data), False
+		if not hasattr(content, "read"):
 			raise SupabaseStorageError("Upload content must be bytes, str, or a file-like object.")
-
-		url = self._object_url(normalized_path)
 		try:
-			resp = self._session.put(url, data=data, headers={"x-upsert": "true"})
+			content.seek(0)
+			content.seek(0, io.SEEK_END)
+			size = content.tell()
+			content.seek(0)
+			return content, size, False
+		except Exception:
+			pass
+		# Unseekable stream: copy it to a temporary file (in memory while small) so parts can be re-read.
+		try:
+			spool = tempfile.SpooledTemporaryFile(max_size=self._chunk_size)
+			for chunk in iter(lambda: content.read(self._chunk_size), b""):
+				spool.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+			size = spool.tell()
+			spool.seek(0)
+		except Exception as exc:
+			logger.exception("Failed to read upload content for '%s': %s", normalized_path, exc)
+			raise SupabaseStorageError("Unable to read upload content.") from exc
+		return spool, size, True
+
+	def _with_retries(self, description: str, attempt):
+		"""Call `attempt()` until it succeeds, retrying `_RetryableUploadError` with backoff."""
+		for retry in range(self._max_retries + 1):
+			try:
+				return attempt()
+			except _RetryableUploadError as exc:
+				if retry == self._max_retries:
+					logger.error("Giving up on %s after %d attempts: %s", description, retry + 1, exc)
+					raise SupabaseStorageError("Failed to upload file to Supabase.") from exc
+				delay = self._retry_backoff * 2 ** retry
+				logger.warning("Retrying %s in %.1fs (attempt %d): %s", description, delay, retry + 1, exc)
+				time.sleep(delay)
+
+	def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+		"""Send a request, turning network errors and 5xx answers into retryable errors."""
+		try:
+			resp = self._session.request(method, url, timeout=self._timeout, **kwargs)
+		except requests.RequestException as exc:
+			raise _RetryableUploadError(str(exc)) from exc
+		if resp.status_code >= 500:
+			raise _RetryableUploadError(f"{resp.status_code}: {resp.text[:200]}")
+		return resp
+
+	def _upload_single(self, normalized_path: str, stream, size: int) -> None:
+		url = self._object_url(normalized_path)
+
+		def attempt():
+			stream.seek(0)
+			# requests streams file objects in blocks instead of loading them.
+			resp = self._request("PUT", url, data=stream, headers={"x-upsert": "true", "Content-Length": str(size)})
 			if resp.status_code >= 400:
 				logger.error("Supabase upload failed (%s) for '%s': %s", resp.status_code, normalized_path, resp.text)
 				raise SupabaseStorageError("Failed to upload file to Supabase.")
-			logger.info("Uploaded file to Supabase at '%s'", normalized_path)
-			return normalized_path
-		except requests.RequestException as exc:  # pragma: no cover - external service
-			logger.exception("Error uploading file to Supabase at '%s': %s", normalized_path, exc)
-			raise SupabaseStorageError("Failed to upload file to Supabase.") from exc
 
-	def download(self, path: str) -> bytes:
-		"""Download a file from Supabase storage and return its bytes."""
+		self._with_retries(f"upload of '{normalized_path}'", attempt)
+
+	def _upload_resumable(self, normalized_path: str, stream, size: int) -> None:
+		"""Upload `stream` through the TUS endpoint, one part in memory at a time."""
+		upload_url = self._with_retries(
+			f"resumable upload creation for '{normalized_path}'",
+			lambda: self._create_resumable(normalized_path, size),
+		)
+		offset = 0
+		while offset < size:
+			stream.seek(offset)
+			part = stream.read(min(self._chunk_size, size - offset))
+			if not part:
+				raise SupabaseStorageError(f"Upload content ended at byte {offset} of {size}.")
+			part_start = offset
+			resuming = False
+
+			def attempt():
+				nonlocal resuming
+				# After a failure the server may already hold the start of this part.
+				server_offset = self._resumable_offset(upload_url) if resuming else part_start
+				resuming = True
+				return self._send_part(upload_url, normalized_path, part, part_start, server_offset)
+
+			offset = self._with_retries(f"part at byte {part_start} of '{normalized_path}'", attempt)
+			logger.debug("Uploaded %d of %d bytes of '%s'", offset, size, normalized_path)
+
+	def _send_part(self, upload_url: str, normalized_path: str, part: bytes, part_start: int, server_offset: int) -> int:
+		"""Send what the server lacks of `part` (which starts at byte `part_start`); return the new offset."""
+		if server_offset >= part_start + len(part):
+			return server_offset
+		if server_offset < part_start:
+			raise SupabaseStorageError(f"Resumable upload went back from byte {part_start} to {server_offset}.")
+		resp = self._request(
+			"PATCH",
+			upload_url,
+			data=part[server_offset - part_start:],
+			headers={
+				"Tus-Resumable": TUS_VERSION,
+				"Upload-Offset": str(server_offset),
+				"Content-Type": "application/offset+octet-stream",
+			},
+		)
+		if resp.status_code == 409:
+			raise _RetryableUploadError("offset mismatch")
+		if resp.status_code >= 400:
+			logger.error("Supabase part upload failed (%s) for '%s': %s", resp.status_code, normalized_path, resp.text)
+			raise SupabaseStorageError("Failed to upload file to Supabase.")
+		return int(resp.headers.get("Upload-Offset", part_start + len(part)))
+
+	def _create_resumable(self, normalized_path: str, size: int) -> str:
+		"""Start a resumable upload and return its URL."""
+		content_type = mimetypes.guess_type(normalized_path)[0] or "application/octet-stream"
+		metadata = {
+			"bucketName": self._bucket,
+			"objectName": normalized_path,
+			"contentType": content_type,
+		}
+		resp = self._request(
+			"POST",
+			f"{self._base_url}/storage/v1/upload/resumable",
+			headers={
+				"Tus-Resumable": TUS_VERSION,
+				"Upload-Length": str(size),
+				"Upload-Metadata": ",".join(
+					f"{key} {base64.b64encode(value.encode('utf-8')).decode('ascii')}" for key, value in metadata.items()
+				),
+				"x-upsert": "true",
+			},
+		)
+		if resp.status_code >= 400 or "Location" not in resp.headers:
+			logger.error("Supabase resumable upload creation failed (%s) for '%s': %s", resp.status_code, normalized_path, resp.text)
+			raise SupabaseStorageError("Failed to upload file to Supabase.")
+		return urljoin(f"{self._base_url}/", resp.headers["Location"])
+
+	def _resumable_offset(self, upload_url: str) -> int:
+		"""Bytes of a resumable upload the server has stored."""
+		resp = self._request("HEAD", upload_url, headers={"Tus-Resumable": TUS_VERSION})
+		if resp.status_code >= 400 or "Upload-Offset" not in resp.headers:
+			raise SupabaseStorageError(f"Resumable upload is no longer available ({resp.status_code}).")
+		return int(resp.headers["Upload-Offset"])
+
+	def _get_object(self, path: str, *, stream: bool = False) -> requests.Response:
+		"""GET the object at `path`, raising SupabaseStorageError for error responses."""
 		if not path:
 			raise SupabaseStorageError("A non-empty storage path is required for download.")
-		url = self._object_url(path)
-		try:
-			resp = self._session.get(url)
-			if resp.status_code == 404:
-				raise SupabaseStorageError("File not found in Supabase.")
-			if resp.status_code >= 400:
+		resp = self._session.get(self._object_url(path), stream=stream, timeout=self._timeout)
+		if resp.status_code >= 400:
+			with closing(resp):
+				if resp.status_code == 404:
+					raise SupabaseStorageError("File not found in Supabase.")
 				logger.error("Supabase download failed (%s) for '%s': %s", resp.status_code, path, resp.text)
 				raise SupabaseStorageError("Failed to download file from Supabase.")
-			logger.info("Downloaded file from Supabase at '%s'", path)
-			return resp.content
+		return resp
+
+	def download(self, path: str) -> bytes:
+		"""Download a file from Supabase storage and return its bytes.
+
+		The whole object is held in memory; prefer `open_download` for supplier files.
+		"""
+		try:
+			content = self._get_object(path).content
 		except requests.RequestException as exc:  # pragma: no cover - external service
 			logger.exception("Error downloading file from Supabase at '%s': %s", path, exc)
 			raise SupabaseStorageError("Failed to download file from Supabase.") from exc
+		logger.info("Downloaded file from Supabase at '%s'", path)
+		return content
+
+	def download_to(self, path: str, fh) -> int:
+		"""Stream the object at `path` into the binary file `fh` and return its size.
+
+		The body is read in small blocks, so memory use does not grow with the
+		object. A truncated body raises SupabaseStorageError.
+		"""
+		size = 0
+		try:
+			with closing(self._get_object(path, stream=True)) as resp:
+				for block in resp.iter_content(chunk_size=_DOWNLOAD_BLOCK_SIZE):
+					fh.write(block)
+					size += len(block)
+		except requests.RequestException as exc:
+			logger.exception("Error downloading file from Supabase at '%s': %s", path, exc)
+			raise SupabaseStorageError("Failed to download file from Supabase.") from exc
+		logger.info("Downloaded file from Supabase at '%s' (%d bytes)", path, size)
+		return size
+
+	def open_download(self, path: str) -> tempfile.SpooledTemporaryFile:
+		"""Download `path` into a temporary file, rewound and open for reading.
+
+		Objects up to `download_spool_size` bytes stay in memory; larger ones
+		roll over to disk. The caller closes the file.
+		"""
+		spool = tempfile.SpooledTemporaryFile(max_size=self._download_spool_size)
+		try:
+			self.download_to(path, spool)
+		except BaseException:
+			spool.close()
+			raise
+		spool.seek(0)
+		return spool
 
 	def delete(self, path: str) -> None:
 		"""Delete a file from Supabase storage. Silently succeeds if it does not exist."""
@@ -0,0 +1,152 @@
+"""Per-product stock and price time series.
+
+After each upload, the products it changed are appended to the
+ProductChange table: one row per (supplier, product id, upload time). Rows
+are written in bulk, through COPY on PostgreSQL and batched `bulk_create`
+elsewhere, never one save per product.
+"""
+import csv
+import logging
+from datetime import datetime
+from decimal import Decimal
+from io import StringIO
+from typing import Optional
+
+import pandas as pd
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .comparison_result import ComparisonResult
+
+
+logger = logging.getLogger(__name__)
+
+
+# Rows sent per COPY statement or bulk_create batch.
+DEFAULT_TIMESERIES_BATCH_ROWS = 5000
+CHANGE_COLUMNS = ('product_id', 'status', 'stock', 'price')
+
+
+def _section(result: ComparisonResult, section: str, status: str, **columns) -> pd.DataFrame:
+	"""Select `columns` (change column -> section column) of one section, tagged with `status`."""
+	frame = result[section]
+	part = pd.DataFrame({'product_id': frame['id'].astype(str).to_numpy() if 'id' in frame.columns else []})
+	for target in ('stock', 'price'):
+		source = columns.get(target)
+		if source and source in frame.columns:
+			part[target] = pd.to_numeric(frame[source], errors='coerce').to_numpy(dtype='float64', na_value=float('nan'))
+		else:
+			part[target] = float('nan')
+	part['status'] = status
+	return part
+
+
+def change_rows(result: ComparisonResult) -> pd.DataFrame:
+	"""One row per changed product: its status and new stock/price (NaN when unchanged).
+
+	A product listed in several sections (e.g. stock and price changes) is
+	merged into one row; 'new' and 'removed' take precedence over 'changed'.
+	"""
+	# Removed rows have no new stock; the rest of that section went out of stock.
+	removed_or_out = _section(result, 'removed_or_out_of_stock', 'changed', stock='new_stock')
+	removed_or_out.loc[removed_or_out['stock'].isna(), 'status'] = 'removed'
+	parts = [
+		_section(result, 'new_products', 'new', stock='stock', price='price'),
+		removed_or_out,
+		_section(result, 'stock_changes', 'changed', stock='new_stock'),
+		_section(result, 'price_changes', 'changed', price='new_price'),
+	]
+	parts = [part for part in parts if len(part)]
+	if not parts:
+		return pd.DataFrame({'product_id': [], 'status': [], 'stock': [], 'price': []})
+	# `first` skips NaN, so a stock change and a price change of one product combine.
+	rows = pd.concat(parts, ignore_index=True).groupby('product_id', sort=True).first().reset_index()
+	rows['price'] = rows['price'].round(2)
+	return rows[list(CHANGE_COLUMNS)]
+
+
+def _copy_batch(cursor, table: str, columns, frame: pd.DataFrame) -> None:
+	"""COPY `frame` into `table` as CSV; empty unquoted fields are read as NULL."""
+	buffer = StringIO()
+	frame.to_csv(buffer, header=False, index=False, quoting=csv.QUOTE_MINIMAL)
+	buffer.seek(0)
+	column_list = ', '.join(connection.ops.quote_name(column) for column in columns)
+	cursor.copy_expert(
+		f"COPY {connection.ops.quote_name(table)} ({column_list}) FROM STDIN WITH (FORMAT csv)",
+		buffer,
+	)
+
+
+def _write_copy(model, supplier, rows: pd.DataFrame, recorded_at: datetime, batch_rows: int) -> None:
+	meta = model._meta
+	columns = [meta.get_field('supplier').column, 'recorded_at', *CHANGE_COLUMNS]
+	frame = rows.assign(supplier_id=supplier.id, recorded_at=recorded_at.isoformat())
+	frame = frame[['supplier_id', 'recorded_at', *CHANGE_COLUMNS]]
+	with connection.cursor() as cursor:
+		for start in range(0, len(frame), batch_rows):
+			_copy_batch(cursor, meta.db_table, columns, frame.iloc[start:start + batch_rows])
+
+
+def _write_bulk_create(model, supplier, rows: pd.DataFrame, recorded_at: datetime, batch_rows: int) -> None:
+	for start in range(0, len(rows), batch_rows):
+		batch = rows.iloc[start:start + batch_rows]
+		batch = batch.astype(object).where(batch.notna(), None)
+		model.objects.bulk_create(
+			[
+				model(
+					supplier=supplier,
+					recorded_at=recorded_at,
+					product_id=product_id,
+					status=status,
+					stock=stock,
+					price=Decimal(str(price)) if price is not None else None,
+				)
+				for product_id, status, stock, price in batch.itertuples(index=False, name=None)
+			],
+			batch_size=batch_rows,
+		)
+
+
+def record_changes(supplier, result: ComparisonResult, recorded_at: Optional[datetime] = None) -> int:
+	"""Append the products changed by an upload to the supplier's time series (best-effort).
+
+	The result is processed block by block (see `ComparisonResult.blocks`);
+	a product id only ever appears in one block. Returns the number of rows
+	written (0 on failure).
+	"""
+	written = 0
+	try:
+		recorded_at = recorded_at or timezone.now()
+		batch_rows = getattr(settings, 'STOCK_TIMESERIES_BATCH_ROWS', DEFAULT_TIMESERIES_BATCH_ROWS)
+		model = supplier.product_changes.model
+		write = _write_copy if connection.vendor == 'postgresql' else _write_bulk_create
+		with transaction.atomic():
+			for block in result.blocks():
+				rows = change_rows(block)
+				if rows.empty:
+					continue
+				write(model, supplier, rows, recorded_at, batch_rows)
+				written += len(rows)
+	except Exception as exc:
+		logger.warning('Failed to record product changes for supplier %s: %s', supplier.name, exc)
+		return 0
+	if written:
+		logger.info('Recorded %d product changes for supplier %s', written, supplier.name)
+	return written
+
+
+def product_history(supplier, product_id: str, since: Optional[datetime] = None):
+	"""Changes of one product, newest first (uses the supplier/product/time index)."""
+	changes = supplier.product_changes.filter(product_id=product_id)
+	if since is not None:
+		changes = changes.filter(recorded_at__gte=since)
+	return changes.order_by('-recorded_at')
+
+
+def changes_between(supplier, start: datetime, end: Optional[datetime] = None):
+	"""Every product change of a supplier recorded in [start, end), newest first."""
+	changes = supplier.product_changes.filter(recorded_at__gte=start)
+	if end is not None:
+		changes = changes.filter(recorded_at__lt=end)
+	return changes.order_by('-recorded_at', 'product_id')
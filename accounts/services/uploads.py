@@ -0,0 +1,409 @@
+import copy
+import logging
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, Callable, Dict, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.db import connections
+
+from .backends import get_backend
+from .comparison_result import COMPARISON_SECTIONS, ComparisonResult
+from .excel_compare import restore_compact_dtypes
+from .external_compare import SpilledComparison
+from .history import record_version
+from .ingestion import compare_supplier_out_of_core, diff_rules, exceeds_in_memory_rows, load_supplier_frame
+from .snapshots import delete_snapshot, file_digest, load_snapshot, write_snapshot
+from .supabase_storage import get_supabase_storage_service
+from .timeseries import record_changes
+from .writebehind import WriteSuperseded, register_handler, submit
+
+
+logger = logging.getLogger(__name__)
+
+
+COMPARISON_SHEETS = (
+	("removed_or_out_of_stock", "Removed_or_OutOfStock"),
+	("new_products", "New_Products"),
+	("stock_changes", "Stock_Changes"),
+	("price_changes", "Price_Changes"),
+)
+# Rows written to the comparison Excel per batch.
+EXPORT_BATCH_ROWS = 10_000
+# Threads per process that fetch and parse previous files while uploads are parsed.
+DEFAULT_FETCH_THREADS = 4
+COMPARISON_KEY_METADATA = b"stacktracker.comparison_key"
+
+
+class PreviousFileError(Exception):
+	"""The supplier's stored file could not be read for comparison."""
+
+
+class ComparisonUnavailableError(Exception):
+	"""A stored comparison is missing or was replaced by a newer one."""
+
+
+@dataclass
+class UploadComparison:
+	"""Comparison of an upload against the supplier's stored file.
+
+	`new_df` is the normalized upload, or None when it was compared out of
+	core and never materialized.
+	"""
+
+	comparison: ComparisonResult
+	new_df: Optional[pd.DataFrame]
+
+
+def build_comparison_excel_bytes(result: ComparisonResult) -> bytes:
+	"""Build an in-memory Excel file from a comparison result.
+
+	Each section is written `EXPORT_BATCH_ROWS` rows at a time straight from
+	its columns, one block of the result at a time; no list of records is built.
+	"""
+	output = BytesIO()
+	with pd.ExcelWriter(output, engine="openpyxl") as writer:
+		for key, sheet_name in COMPARISON_SHEETS:
+			sheet_name = sheet_name[:31]
+			written = 0
+			for block in result.blocks():
+				frame = block[key]
+				for start in range(0, len(frame), EXPORT_BATCH_ROWS):
+					# Row 0 holds the header, so data row `written` lands on sheet row written + 1.
+					frame.iloc[start:start + EXPORT_BATCH_ROWS].to_excel(
+						writer, index=False, header=not written, sheet_name=sheet_name,
+						startrow=written + 1 if written else 0,
+					)
+					written += len(frame.iloc[start:start + EXPORT_BATCH_ROWS])
+			if not written:
+				result[key].to_excel(writer, index=False, sheet_name=sheet_name)
+
+	output.seek(0)
+	return output.getvalue()
+
+
+def comparison_path(supplier, section: str) -> str:
+	"""Storage name of one section of the supplier's stored comparison."""
+	return f"user_{supplier.owner_id}/supplier_{supplier.id}/comparison/{section}.parquet"
+
+
+def stored_file_path(supplier) -> str:
+	"""Fixed storage name of the supplier's current stock file."""
+	return f"user_{supplier.owner_id}/supplier_{supplier.id}/stock.xlsx"
+
+
+def last_comparison_path(supplier) -> str:
+	"""Storage path of the supplier's last comparison Excel."""
+	return f"user_{supplier.owner_id}/supplier_{supplier.id}/last_comparison.xlsx"
+
+
+def load_previous_frame(supplier) -> Optional[pd.DataFrame]:
+	"""Return the normalized frame of the supplier's stored file, or None if there is none.
+
+	The frame parsed during the previous upload is reused when its snapshot
+	is fresh. Raises PreviousFileError when the stored file cannot be read:
+	treating everything as new would produce a misleading comparison.
+	"""
+	if not supplier.current_file or not supplier.current_file.name:
+		return None
+	old_df = load_snapshot(supplier)
+	if old_df is not None:
+		logger.info('Loaded previous snapshot for supplier %s', supplier.name)
+		return old_df
+	try:
+		with supplier.current_file.open('rb') as previous_file:
+			try:
+				prev_name = getattr(previous_file, 'name', None) or supplier.current_file.name
+			except Exception:
+				prev_name = supplier.current_file.name
+			# Read a couple bytes for diagnostics, then rewind.
+			try:
+				header_probe = previous_file.read(16)
+				if hasattr(previous_file, 'seek'):
+					previous_file.seek(0)
+				logger.info(
+					"Reading previous supplier Excel: supplier=%s path=%s head=%s",
+					supplier.name,
+					prev_name,
+					header_probe.hex(),
+				)
+			except Exception as probe_exc:
+				logger.debug("Failed probing previous Excel header bytes: %s", probe_exc)
+			old_df = load_supplier_frame(supplier, previous_file)
+	except Exception as exc:
+		logger.exception('Failed to read previous file for %s (path=%s): %s', supplier.name, supplier.current_file.name, exc)
+		raise PreviousFileError(str(exc)) from exc
+	logger.info('Loaded previous file for supplier %s', supplier.name)
+	return old_df
+
+
+_fetch_executor: Optional[ThreadPoolExecutor] = None
+_fetch_executor_lock = threading.Lock()
+
+
+def _fetch_pool() -> Optional[ThreadPoolExecutor]:
+	"""The process-wide pool for previous-file reads, or None when disabled.
+
+	It is shared by all request threads, so `settings.STOCK_FETCH_THREADS`
+	(read when the pool is first needed) bounds the concurrent reads of a
+	process; callers never wait on it from inside one of its own tasks.
+	"""
+	global _fetch_executor
+	threads = getattr(settings, 'STOCK_FETCH_THREADS', DEFAULT_FETCH_THREADS)
+	if not threads:
+		return None
+	with _fetch_executor_lock:
+		if _fetch_executor is None:
+			_fetch_executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='stock-fetch')
+		return _fetch_executor
+
+
+def _timed(func, *args):
+	"""Run `func(*args)` and return (result, seconds)."""
+	started = time.perf_counter()
+	return func(*args), time.perf_counter() - started
+
+
+def _load_previous_in_thread(supplier):
+	try:
+		return _timed(load_previous_frame, supplier)
+	finally:
+		# Database connections are per thread; do not leave one open in the pool.
+		connections.close_all()
+
+
+def compare_upload(supplier, upload_file) -> UploadComparison:
+	"""Compare `upload_file` with the supplier's stored file.
+
+	The stored file (or its snapshot) is fetched and parsed in a pool thread
+	while the upload is parsed in the calling thread, so download latency
+	overlaps with parsing. Very large sheets are compared out of core: both
+	sides are streamed in chunks and merged from sorted runs on disk instead
+	of loaded at once. The supplier's diff rules filter the reported changes
+	in both cases. Raises PreviousFileError when the stored file is
+	unreadable and ValueError (or a reader error) when the upload itself
+	cannot be read; the former wins when both fail.
+	"""
+	if exceeds_in_memory_rows(upload_file):
+		return UploadComparison(compare_supplier_out_of_core(supplier, upload_file), None)
+	started = time.perf_counter()
+	pool = _fetch_pool()
+	if pool is None:
+		old_df, old_seconds = _timed(load_previous_frame, supplier)
+		new_df, new_seconds = _timed(load_supplier_frame, supplier, upload_file)
+	else:
+		# The previous side reads a copy: both sides learn the sheet layout onto
+		# the instance, and only what the upload learns is saved with it.
+		previous = copy.copy(supplier)
+		future = pool.submit(_load_previous_in_thread, previous)
+		try:
+			new_df, new_seconds = _timed(load_supplier_frame, supplier, upload_file)
+		finally:
+			old_df, old_seconds = future.result()
+		if not supplier.price_decimal_separator:
+			supplier.price_decimal_separator = previous.price_decimal_separator
+	compare_started = time.perf_counter()
+	result = get_backend().compare_stock(old_df, new_df, diff_rules(supplier))
+	finished = time.perf_counter()
+	logger.info(
+		'Compared upload for supplier %s: previous=%.3fs new=%.3fs compare=%.3fs total=%.3fs (%s)',
+		supplier.name, old_seconds, new_seconds, finished - compare_started, finished - started,
+		'sequential' if pool is None else 'concurrent',
+	)
+	return UploadComparison(result, new_df)
+
+
+def save_upload(supplier, upload_file, original_name: str, result: UploadComparison) -> None:
+	"""Replace the supplier's stored file with `upload_file` and refresh its snapshot.
+
+	The normalized upload is also appended to the supplier's version history,
+	and the products it changed to their stock and price time series.
+	The learned sheet format is saved with the file. Storage errors of the
+	file itself propagate; the snapshot and the history version are written
+	behind (see writebehind.py).
+	"""
+	# Overwrite previous file with the new one: delete then save with fixed name
+	if supplier.current_file and supplier.current_file.name:
+		supplier.current_file.delete(save=False)
+	supplier.current_file_digest = file_digest(upload_file)
+	supplier.current_file.save(stored_file_path(supplier), upload_file, save=False)
+	supplier.last_uploaded_filename = original_name
+	supplier.save(update_fields=['current_file', 'current_file_digest', 'last_uploaded_filename', *supplier.LEARNED_FORMAT_FIELDS, 'updated_at'])
+	logger.info('Saved new file for supplier %s (original: %s)', supplier.name, supplier.last_uploaded_filename)
+	if result.new_df is None:
+		# The merged frame is never built, so there is no snapshot or version to store.
+		delete_snapshot(supplier)
+		logger.info('Skipped version history for out-of-core upload of supplier %s', supplier.name)
+	else:
+		# The snapshot and the history version are not needed by this upload; nobody waits for them.
+		submit(copy.copy(supplier), 'snapshot', {'digest': supplier.current_file_digest}, result.new_df)
+		submit(copy.copy(supplier), 'version', {'digest': supplier.current_file_digest, 'file_name': original_name}, result.new_df)
+	record_changes(supplier, result.comparison)
+
+
+def _section_table(frame: pd.DataFrame, key: str) -> pa.Table:
+	try:
+		table = pa.Table.from_pandas(frame, preserve_index=False)
+	except (pa.ArrowInvalid, pa.ArrowTypeError):
+		# Mixed-type columns (e.g. read back from an edited Excel) are stored as text.
+		mixed = {name: "string" for name, dtype in frame.dtypes.items() if dtype == object}
+		table = pa.Table.from_pandas(frame.astype(mixed), preserve_index=False)
+	metadata = dict(table.schema.metadata or {})
+	metadata[COMPARISON_KEY_METADATA] = key.encode("utf-8")
+	return table.replace_schema_metadata(metadata)
+
+
+def save_comparison(supplier, result: ComparisonResult) -> str:
+	"""Store each section of `result` as Parquet and return the key that identifies it.
+
+	The key is kept in the session (see `comparison_payload`) so a later
+	request reads back this comparison and not one stored after it.
+	Storage errors propagate.
+	"""
+	key = uuid.uuid4().hex
+	storage = supplier.current_file.storage
+	for section in COMPARISON_SECTIONS:
+		name = comparison_path(supplier, section)
+		if isinstance(result, SpilledComparison):
+			# Streamed part by part through a temporary file, never loaded whole.
+			with tempfile.TemporaryFile() as fh:
+				result.write_section(section, fh, {COMPARISON_KEY_METADATA: key.encode("utf-8")})
+				fh.seek(0)
+				storage.delete(name)
+				storage.save(name, File(fh, name=name))
+			continue
+		buffer = BytesIO()
+		pq.write_table(_section_table(result[section], key), buffer)
+		storage.delete(name)
+		storage.save(name, ContentFile(buffer.getvalue()))
+	logger.info('Stored comparison %s for supplier %s: %s', key, supplier.name, result.counts())
+	return key
+
+
+def load_comparison(supplier, key: str, counts: Optional[Dict[str, int]] = None) -> ComparisonResult:
+	"""Return the comparison stored under `key`, reading each section on first use.
+
+	With `counts` (as kept in the session) sections can be counted without
+	reading them. Reading a section raises ComparisonUnavailableError when it
+	is missing or was replaced by a newer comparison.
+	"""
+	storage = supplier.current_file.storage
+
+	def loader(section: str):
+		def load() -> pd.DataFrame:
+			name = comparison_path(supplier, section)
+			try:
+				with storage.open(name, "rb") as fh:
+					table = pq.read_table(fh)
+			except Exception as exc:
+				raise ComparisonUnavailableError(f"Comparison section {section} could not be read: {exc}") from exc
+			stored_key = (table.schema.metadata or {}).get(COMPARISON_KEY_METADATA, b"").decode("utf-8")
+			if stored_key != key:
+				raise ComparisonUnavailableError(f"Comparison section {section} was replaced by a newer comparison.")
+			return restore_compact_dtypes(table.to_pandas())
+		return load
+
+	return ComparisonResult({section: loader(section) for section in COMPARISON_SECTIONS}, counts=counts)
+
+
+def delete_comparison(supplier) -> None:
+	"""Remove the supplier's stored comparison, ignoring storage errors."""
+	storage = supplier.current_file.storage
+	for section in COMPARISON_SECTIONS:
+		try:
+			storage.delete(comparison_path(supplier, section))
+		except Exception as exc:
+			logger.warning('Failed to delete stored comparison %s for %s: %s', section, supplier.name, exc)
+
+
+def comparison_payload(supplier, result: ComparisonResult, key: str, old_file_name, new_file_name) -> Dict[str, Any]:
+	"""Session data describing a stored comparison: file names, row counts and its key."""
+	return {
+		'supplier_id': supplier.id,
+		'supplier_name': supplier.name,
+		'old_file_name': old_file_name,
+		'new_file_name': new_file_name,
+		'comparison_key': key,
+		'counts': result.counts(),
+	}
+
+
+def session_comparison(supplier, data: Dict[str, Any]) -> Optional[ComparisonResult]:
+	"""The comparison described by session `data`, or None if it is not for `supplier`."""
+	if not data or data.get('supplier_id') != supplier.id or not data.get('comparison_key'):
+		return None
+	return load_comparison(supplier, data['comparison_key'], data.get('counts'))
+
+
+def upload_last_comparison(
+	supplier,
+	result: ComparisonResult,
+	get_service: Optional[Callable[[], Any]] = None,
+) -> None:
+	"""Upload the comparison Excel to Supabase storage; errors propagate.
+
+	`get_service` builds the storage service; defaults to `get_supabase_storage_service`.
+	"""
+	service = (get_service or get_supabase_storage_service)()
+	excel_bytes = build_comparison_excel_bytes(result)
+	storage_path = last_comparison_path(supplier)
+	service.upload(storage_path, excel_bytes)
+	logger.info('Stored last comparison Excel for supplier %s at %s', supplier.name, storage_path)
+
+
+def queue_last_comparison(
+	supplier,
+	key: str,
+	result: ComparisonResult,
+	get_service: Optional[Callable[[], Any]] = None,
+) -> None:
+	"""Write the comparison Excel behind the caller; retries rebuild it from the comparison stored under `key`."""
+	submit(supplier, 'last_comparison', {'comparison_key': key}, (result, get_service))
+
+
+def _write_last_comparison(supplier, args: Dict[str, Any], payload) -> None:
+	if payload is not None:
+		result, get_service = payload
+	else:
+		result, get_service = load_comparison(supplier, args['comparison_key']), None
+	try:
+		upload_last_comparison(supplier, result, get_service)
+	except ComparisonUnavailableError as exc:
+		raise WriteSuperseded(str(exc)) from exc
+
+
+def _write_snapshot(supplier, args: Dict[str, Any], frame: Optional[pd.DataFrame]) -> None:
+	current = type(supplier).objects.filter(pk=supplier.pk).values_list('current_file_digest', flat=True).first()
+	if current != args['digest']:
+		raise WriteSuperseded('the stored file was replaced')
+	if frame is None:
+		supplier.refresh_from_db()
+		with supplier.current_file.open('rb') as fh:
+			frame = load_supplier_frame(supplier, fh)
+	write_snapshot(supplier, frame)
+
+
+def _write_version(supplier, args: Dict[str, Any], frame: Optional[pd.DataFrame]) -> None:
+	if frame is None:
+		# A retry rebuilds the frame from the stored file, which must still be this upload.
+		supplier.refresh_from_db()
+		if supplier.current_file_digest != args['digest']:
+			raise WriteSuperseded('the stored file was replaced')
+		with supplier.current_file.open('rb') as fh:
+			frame = load_supplier_frame(supplier, fh)
+	if record_version(supplier, frame, args['file_name']) is None:
+		raise RuntimeError('the version could not be recorded')
+
+
+register_handler('last_comparison', _write_last_comparison)
+register_handler('snapshot', _write_snapshot)
+register_handler('version', _write_version)
@@ -0,0 +1,187 @@
+"""Write-behind persistence of storage artifacts that no request waits for.
+
+`submit` records the write in the PendingWrite table and hands it to a
+bounded in-process queue drained by one background thread, so the caller
+returns without waiting for storage. The row makes the write durable: it is
+deleted once the write succeeds (or a newer write of the same kind
+supersedes it) and otherwise retried by `retry_pending_writes`. The
+`process_upload_jobs` worker runs it between jobs; without a worker,
+`manage.py retry_pending_writes` (run on a schedule) and `refresh_suppliers`
+do. Requests never retry, so a storage outage does not hold uploads. A write still failing after
+`MAX_WRITE_ATTEMPTS` is marked failed and shown on the comparison page.
+
+Each kind of write has a handler, registered by the module that submits it:
+`handler(supplier, args, payload)`. `payload` holds the in-memory data of a
+fresh write and is None on retries, which must rebuild it from `args`.
+Handlers raise `WriteSuperseded` when newer data made the write pointless.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_WRITE_BEHIND_QUEUE = 32
+# Seconds before a write is retried; doubled after every failed attempt.
+DEFAULT_WRITE_BEHIND_RETRY_DELAY = 60
+# Seconds the process waits at exit for queued writes to finish.
+DEFAULT_WRITE_BEHIND_FLUSH_TIMEOUT = 30
+MAX_WRITE_ATTEMPTS = 5
+
+
+class WriteSuperseded(Exception):
+	"""A newer write (or a deleted supplier) made this write unnecessary."""
+
+
+Handler = Callable[[Any, Dict[str, Any], Any], None]
+_handlers: Dict[str, Handler] = {}
+_queue: Optional[queue.Queue] = None
+_lock = threading.Lock()
+
+
+def register_handler(kind: str, handler: Handler) -> None:
+	"""Register the function that performs writes of `kind`."""
+	_handlers[kind] = handler
+
+
+def _retry_delay(attempts: int) -> timedelta:
+	base = getattr(settings, 'STOCK_WRITE_BEHIND_RETRY_DELAY', DEFAULT_WRITE_BEHIND_RETRY_DELAY)
+	return timedelta(seconds=base * 2 ** attempts)
+
+
+def _writer_queue() -> queue.Queue:
+	"""The process-wide queue, starting its writer thread on first use."""
+	global _queue
+	with _lock:
+		if _queue is None:
+			_queue = queue.Queue(maxsize=getattr(settings, 'STOCK_WRITE_BEHIND_QUEUE', DEFAULT_WRITE_BEHIND_QUEUE))
+			threading.Thread(target=_drain, args=(_queue,), name='stock-write-behind', daemon=True).start()
+			atexit.register(_flush_at_exit)
+		return _queue
+
+
+def _drain(writes: queue.Queue) -> None:
+	while True:
+		item = writes.get()
+		try:
+			_run(*item)
+		except Exception as exc:  # pragma: no cover - defensive, _run records failures
+			logger.exception('Write-behind thread failed: %s', exc)
+		finally:
+			# Database connections are per thread; do not keep one open while idle.
+			connections.close_all()
+			writes.task_done()
+
+
+def submit(supplier, kind: str, args: Dict[str, Any], payload: Any = None) -> None:
+	"""Persist a write of `kind` for `supplier` without waiting for it.
+
+	Older pending writes of the same kind are superseded. With
+	`settings.STOCK_WRITE_BEHIND` off, or when the queue is full, the write
+	runs in the calling thread; failures are recorded for retry either way.
+	"""
+	write = supplier.pending_writes.create(kind=kind, args=args, next_attempt_at=timezone.now() + _retry_delay(0))
+	supplier.pending_writes.filter(kind=kind, status='pending', pk__lt=write.pk).delete()
+	item = (write.pk, supplier, kind, args, payload)
+	if not getattr(settings, 'STOCK_WRITE_BEHIND', True):
+		_run(*item)
+		return
+	try:
+		_writer_queue().put_nowait(item)
+	except queue.Full:
+		logger.warning('Write-behind queue is full; writing %s for supplier %s inline', kind, supplier.name)
+		_run(*item)
+
+
+def _run(write_pk: int, supplier, kind: str, args: Dict[str, Any], payload: Any) -> bool:
+	"""Perform one write and update its row; return whether it is done."""
+	try:
+		_handlers[kind](supplier, args, payload)
+	except WriteSuperseded as exc:
+		logger.info('Skipped %s write for supplier %s: %s', kind, supplier.name, exc)
+		supplier.pending_writes.filter(pk=write_pk).delete()
+		return True
+	except Exception as exc:
+		_record_failure(write_pk, supplier, kind, exc)
+		return False
+	# A successful write also resolves earlier failures of the same kind.
+	supplier.pending_writes.filter(kind=kind, pk__lte=write_pk).delete()
+	logger.info('Stored %s for supplier %s', kind, supplier.name)
+	return True
+
+
+def _record_failure(write_pk: int, supplier, kind: str, exc: Exception) -> None:
+	write = supplier.pending_writes.filter(pk=write_pk).first()
+	if write is None:
+		return
+	write.attempts += 1
+	write.last_error = str(exc) or type(exc).__name__
+	if write.attempts >= MAX_WRITE_ATTEMPTS:
+		write.status = 'failed'
+		logger.error('Giving up on %s write for supplier %s after %d attempts: %s', kind, supplier.name, write.attempts, exc)
+	else:
+		write.next_attempt_at = timezone.now() + _retry_delay(write.attempts)
+		logger.warning('Failed to store %s for supplier %s (attempt %d, will retry): %s', kind, supplier.name, write.attempts, exc)
+	write.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at', 'updated_at'])
+
+
+def retry_pending_writes(limit: int = 50, supplier=None) -> int:
+	"""Retry up to `limit` due pending writes (of `supplier` only, when given), returning how many succeeded.
+
+	Writes are claimed with `SELECT ... FOR UPDATE SKIP LOCKED` and their next
+	attempt pushed back first, so concurrent workers do not retry the same one.
+	"""
+	# Imported here like in batch.py: services stay importable before `django.setup()`.
+	from ..models import PendingWrite
+
+	writes = PendingWrite.objects.filter(status='pending', next_attempt_at__lte=timezone.now())
+	if supplier is not None:
+		writes = writes.filter(supplier=supplier)
+	with transaction.atomic():
+		due = list(
+			writes.select_for_update(skip_locked=True)
+			.select_related('supplier')
+			.order_by('next_attempt_at')[:limit]
+		)
+		for write in due:
+			write.next_attempt_at = timezone.now() + _retry_delay(write.attempts)
+			write.save(update_fields=['next_attempt_at', 'updated_at'])
+	done = 0
+	for write in due:
+		if write.kind not in _handlers:
+			_record_failure(write.pk, write.supplier, write.kind, LookupError(f"No handler for '{write.kind}' writes."))
+			continue
+		done += _run(write.pk, write.supplier, write.kind, write.args, None)
+	if due:
+		logger.info('Retried %d pending writes; %d succeeded', len(due), done)
+	return done
+
+
+def flush(timeout: Optional[float] = None) -> bool:
+	"""Wait until queued writes are done; return False if `timeout` seconds passed first."""
+	if _queue is None:
+		return True
+	deadline = None if timeout is None else time.monotonic() + timeout
+	with _queue.all_tasks_done:
+		while _queue.unfinished_tasks:
+			remaining = None if deadline is None else deadline - time.monotonic()
+			if remaining is not None and remaining <= 0:
+				return False
+			_queue.all_tasks_done.wait(remaining)
+	return True
+
+
+def _flush_at_exit() -> None:
+	timeout = getattr(settings, 'STOCK_WRITE_BEHIND_FLUSH_TIMEOUT', DEFAULT_WRITE_BEHIND_FLUSH_TIMEOUT)
+	if not flush(timeout):
+		logger.warning('Exiting with unfinished write-behind writes; they will be retried from the database.')
@@ -1,4 +1,3 @@
-import io
 import logging
 from typing import Optional
 
@@ -14,6 +13,52 @@ from .services.supabase_storage import (
 logger = logging.getLogger(__name__)
 
 
+class SupabaseFile(File):
+	"""Read-only file whose content is downloaded from Supabase on first access.
+
+	The object is streamed into a spooled temporary file (see
+	`SupabaseStorageService.open_download`), so large files are buffered on
+	disk rather than in memory, and opening a file that is never read costs
+	no request. Download errors are raised by the first read.
+	"""
+
+	def __init__(self, name: str, service) -> None:
+		self._service = service
+		self._file = None
+		super().__init__(None, name)
+		self.mode = "rb"
+
+	@property
+	def file(self):
+		if self._file is None:
+			try:
+				self._file = self._service.open_download(self.name)
+			except SupabaseStorageError as exc:
+				logger.error("Failed to open '%s' from Supabase: %s", self.name, exc)
+				raise
+		return self._file
+
+	@file.setter
+	def file(self, value) -> None:
+		self._file = value
+
+	@property
+	def closed(self) -> bool:
+		return self._file is not None and self._file.closed
+
+	def open(self, mode=None):
+		if self.closed:
+			# Download again on the next read.
+			self._file = None
+		elif self._file is not None:
+			self._file.seek(0)
+		return self
+
+	def close(self) -> None:
+		if self._file is not None:
+			self._file.close()
+
+
 class SupabaseDjangoStorage(Storage):
 	"""Django Storage backend that stores files in Supabase Storage.
 
@@ -30,13 +75,7 @@ class SupabaseDjangoStorage(Storage):
 			raise
 
 	def _open(self, name: str, mode: str = "rb") -> File:  # type: ignore[override]
-		try:
-			data = self._service.download(name)
-		except SupabaseStorageError as exc:
-			logger.error("Failed to open '%s' from Supabase: %s", name, exc)
-			raise
-		buffer = io.BytesIO(data)
-		return File(buffer, name)
+		return SupabaseFile(name, self._service)
 
 	def _save(self, name: str, content) -> str:  # type: ignore[override]
 		stored_name = self._service.upload(name, content)
@@ -0,0 +1,229 @@
+"""Local stand-in for the Supabase Storage HTTP API, for tests and benchmarks.
+
+Serves the object endpoints `SupabaseStorageService` uses (PUT, GET and
+DELETE of objects) and the resumable (TUS) upload endpoint, from an
+in-process HTTP server on localhost. Faults can be injected to check that
+uploads resume after a failed part.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set
+
+OBJECT_PREFIX = "/storage/v1/object/"
+RESUMABLE_PATH = "/storage/v1/upload/resumable"
+_READ_BLOCK = 64 * 1024
+
+
+class StoredObject:
+    """Size, SHA-256 and (when kept) the bytes of a stored object."""
+
+    def __init__(self, keep_data: bool):
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._data = bytearray() if keep_data else None
+
+    def blocks(self, size: int):
+        """Yield the kept bytes in blocks of at most `size` bytes, without copying them whole."""
+        view = memoryview(self.data_buffer)
+        for start in range(0, len(view), size):
+            yield view[start:start + size]
+
+    @property
+    def data_buffer(self) -> bytearray:
+        if self._data is None:
+            raise AssertionError("This stub does not keep object data.")
+        return self._data
+
+    def write(self, block: bytes) -> None:
+        self.size += len(block)
+        self._digest.update(block)
+        if self._data is not None:
+            self._data.extend(block)
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    @property
+    def data(self) -> bytes:
+        return bytes(self.data_buffer)
+
+
+class _ResumableUpload:
+    def __init__(self, object_name: str, length: int, keep_data: bool):
+        self.object_name = object_name
+        self.length = length
+        self.content = StoredObject(keep_data)
+
+
+class SupabaseStub:
+    """Run the stand-in server; use as a context manager and point the service at `url`.
+
+    - `fail_patches`: 1-based numbers of PATCH requests that store only half
+      of their body and then answer 500, like a connection lost mid-part.
+    - `fail_puts`: number of initial PUT requests answered with 503.
+    """
+
+    def __init__(self, bucket: str = "bucket", keep_data: bool = True, fail_patches: Optional[Set[int]] = None, fail_puts: int = 0):
+        self.bucket = bucket
+        self.keep_data = keep_data
+        self.fail_patches = set(fail_patches or ())
+        self.fail_puts = fail_puts
+        self.objects: Dict[str, StoredObject] = {}
+        self.uploads: Dict[str, _ResumableUpload] = {}
+        # (method, path, request body size) of every request, in order
+        self.requests: List[tuple] = []
+        self._patches = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "SupabaseStub":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def methods(self) -> List[str]:
+        return [method for method, _path, _size in self.requests]
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):  # noqa: A002 - keep test output quiet
+                pass
+
+            def _reply(self, status: int, body: bytes = b"", headers: Optional[Dict[str, str]] = None) -> None:
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body and self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def _read_body(self, sink=None, limit: Optional[int] = None) -> int:
+                """Read the request body in blocks, writing at most `limit` bytes to `sink`."""
+                remaining = int(self.headers.get("Content-Length") or 0)
+                kept = 0
+                while remaining:
+                    block = self.rfile.read(min(_READ_BLOCK, remaining))
+                    if not block:
+                        break
+                    remaining -= len(block)
+                    if sink is not None and (limit is None or kept < limit):
+                        block = block if limit is None else block[:limit - kept]
+                        sink.write(block)
+                        kept += len(block)
+                return kept
+
+            def _record(self) -> None:
+                with stub._lock:
+                    stub.requests.append((self.command, self.path, int(self.headers.get("Content-Length") or 0)))
+
+            def _object_name(self) -> Optional[str]:
+                prefix = f"{OBJECT_PREFIX}{stub.bucket}/"
+                return self.path[len(prefix):] if self.path.startswith(prefix) else None
+
+            def do_PUT(self):
+                self._record()
+                name = self._object_name()
+                if name is None:
+                    return self._reply(404)
+                with stub._lock:
+                    fail = stub.fail_puts > 0
+                    stub.fail_puts -= fail
+                content = StoredObject(stub.keep_data)
+                self._read_body(content)
+                if fail:
+                    return self._reply(503, b"unavailable")
+                stub.objects[name] = content
+                self._reply(200, b'{"Key": "%s"}' % name.encode())
+
+            def do_GET(self):
+                self._record()
+                stored = stub.objects.get(self._object_name() or "")
+                if stored is None:
+                    return self._reply(404, b"not found")
+                self.send_response(200)
+                self.send_header("Content-Length", str(stored.size))
+                self.end_headers()
+                for block in stored.blocks(_READ_BLOCK):
+                    self.wfile.write(block)
+
+            def do_DELETE(self):
+                self._record()
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                for prefix in payload.get("prefixes", []):
+                    stub.objects.pop(prefix, None)
+                self._reply(200, b"[]")
+
+            def do_POST(self):
+                self._record()
+                self._read_body()
+                if self.path != RESUMABLE_PATH:
+                    return self._reply(404)
+                metadata = {}
+                for item in self.headers.get("Upload-Metadata", "").split(","):
+                    key, _sep, value = item.strip().partition(" ")
+                    metadata[key] = base64.b64decode(value).decode("utf-8")
+                if metadata.get("bucketName") != stub.bucket:
+                    return self._reply(404, b"bucket not found")
+                upload_id = uuid.uuid4().hex
+                stub.uploads[upload_id] = _ResumableUpload(
+                    metadata["objectName"], int(self.headers["Upload-Length"]), stub.keep_data,
+                )
+                self._reply(201, headers={"Location": f"{stub.url}{RESUMABLE_PATH}/{upload_id}", "Tus-Resumable": "1.0.0"})
+
+            def _upload(self) -> Optional[_ResumableUpload]:
+                return stub.uploads.get(self.path.rsplit("/", 1)[-1])
+
+            def do_HEAD(self):
+                self._record()
+                upload = self._upload()
+                if upload is None:
+                    return self._reply(404)
+                self._reply(200, headers={
+                    "Upload-Offset": str(upload.content.size),
+                    "Upload-Length": str(upload.length),
+                    "Tus-Resumable": "1.0.0",
+                })
+
+            def do_PATCH(self):
+                self._record()
+                upload = self._upload()
+                if upload is None:
+                    self._read_body()
+                    return self._reply(404)
+                if int(self.headers.get("Upload-Offset", -1)) != upload.content.size:
+                    self._read_body()
+                    return self._reply(409, b"offset mismatch")
+                with stub._lock:
+                    stub._patches += 1
+                    fail = stub._patches in stub.fail_patches
+                if fail:
+                    self._read_body(upload.content, limit=int(self.headers.get("Content-Length") or 0) // 2)
+                    return self._reply(500, b"connection lost")
+                self._read_body(upload.content)
+                if upload.content.size == upload.length:
+                    stub.objects[upload.object_name] = upload.content
+                self._reply(204, headers={"Upload-Offset": str(upload.content.size), "Tus-Resumable": "1.0.0"})
+
+        return Handler
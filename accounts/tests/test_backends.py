@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import importlib.util
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase, override_settings
+
+from accounts.services.backends import PandasBackend, get_backend
+from accounts.services.comparison_result import COMPARISON_SECTIONS
+from accounts.services.excel_compare import DiffRules, read_excel_dynamic
+from accounts.tests.utils import RAW_SHEET_COLUMNS as COLUMNS, make_excel_bytes, make_raw_sheet
+
+
+VOCABULARY = {"DISPONIBLE": 3, "POCAS UNIDADES": 1.5}
+
+
+def _next_day(raw: pd.DataFrame, seed: int) -> pd.DataFrame:
+    """`raw` with some stock and prices changed, rows dropped and rows added."""
+    rng = np.random.default_rng(seed)
+    raw = raw.copy()
+    changed = rng.random(len(raw)) < 0.05
+    raw.loc[changed, COLUMNS[1]] = rng.integers(0, 5, size=int(changed.sum())).astype(str)
+    repriced = rng.random(len(raw)) < 0.03
+    raw.loc[repriced, COLUMNS[2]] = "$ 1.234,50"
+    raw = raw[rng.random(len(raw)) > 0.02]
+    return pd.concat([raw, make_raw_sheet(len(raw) // 50, seed + 100)], ignore_index=True)
+
+
+# polars is in requirements.txt; only local runs without it skip the harness, never CI.
+@unittest.skipUnless(importlib.util.find_spec("polars") or os.environ.get("CI"), "polars is not installed")
+class BackendDifferentialTests(SimpleTestCase):
+    """The Polars backend must produce exactly what the pandas backend produces."""
+
+    def setUp(self):
+        self.pandas = get_backend("pandas")
+        self.polars = get_backend("polars")
+
+    def _normalize(self, backend, raw, **options):
+        return backend.normalize_columns(raw, *COLUMNS[:3], name_col=COLUMNS[3], **options)
+
+    def assertSameNormalized(self, raw, **options):
+        expected = self._normalize(self.pandas, raw, **options)
+        pd.testing.assert_frame_equal(self._normalize(self.polars, raw, **options), expected)
+        return expected
+
+    def assertSameComparison(self, old_df, new_df, rules=None):
+        expected = self.pandas.compare_stock(old_df, new_df, rules)
+        actual = self.polars.compare_stock(old_df, new_df, rules)
+        for section in COMPARISON_SECTIONS:
+            pd.testing.assert_frame_equal(actual[section], expected[section], obj=section)
+        return expected
+
+    def test_fixture_sheets_match(self):
+        day1 = read_excel_dynamic(make_excel_bytes([
+            {"id": "A1", "stock": 1, "name": "Prod A", "price": "1.234,50"},
+            {"id": "B2", "stock": "EN STOCK", "name": " Prod B ", "price": "$ 99"},
+            {"id": "A1", "stock": 2, "name": "", "price": None},
+            {"id": "C3", "stock": "AGOTADO", "price": "12.5"},
+        ]), COLUMNS[0])
+        day2 = read_excel_dynamic(make_excel_bytes([
+            {"id": "A1", "stock": 0, "name": "Prod A", "price": "1.234,50"},
+            {"id": "B2", "stock": "AGOTADO", "name": "Prod B", "price": "$ 100"},
+            {"id": "D4", "stock": 4, "name": "Prod D", "price": "7,25"},
+        ]), COLUMNS[0])
+        options = {"stock_in_text": "EN STOCK", "stock_out_text": "AGOTADO"}
+        old_df = self.assertSameNormalized(day1, **options)
+        new_df = self.assertSameNormalized(day2, **options)
+        result = self.assertSameComparison(old_df, new_df)
+        self.assertEqual(result["new_products"]["id"].tolist(), ["D4"])
+        self.assertSameComparison(None, new_df)
+        # Overflowing stock numbers are read as unusable text by both backends.
+        overflow = self.assertSameNormalized(pd.DataFrame({
+            COLUMNS[0]: ["A1", "B2"], COLUMNS[1]: ["1e400", "3"], COLUMNS[2]: ["1", "2"], COLUMNS[3]: ["a", "b"],
+        }))
+        self.assertEqual(overflow["stock"].tolist(), [0, 3])
+
+    def test_generated_large_sheets_match(self):
+        day1 = make_raw_sheet(20_000, seed=1)
+        day2 = _next_day(day1, seed=2)
+        for stock_agg in ("sum", "max", "first"):
+            for price_decimal in (None, ",", "."):
+                options = {
+                    "stock_in_text": "EN STOCK",
+                    "stock_out_text": "AGOTADO",
+                    "stock_vocabulary": VOCABULARY,
+                    "price_decimal": price_decimal,
+                    "stock_agg": stock_agg,
+                }
+                with self.subTest(stock_agg=stock_agg, price_decimal=price_decimal):
+                    old_df = self.assertSameNormalized(day1, **options)
+                    new_df = self.assertSameNormalized(day2, **options)
+        result = self.assertSameComparison(old_df, new_df)
+        self.assertTrue(all(result.count(section) for section in COMPARISON_SECTIONS))
+        self.assertSameComparison(old_df, new_df, DiffRules(min_price_change_pct=5, min_stock_change=3))
+        self.assertSameComparison(old_df, new_df, DiffRules(stock_transitions_only=True))
+
+    def test_non_text_columns_fall_back_to_pandas(self):
+        raw = pd.DataFrame({"ID": ["A", "B", "A"], "STOCK": [1, 2, 3], "PRECIO": [1.5, 2.0, None]})
+        expected = self.pandas.normalize_columns(raw, "ID", "STOCK", "PRECIO")
+        pd.testing.assert_frame_equal(self.polars.normalize_columns(raw, "ID", "STOCK", "PRECIO"), expected)
+        with self.assertRaisesMessage(ValueError, "Missing expected columns"):
+            self.polars.normalize_columns(raw, "ID", "STOCK", "PRECIO", name_col="DESC")
+
+
+class BackendSelectionTests(SimpleTestCase):
+    def test_backend_is_selected_through_settings(self):
+        with override_settings(STOCK_DATAFRAME_BACKEND="pandas"):
+            self.assertEqual(type(get_backend()), PandasBackend)
+        if importlib.util.find_spec("polars"):
+            with override_settings(STOCK_DATAFRAME_BACKEND="polars"):
+                self.assertEqual(get_backend().name, "polars")
+        with override_settings(STOCK_DATAFRAME_BACKEND="spark"):
+            with self.assertRaisesMessage(ValueError, "Unknown DataFrame backend 'spark'"):
+                get_backend()
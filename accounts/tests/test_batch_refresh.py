@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from accounts.models import Supplier
+from accounts.services.batch import load_manifest, run_batch
+from accounts.services.jobs import job_payload
+from accounts.services.snapshots import snapshot_path
+from accounts.services.supabase_storage import SupabaseStorageError
+from accounts.tests.utils import make_excel_bytes
+
+
+class _FakeSupabaseService:
+    def __init__(self):
+        self.uploads = []
+
+    def upload(self, path: str, content: bytes):
+        self.uploads.append((path, len(content)))
+        return path
+
+
+@override_settings(
+    DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+)
+class BatchRefreshTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="u1", password="pw")
+        self.suppliers = [
+            Supplier.objects.create(
+                owner=self.user,
+                name=f"Proveedor {i}",
+                product_id_column="COD. INTERNO",
+                stock_column="STOCK",
+                product_name_column="DESC",
+            )
+            for i in range(2)
+        ]
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def _write(self, name: str, rows, columns=("COD. INTERNO", "STOCK", "DESC")) -> str:
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as fh:
+            fh.write(make_excel_bytes(rows, columns=columns))
+        return path
+
+    def test_load_manifest_from_directory_and_files(self):
+        self._write("12.xlsx", [{"id": "A1", "stock": 1}])
+        self._write("notes.xlsx", [{"id": "A1", "stock": 1}])
+        self.assertEqual(load_manifest(self.tmp.name), {12: os.path.join(self.tmp.name, "12.xlsx")})
+
+        manifest = os.path.join(self.tmp.name, "manifest.json")
+        with open(manifest, "w") as fh:
+            json.dump({"7": "files/a.xlsx", "8": "/abs/b.csv"}, fh)
+        self.assertEqual(
+            load_manifest(manifest),
+            {7: os.path.join(self.tmp.name, "files/a.xlsx"), 8: "/abs/b.csv"},
+        )
+
+        listing = os.path.join(self.tmp.name, "manifest.csv")
+        with open(listing, "w") as fh:
+            fh.write("# supplier,file\n3,c.xlsx\nx,d.xlsx\n")
+        with self.assertRaises(ValueError):
+            load_manifest(listing)
+
+    @patch("accounts.services.uploads.get_supabase_storage_service", autospec=True)
+    def test_run_batch_persists_like_upload_and_reports_failures(self, mock_get_service):
+        service = _FakeSupabaseService()
+        mock_get_service.return_value = service
+        good, bad = self.suppliers
+        jobs = {
+            good.id: self._write("good.xlsx", [{"id": "A1", "stock": 1, "name": "Prod A"}]),
+            bad.id: self._write("bad.xlsx", [{"id": "A1", "stock": 1}], columns=("COD. INTERNO", "OTRA", "DESC")),
+        }
+        outcomes = run_batch(jobs, workers=1)
+
+        self.assertEqual([o.supplier_id for o in outcomes], [good.id, bad.id])
+        self.assertTrue(outcomes[0].ok)
+        self.assertEqual(outcomes[0].counts["new_products"], 1)
+        self.assertFalse(outcomes[1].ok)
+        self.assertIn("Missing expected columns", outcomes[1].error)
+
+        good.refresh_from_db()
+        self.assertEqual(good.last_uploaded_filename, "good.xlsx")
+        self.assertTrue(good.current_file_digest)
+        self.assertTrue(good.current_file.storage.exists(snapshot_path(good)))
+        self.assertEqual(
+            [path for path, _size in service.uploads],
+            [f"user_{self.user.id}/supplier_{good.id}/last_comparison.xlsx"],
+        )
+        # The comparison is stored like an upload's and can be opened from the job page.
+        job = good.upload_jobs.get(pk=outcomes[0].job_id)
+        self.assertEqual(job_payload(job)["counts"]["new_products"], 1)
+        bad.refresh_from_db()
+        self.assertFalse(bad.current_file)
+
+    def test_failed_excel_write_is_kept_for_retry(self):
+        good = self.suppliers[0]
+
+        class FailingService(_FakeSupabaseService):
+            def upload(self, path, content):
+                raise SupabaseStorageError("unavailable")
+
+        with patch("accounts.services.uploads.get_supabase_storage_service", FailingService):
+            outcomes = run_batch({good.id: self._write("good.xlsx", [{"id": "A1", "stock": 1, "name": "Prod A"}])}, workers=1)
+        self.assertTrue(outcomes[0].ok)
+        self.assertEqual(list(good.pending_writes.values_list("kind", flat=True)), ["last_comparison"])
+
+    def test_command_prints_report_and_fails_on_errors(self):
+        good, _bad = self.suppliers
+        self._write(f"{good.id}.xlsx", [{"id": "A1", "stock": 1, "name": "Prod A"}])
+        self._write("999.xlsx", [{"id": "A1", "stock": 1}])
+        out = StringIO()
+        with self.assertRaises(CommandError) as ctx:
+            call_command("refresh_suppliers", self.tmp.name, "--workers", "1", stdout=out)
+        self.assertIn("1 of 2 suppliers failed", str(ctx.exception))
+        self.assertIn(f"OK    {good.id} Proveedor 0", out.getvalue())
+        self.assertIn("FAIL  999", out.getvalue())
@@ -1,9 +1,34 @@
+import os
+from io import BytesIO
+from unittest.mock import patch
+
 import pandas as pd
 
+from django.core.paginator import Paginator
 from django.test import SimpleTestCase
 
-from accounts.services.excel_compare import read_excel_dynamic, normalize_columns, compare_stock
-from accounts.tests.utils import make_excel_bytes, DummyFile
+from accounts.services.excel_compare import (
+    STRING_DTYPE,
+    _find_header_row,
+    compile_stock_vocabulary,
+    parse_stock_vocabulary,
+    detect_file_format,
+    infer_decimal_separator,
+    parse_prices,
+    read_excel_dynamic,
+    read_sheet_with_layout,
+    normalize_columns,
+    normalize_columns_parallel,
+    compare_stock,
+    compact_frame,
+    DiffRules,
+    drop_unchanged_rows,
+    estimate_row_count,
+    read_sheet_chunks,
+)
+from accounts.services.comparison_result import ComparisonResult
+from accounts.services.external_compare import compare_stock_out_of_core
+from accounts.tests.utils import RAW_SHEET_COLUMNS, make_csv_bytes, make_excel_bytes, make_raw_sheet, DummyFile
 
 
 class ExcelCompareUnitTests(SimpleTestCase):
@@ -16,6 +41,125 @@ class ExcelCompareUnitTests(SimpleTestCase):
         with self.assertRaises(ValueError):
             read_excel_dynamic(excel_bytes, "COD. INTERNO")
 
+    def test_header_row_outside_scan_window_raises(self):
+        excel_bytes = make_excel_bytes(
+            [{"id": "A1", "stock": 1, "name": "Prod A"}],
+            header_row_index=10,
+            columns=("COD. INTERNO", "STOCK", "DESC"),
+        )
+        with self.assertRaises(ValueError) as ctx:
+            read_excel_dynamic(excel_bytes, "COD. INTERNO", max_header_rows=5)
+        self.assertIn("within the first 5 rows", str(ctx.exception))
+        df_raw = read_excel_dynamic(excel_bytes, "COD. INTERNO", max_header_rows=11)
+        self.assertEqual(df_raw["COD. INTERNO"].tolist(), ["A1"])
+
+    def test_find_header_row_is_case_insensitive_and_bounded(self):
+        raw = pd.DataFrame([[None, "Lista"], ["  cod. interno ", "STOCK"], ["A1", "1"]])
+        self.assertEqual(_find_header_row(raw, "COD. INTERNO"), 1)
+        self.assertIsNone(_find_header_row(raw, "COD. INTERNO", max_rows=1))
+
+    def test_stored_layout_skips_detection_and_detects_mismatch(self):
+        excel_bytes = make_excel_bytes(
+            [{"id": "A1", "stock": 1, "name": "Prod A"}],
+            columns=("COD. INTERNO", "STOCK", "DESC"),
+        )
+        cols = ["COD. INTERNO", "STOCK"]
+        df, layout = read_sheet_with_layout(excel_bytes, "COD. INTERNO", columns=cols)
+        self.assertEqual(layout.header_row, 4)
+        self.assertEqual(layout.columns, {"COD. INTERNO": 0, "STOCK": 1})
+
+        # A matching fingerprint reads the same data without rescanning.
+        with patch("accounts.services.excel_compare._find_header_row") as find:
+            df_fast, layout_fast = read_sheet_with_layout(excel_bytes, "COD. INTERNO", columns=cols, layout=layout)
+        find.assert_not_called()
+        self.assertTrue(df_fast.equals(df))
+        self.assertEqual(layout_fast, layout)
+
+        # The supplier moved the header: the stale fingerprint falls back to detection.
+        moved = make_excel_bytes(
+            [{"id": "A1", "stock": 1, "name": "Prod A"}],
+            header_row_index=2,
+            columns=("COD. INTERNO", "STOCK", "DESC"),
+        )
+        df_moved, layout_moved = read_sheet_with_layout(moved, "COD. INTERNO", columns=cols, layout=layout)
+        self.assertEqual(layout_moved.header_row, 2)
+        self.assertEqual(df_moved["COD. INTERNO"].tolist(), ["A1"])
+
+    def test_detect_file_format_from_magic_bytes(self):
+        self.assertEqual(detect_file_format(BytesIO(make_excel_bytes([{"id": "A1", "stock": 1}]))), "xlsx")
+        self.assertEqual(detect_file_format(BytesIO(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + b"\x00" * 8)), "xls")
+        self.assertEqual(detect_file_format(BytesIO(b"COD;STOCK\nA1;1\n")), "csv")
+
+    def test_read_xls_matches_excel_reader(self):
+        # fixtures/stock.xls is a BIFF8 workbook (written with xlwt) holding these rows
+        # below a title and blank rows, with the header on row 5.
+        rows = [
+            {"id": "A1", "stock": 5, "name": "Ñandú", "price": 1234.5},
+            {"id": "B2", "stock": "EN STOCK", "name": "Prod B", "price": "$ 1.234,50"},
+            {"id": 1001, "stock": 0, "name": "Numérico", "price": 10},
+            {"id": None, "stock": None, "name": None, "price": None},
+            {"id": "C3", "stock": 2, "name": "", "price": None},
+        ]
+        with open(os.path.join(os.path.dirname(__file__), "fixtures", "stock.xls"), "rb") as fh:
+            xls_bytes = fh.read()
+        self.assertEqual(detect_file_format(BytesIO(xls_bytes)), "xls")
+        cols = ["COD. INTERNO", "STOCK", "PRECIO", "DESC"]
+        from_xls, layout = read_sheet_with_layout(xls_bytes, "COD. INTERNO", columns=cols)
+        from_xlsx = read_excel_dynamic(make_excel_bytes(rows), "COD. INTERNO", columns=cols)
+        self.assertEqual(layout.header_row, 4)
+        self.assertEqual(list(from_xls.columns), cols)
+        self.assertEqual(from_xls["COD. INTERNO"].tolist(), ["A1", "B2", "1001", "C3"])
+        pd.testing.assert_frame_equal(
+            normalize_columns(from_xls, "COD. INTERNO", "STOCK", "PRECIO", "DESC"),
+            normalize_columns(from_xlsx, "COD. INTERNO", "STOCK", "PRECIO", "DESC"),
+        )
+        # Projection keeps only the requested columns.
+        projected = read_excel_dynamic(xls_bytes, "COD. INTERNO", columns=["COD. INTERNO", "STOCK"])
+        self.assertEqual(list(projected.columns), ["COD. INTERNO", "STOCK"])
+
+    def test_read_excel_treats_pandas_na_strings_as_missing(self):
+        rows = [
+            {"id": "A1", "stock": "NA", "name": "N/A", "price": "null"},
+            {"id": "NA", "stock": "None", "name": "nan", "price": "#N/A"},
+            {"id": "B2", "stock": "2", "name": "NULL", "price": "n/a"},
+            {"id": "C3", "stock": "-", "name": "Prod C", "price": "<NA>"},
+        ]
+        excel_bytes = make_excel_bytes(rows)
+        cols = ["COD. INTERNO", "STOCK", "DESC", "PRECIO"]
+        df = read_excel_dynamic(excel_bytes, "COD. INTERNO", columns=cols)
+        expected = pd.read_excel(BytesIO(excel_bytes), header=4, dtype=str)[cols].dropna(how="all")
+        self.assertEqual(
+            df.astype(object).where(df.notna(), None).values.tolist(),
+            expected.astype(object).where(expected.notna(), None).values.tolist(),
+        )
+
+    def test_read_delimited_matches_excel_reader(self):
+        rows = [
+            {"id": "A1", "stock": 1, "name": "Ñandú", "price": "1.234,50"},
+            {"id": "", "stock": "", "name": "", "price": ""},
+            {"id": "B2", "stock": "EN STOCK", "name": "Prod B", "price": "3"},
+        ]
+        cols = ["COD. INTERNO", "STOCK", "PRECIO", "DESC"]
+        from_excel = read_excel_dynamic(make_excel_bytes(rows), "COD. INTERNO", columns=cols)
+        for delimiter, encoding in ((";", "cp1252"), ("\t", "utf-8"), (",", "utf-8-sig")):
+            csv_bytes = make_csv_bytes(
+                [dict(r, price=r["price"].replace(",", "") if delimiter == "," else r["price"]) for r in rows],
+                delimiter=delimiter,
+                encoding=encoding,
+            )
+            df = read_excel_dynamic(csv_bytes, "COD. INTERNO", columns=cols)
+            self.assertEqual(list(df.columns), list(from_excel.columns))
+            self.assertEqual(df["COD. INTERNO"].tolist(), ["A1", "B2"])
+            self.assertEqual(df["DESC"].tolist(), ["Ñandú", "Prod B"])
+            self.assertEqual(df["STOCK"].tolist(), from_excel["STOCK"].tolist())
+
+    def test_read_delimited_keeps_ragged_rows_aligned(self):
+        data = b"COD;STOCK;DESC\nA1;1\nB2;2;Prod B;extra;more\n"
+        df = read_excel_dynamic(data, "COD", columns=["COD", "DESC"])
+        self.assertEqual(df["COD"].tolist(), ["A1", "B2"])
+        self.assertTrue(pd.isna(df["DESC"].iloc[0]))
+        self.assertEqual(df["DESC"].iloc[1], "Prod B")
+
     def test_separator_rows_filtered(self):
         # Separator-like row contains only one non-empty cell across relevant columns.
         df = pd.DataFrame(
@@ -54,6 +198,33 @@ class ExcelCompareUnitTests(SimpleTestCase):
         self.assertEqual(stocks["A1"], 1.0)
         self.assertEqual(stocks["B2"], 0.0)
 
+    def test_stock_vocabulary_maps_many_synonyms(self):
+        df = pd.DataFrame(
+            {
+                "COD. INTERNO": ["A1", "B2", "C3", "D4", "E5", "F6"],
+                "STOCK": [" en stock ", "Disponible", "CONSULTAR", "SIN STOCK", "7", "???"],
+            }
+        )
+        vocabulary = parse_stock_vocabulary("DISPONIBLE=5\nconsultar = 0,5\n\nSIN STOCK=0")
+        out = normalize_columns(
+            df,
+            product_id="COD. INTERNO",
+            stock_col="STOCK",
+            price_col=None,
+            stock_in_text="EN STOCK",
+            stock_vocabulary=vocabulary,
+        )
+        stocks = dict(zip(out["id"], out["stock"]))
+        self.assertEqual(stocks, {"A1": 1.0, "B2": 5.0, "C3": 0.5, "D4": 0.0, "E5": 7.0, "F6": 0.0})
+        self.assertEqual(out.set_index("id").loc["B2", "stock_raw"], "Disponible")
+
+    def test_parse_stock_vocabulary_rejects_malformed_lines(self):
+        with self.assertRaises(ValueError):
+            parse_stock_vocabulary("DISPONIBLE")
+        with self.assertRaises(ValueError):
+            parse_stock_vocabulary("DISPONIBLE=mucho")
+        self.assertEqual(compile_stock_vocabulary("Si", "Si", {" NO ": 0}), {"no": 0.0, "si": 1.0})
+
     def test_duplicate_ids_aggregate_stock(self):
         df = pd.DataFrame(
             {
@@ -66,6 +237,32 @@ class ExcelCompareUnitTests(SimpleTestCase):
         self.assertEqual(stocks["A1"], 3)
         self.assertEqual(stocks["B2"], 3)
 
+    def test_duplicate_ids_stock_aggregation_and_last_non_null(self):
+        df = pd.DataFrame(
+            {
+                "COD. INTERNO": ["A1", "A1", "A1", "B2"],
+                "STOCK": ["4", "9", "2", "3"],
+                "PRECIO": ["10", "12,5", None, "1"],
+                "DESC": ["Viejo", "Nuevo", "", "B"],
+            }
+        )
+        expected_stock = {"sum": 15, "max": 9, "first": 4}
+        for stock_agg, stock in expected_stock.items():
+            out = normalize_columns(
+                df,
+                product_id="COD. INTERNO",
+                stock_col="STOCK",
+                price_col="PRECIO",
+                name_col="DESC",
+                stock_agg=stock_agg,
+            ).set_index("id")
+            self.assertEqual(out.loc["A1", "stock"], stock)
+            self.assertEqual(out.loc["A1", "price_cents"], 1250)
+            self.assertEqual(out.loc["A1", "name"], "Nuevo")
+            self.assertEqual(out.loc["A1", "stock_raw"], "2")
+        with self.assertRaises(ValueError):
+            normalize_columns(df, product_id="COD. INTERNO", stock_col="STOCK", price_col=None, stock_agg="avg")
+
     def test_price_parsing_various_formats(self):
         df = pd.DataFrame(
             {
@@ -80,16 +277,98 @@ class ExcelCompareUnitTests(SimpleTestCase):
             stock_col="STOCK",
             price_col="PRECIO",
         )
-        prices = dict(zip(out["id"], out["price"]))
-        self.assertAlmostEqual(prices["A1"], 1234.50, places=2)
-        self.assertAlmostEqual(prices["B2"], 1234.50, places=2)
-        self.assertAlmostEqual(prices["C3"], 1234.50, places=2)
+        prices = dict(zip(out["id"], out["price_cents"]))
+        self.assertEqual(prices["A1"], 123450)
+        self.assertEqual(prices["B2"], 123450)
+        self.assertEqual(prices["C3"], 123450)
+
+    def test_parse_prices_matches_per_cell_reading_for_any_convention(self):
+        values = pd.Series(
+            ["$ 1.234,50", "1,234.50", "12,5", "12.5", "1.234.567", "1,234,567", "abc", "", None, "  7 ", "10:30 - 99,9", 3, 4.25],
+            dtype=object,
+        )
+        expected = [1234.5, 1234.5, 12.5, 12.5, None, None, None, None, None, 7.0, 10.0, 3.0, 4.25]
+        for decimal in (None, ",", "."):
+            parsed = parse_prices(values, decimal=decimal).tolist()
+            self.assertEqual(
+                [None if pd.isna(v) else v for v in parsed],
+                expected,
+                msg=f"decimal={decimal!r}",
+            )
+
+    def test_infer_decimal_separator(self):
+        self.assertEqual(infer_decimal_separator(pd.Series(["1.234,50", "12,00", "7"])), ",")
+        self.assertEqual(infer_decimal_separator(pd.Series(["1,234.50", "12.00", None])), ".")
+        self.assertIsNone(infer_decimal_separator(pd.Series(["7", "", None])))
 
     def test_empty_id_rows_removed(self):
         df = pd.DataFrame({"COD. INTERNO": ["A1", "", None], "STOCK": ["1", "2", "3"]})
         out = normalize_columns(df, product_id="COD. INTERNO", stock_col="STOCK", price_col=None)
         self.assertEqual(out["id"].tolist(), ["A1"])
 
+    def test_parallel_normalization_matches_serial(self):
+        raw = make_raw_sheet(6_000, seed=3)
+        options = {"name_col": "DESC", "stock_in_text": "EN STOCK", "stock_out_text": "AGOTADO", "stock_agg": "max"}
+        for price_decimal in (None, ","):
+            with self.subTest(price_decimal=price_decimal):
+                expected = normalize_columns(raw, *RAW_SHEET_COLUMNS[:3], price_decimal=price_decimal, **options)
+                actual = normalize_columns_parallel(
+                    raw, *RAW_SHEET_COLUMNS[:3], price_decimal=price_decimal, workers=2, chunk_rows=997, **options,
+                )
+                pd.testing.assert_frame_equal(actual, expected)
+        with self.assertRaisesMessage(ValueError, "Missing expected columns"):
+            normalize_columns_parallel(raw, "COD. INTERNO", "FALTA", None, workers=2, chunk_rows=997)
+
+    def test_normalized_frame_uses_compact_dtypes(self):
+        df = pd.DataFrame(
+            {
+                "COD. INTERNO": ["A1", "B2", "C3"],
+                "STOCK": ["3", "EN STOCK", "AGOTADO"],
+                "PRECIO": ["1.234,56", "", "0,1"],
+                "DESC": ["Prod A", None, "Prod C"],
+            }
+        )
+        out = normalize_columns(
+            df, product_id="COD. INTERNO", stock_col="STOCK", price_col="PRECIO", name_col="DESC",
+            stock_in_text="EN STOCK", stock_out_text="AGOTADO",
+        )
+        self.assertEqual(list(out.columns), ["id", "stock", "price_cents", "name", "stock_raw", "row_hash"])
+        self.assertEqual(out["row_hash"].dtype, "uint64")
+        self.assertEqual(out["id"].dtype, STRING_DTYPE)
+        self.assertEqual(out["name"].dtype, STRING_DTYPE)
+        self.assertEqual(out["stock_raw"].dtype, "category")
+        self.assertEqual(out["stock"].dtype, "int32")
+        self.assertEqual(out["price_cents"].dtype, "Int64")
+        self.assertEqual(out["price_cents"].tolist()[0::2], [123456, 10])
+        self.assertTrue(pd.isna(out["price_cents"].iloc[1]))
+
+    def test_compare_reports_prices_in_currency_units(self):
+        old = pd.DataFrame({"id": ["A1", "B2"], "stock": [1, 1], "price_cents": pd.array([1050, 200], dtype="Int64")})
+        new = pd.DataFrame({"id": ["A1", "B2", "C3"], "stock": [1, 1, 1], "price_cents": pd.array([1075, 200, 990], dtype="Int64")})
+        comp = compare_stock(old, new)
+        self.assertEqual(comp["price_changes"][["id", "old_price", "new_price"]].values.tolist(), [["A1", 10.5, 10.75]])
+        self.assertEqual(comp["new_products"]["price"].tolist(), [9.9])
+        self.assertNotIn("price_cents", comp["new_products"].columns)
+
+    def test_compare_converts_legacy_float_prices(self):
+        # A frame from before prices were stored as cents still reports price changes.
+        legacy = pd.DataFrame({"id": ["A1", "B2"], "stock": [1, 1], "price": [10.5, 2.0]})
+        new = pd.DataFrame({"id": ["A1", "B2"], "stock": [1, 1], "price_cents": pd.array([1075, 200], dtype="Int64")})
+        comp = compare_stock(legacy, new)
+        self.assertEqual(comp["price_changes"][["id", "old_price", "new_price"]].values.tolist(), [["A1", 10.5, 10.75]])
+        comp = compare_stock(new, legacy)
+        self.assertEqual(comp["price_changes"][["id", "old_price", "new_price"]].values.tolist(), [["A1", 10.75, 10.5]])
+
+    def test_overflowing_stock_is_not_cast_to_an_integer(self):
+        raw = pd.DataFrame({"ID": ["A1", "B2", "C3"], "STOCK": ["1e400", "-1e400", "2"]})
+        df = normalize_columns(raw, "ID", "STOCK", None, None)
+        # Like any other unreadable stock text, an overflowing number defaults to 0.
+        self.assertEqual(df["stock"].tolist(), [0, 0, 2])
+        compacted = compact_frame(pd.DataFrame({"id": ["A1", "B2", "C3"], "stock": [float("inf"), 3.0, 1e30]}))
+        self.assertEqual(compacted["stock"].dtype, "float64")
+        self.assertTrue(pd.isna(compacted["stock"][0]))
+        self.assertEqual(compacted["stock"][1:].tolist(), [3.0, 1e30])
+
     def test_compare_removed_vs_out_of_stock(self):
         old = pd.DataFrame({"id": ["A1", "B2"], "stock": [2, 1]})
         new = pd.DataFrame({"id": ["A1"], "stock": [0]})
@@ -100,6 +379,188 @@ class ExcelCompareUnitTests(SimpleTestCase):
         # No new products
         self.assertEqual(len(comp["new_products"]), 0)
 
+    def test_compare_classifies_every_row_in_one_alignment(self):
+        old = pd.DataFrame({
+            "id": ["A1", "B2", "C3", "D4"],
+            "stock": [3, 1, 5, 2],
+            "price_cents": pd.array([100, 200, None, 400], dtype="Int64"),
+            "name": ["a", "b", "c", "d"],
+        })
+        new = pd.DataFrame({
+            "id": ["E5", "C3", "A1", "D4"],
+            "stock": [1, 0, 3, 4],
+            "price_cents": pd.array([500, 300, 150, 400], dtype="Int64"),
+            "name": ["e", "c2", "a2", "d2"],
+        })
+        comp = compare_stock(old, new)
+        self.assertEqual(
+            comp["removed_or_out_of_stock"][["id", "old_stock", "name"]].values.tolist(),
+            [["B2", 1, "b"], ["C3", 5, "c2"]],
+        )
+        self.assertEqual(comp["new_products"]["id"].tolist(), ["E5"])
+        self.assertEqual(
+            comp["stock_changes"][["id", "old_stock", "new_stock", "name"]].values.tolist(),
+            [["C3", 5, 0, "c2"], ["D4", 2, 4, "d2"]],
+        )
+        # C3 had no previous price, so it is not a price change
+        self.assertEqual(comp["price_changes"][["id", "old_price", "new_price"]].values.tolist(), [["A1", 1.0, 1.5]])
+
+    def test_compare_applies_diff_rules(self):
+        old = pd.DataFrame({
+            "id": ["A1", "B2", "C3", "D4", "E5"],
+            "stock": [10, 10, 1, 0, 3],
+            "price_cents": pd.array([1000, 1000, 0, 500, 100], dtype="Int64"),
+        })
+        new = pd.DataFrame({
+            "id": ["A1", "B2", "C3", "D4", "E5"],
+            "stock": [12, 30, 0, 2, 0],
+            "price_cents": pd.array([1040, 1100, 50, 500, 100], dtype="Int64"),
+        })
+
+        comp = compare_stock(old, new, DiffRules(min_price_change_pct=5, min_stock_change=5))
+        # A1 moves 2 units and 4%; C3/D4/E5 cross in/out of stock despite small moves.
+        self.assertEqual(comp["stock_changes"]["id"].tolist(), ["B2", "C3", "D4", "E5"])
+        self.assertEqual(comp["price_changes"]["id"].tolist(), ["B2", "C3"])
+        # Out-of-stock transitions are reported regardless of the rules.
+        self.assertEqual(comp["removed_or_out_of_stock"]["id"].tolist(), ["C3", "E5"])
+
+        transitions = compare_stock(old, new, DiffRules(stock_transitions_only=True))
+        self.assertEqual(transitions["stock_changes"]["id"].tolist(), ["C3", "D4", "E5"])
+        self.assertEqual(len(transitions["price_changes"]), 3)
+
+        out_of_core = compare_stock_out_of_core([old], [new], rules=DiffRules(min_price_change_pct=5, min_stock_change=5))
+        self.assertEqual(out_of_core["stock_changes"]["id"].tolist(), ["B2", "C3", "D4", "E5"])
+        self.assertEqual(out_of_core["price_changes"]["id"].tolist(), ["B2", "C3"])
+
+    def test_compare_skips_rows_with_matching_fingerprints(self):
+        raw = pd.DataFrame({
+            "ID": ["A1", "B2", "C3", "D4"],
+            "S": ["1", "2", "3", "4"],
+            "P": ["1,00", "2,00", "3,00", "4,00"],
+        })
+        old = normalize_columns(raw, product_id="ID", stock_col="S", price_col="P")
+        raw.loc[1, "S"] = "0"
+        raw.loc[2, "P"] = "3,50"
+        new = normalize_columns(raw.iloc[1:], product_id="ID", stock_col="S", price_col="P")
+        # Only B2, C3 and the removed A1 differ; D4 is dropped before alignment
+        changed_old, changed_new = drop_unchanged_rows(old, new)
+        self.assertEqual(changed_old["id"].tolist(), ["A1", "B2", "C3"])
+        self.assertEqual(changed_new["id"].tolist(), ["B2", "C3"])
+
+        fast = compare_stock(old, new)
+        full = compare_stock(old.drop(columns="row_hash"), new.drop(columns="row_hash"))
+        for section in full:
+            self.assertEqual(fast[section].values.tolist(), full[section].values.tolist(), section)
+        self.assertNotIn("row_hash", compare_stock(None, new)["new_products"].columns)
+
+    def test_read_sheet_chunks_matches_full_read(self):
+        rows = [{"id": f"A{i}", "stock": i % 3, "name": f"Prod {i}", "price": "1,50"} for i in range(7)]
+        rows.insert(3, {"id": "", "stock": "", "name": "", "price": ""})
+        cols = ["COD. INTERNO", "STOCK", "PRECIO", "DESC"]
+        for data in (make_excel_bytes(rows), make_csv_bytes(rows)):
+            full = read_excel_dynamic(data, "COD. INTERNO", columns=cols)
+            frames, layout = read_sheet_chunks(data, "COD. INTERNO", columns=cols, chunk_rows=3)
+            chunks = list(frames)
+            self.assertGreater(len(chunks), 1)
+            self.assertTrue(all(len(c) <= 3 for c in chunks))
+            self.assertTrue(pd.concat(chunks, ignore_index=True).equals(full))
+            self.assertEqual(layout.columns["STOCK"], 1)
+            # Preamble and header rows are counted too
+            self.assertGreaterEqual(estimate_row_count(data), len(rows) + 1)
+
+    def test_out_of_core_compare_matches_in_memory(self):
+        old_raw = pd.DataFrame({
+            "ID": ["A1", "B2", "C3", "A1", "D4", "E5"],
+            "S": ["1", "2", "3", "4", "5", "0"],
+            "P": ["1,00", "2,00", "3,00", "1,50", "4,00", "5,00"],
+        })
+        new_raw = pd.DataFrame({
+            "ID": ["F6", "C3", "A1", "D4", "A1", "E5"],
+            "S": ["1", "0", "3", "5", "2", "0"],
+            "P": ["6,00", "3,00", "1,50", "4,50", "1,00", "5,00"],
+        })
+
+        def normalize(raw):
+            return normalize_columns(raw, product_id="ID", stock_col="S", price_col="P", stock_agg="max")
+
+        def chunks(raw):
+            # A1 is split across chunks on both sides
+            return (normalize(raw.iloc[i:i + 2]) for i in range(0, len(raw), 2))
+
+        def records(frame):
+            return frame.astype(object).where(frame.notna(), None).values.tolist()
+
+        expected = compare_stock(normalize(old_raw), normalize(new_raw))
+        actual = compare_stock_out_of_core(chunks(old_raw), chunks(new_raw), stock_agg="max", buffer_rows=2)
+        for section, frame in expected.items():
+            frame = frame.sort_values("id", kind="stable", ignore_index=True)
+            spilled = actual[section].sort_values("id", kind="stable", ignore_index=True)
+            self.assertEqual(list(spilled.columns), list(frame.columns), section)
+            self.assertEqual(records(spilled), records(frame), section)
+        # Blocks follow each other in id order and together hold every row.
+        block_ids = [block["stock_changes"]["id"].tolist() for block in actual.blocks()]
+        self.assertGreater(len(block_ids), 1)
+        self.assertEqual(sum(block_ids, []), sorted(actual["stock_changes"]["id"]))
+
+        first = compare_stock_out_of_core(None, chunks(new_raw), stock_agg="max")
+        self.assertEqual(first["new_products"]["id"].tolist(), ["A1", "C3", "D4", "E5", "F6"])
+        self.assertEqual(first["new_products"]["stock"].tolist(), [3, 0, 5, 0, 1])
+
+    def test_out_of_core_compare_spills_sections_lazily(self):
+        old = normalize_columns(pd.DataFrame({"ID": ["A1", "B2"], "STOCK": ["1", "2"]}), "ID", "STOCK", None, None)
+
+        result = compare_stock_out_of_core([old], [old])
+        self.assertEqual(result.counts(), {section: 0 for section in result})
+        # Empty sections keep the columns of the in-memory comparison.
+        for section, frame in compare_stock(old, old).items():
+            self.assertEqual(list(result[section].columns), list(frame.columns), section)
+
+        changed = normalize_columns(pd.DataFrame({"ID": ["A1", "B2"], "STOCK": ["3", "2"]}), "ID", "STOCK", None, None)
+        result = compare_stock_out_of_core([old], [changed])
+        directory = result._directory
+        self.assertEqual(result.count("stock_changes"), 1)
+        self.assertNotIn("stock_changes", result._frames)
+        self.assertEqual(result["stock_changes"]["id"].tolist(), ["A1"])
+        del result
+        self.assertFalse(os.path.exists(directory))
+
+    def test_out_of_core_compare_with_an_empty_side_keeps_in_memory_columns(self):
+        raw = pd.DataFrame({"ID": ["A1", "B2"], "S": ["1", "2"], "P": ["1,00", "2,00"], "N": ["a", "b"]})
+        full = normalize_columns(raw, "ID", "S", "P", "N")
+        empty = full.iloc[:0]
+        for old, new in ((empty, full), (full, empty), (empty, empty), (None, empty)):
+            expected = compare_stock(old, new)
+            actual = compare_stock_out_of_core(None if old is None else [old], [new])
+            for section, frame in expected.items():
+                self.assertEqual(list(actual[section].columns), list(frame.columns), section)
+                self.assertEqual(len(actual[section]), len(frame), section)
+
+    def test_comparison_result_counts_and_slices_lazily(self):
+        old = normalize_columns(pd.DataFrame({"ID": ["A1", "B2", "C3"], "STOCK": ["1", "2", "3"]}), "ID", "STOCK", None, None)
+        new = normalize_columns(pd.DataFrame({"ID": ["A1"], "STOCK": ["1"]}), "ID", "STOCK", None, None)
+        comp = compare_stock(old, new)
+        self.assertIsInstance(comp, ComparisonResult)
+        self.assertEqual(comp.counts()["removed_or_out_of_stock"], 2)
+        self.assertEqual(comp.records("removed_or_out_of_stock", 1), [{"id": "C3", "old_stock": 3, "new_stock": None}])
+
+        loads = []
+
+        def load():
+            loads.append(1)
+            return pd.DataFrame({"id": [f"P{i}" for i in range(5)]})
+
+        empty = pd.DataFrame(columns=["id"])
+        lazy = ComparisonResult(
+            {"removed_or_out_of_stock": empty, "new_products": load, "stock_changes": empty, "price_changes": empty},
+            counts={"new_products": 5},
+        )
+        paginator = Paginator(lazy.section_records("new_products"), 2)
+        self.assertEqual(paginator.num_pages, 3)
+        self.assertEqual(loads, [])
+        self.assertEqual([r["id"] for r in paginator.get_page(3)], ["P4"])
+        self.assertEqual([r["id"] for r in lazy.iter_records("new_products", batch_rows=2)], [f"P{i}" for i in range(5)])
+        self.assertEqual(loads, [1])
+
     def test_read_excel_dynamic_accepts_non_seekable_stream(self):
         excel_bytes = make_excel_bytes(
             [{"id": "A1", "stock": 1, "name": "Prod A"}],
@@ -109,6 +570,23 @@ class ExcelCompareUnitTests(SimpleTestCase):
         df_raw = read_excel_dynamic(stream, "COD. INTERNO")
         self.assertIn("COD. INTERNO", list(df_raw.columns))
 
+    def test_read_excel_dynamic_projects_requested_columns(self):
+        excel_bytes = make_excel_bytes(
+            [
+                {"id": "A1", "stock": 1, "name": "Prod A", "price": 10.5},
+                {"id": None, "stock": None, "name": "", "price": ""},
+                {"id": "B2", "stock": 0, "name": "Prod B", "price": 3},
+            ],
+            columns=("COD. INTERNO", "STOCK", "DESC", "PRECIO"),
+        )
+        df_raw = read_excel_dynamic(excel_bytes, "cod. interno", columns=["COD. INTERNO", "STOCK", "PRECIO", "FALTA"])
+        # Unknown columns are skipped so normalize_columns can report them.
+        self.assertEqual(list(df_raw.columns), ["COD. INTERNO", "STOCK", "PRECIO"])
+        # Fully empty rows are dropped and values are rendered as strings.
+        self.assertEqual(df_raw["COD. INTERNO"].tolist(), ["A1", "B2"])
+        self.assertEqual(df_raw["STOCK"].tolist(), ["1", "0"])
+        self.assertEqual(df_raw["PRECIO"].tolist(), ["10.5", "3"])
+
     def test_normalize_columns_missing_expected_columns_raises(self):
         df = pd.DataFrame({"COD. INTERNO": ["A1"], "OTRA": ["x"]})
         with self.assertRaises(ValueError) as ctx:
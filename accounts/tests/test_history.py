@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import threading
+from unittest.mock import patch
+
+import pandas as pd
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from accounts.models import Supplier
+from accounts.services import history
+from accounts.services.excel_compare import compare_stock, normalize_columns
+from accounts.services.history import compact_history, compare_versions, load_version, record_version, version_path
+from accounts.services.uploads import session_comparison
+from accounts.tests.utils import make_excel_bytes
+
+
+class _FakeSupabaseService:
+    def upload(self, path: str, content: bytes):
+        return path
+
+
+def _frame(stocks, prices=None):
+    raw = pd.DataFrame({
+        "ID": list(stocks),
+        "STOCK": [str(v) for v in stocks.values()],
+        "PRECIO": [str((prices or {}).get(k, 1)) for k in stocks],
+    })
+    return normalize_columns(raw, "ID", "STOCK", "PRECIO", None)
+
+
+def _records(frame):
+    frame = frame.sort_values("id", ignore_index=True)
+    return frame.astype(object).where(frame.notna(), None).to_dict("records")
+
+
+@override_settings(
+    DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+    STOCK_HISTORY_CHECKPOINT_EVERY=3,
+    STOCK_HISTORY_MAX_VERSIONS=0,
+)
+class SupplierHistoryTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="u1", password="pw")
+        self.supplier = Supplier.objects.create(
+            owner=self.user,
+            name="Proveedor",
+            product_id_column="COD. INTERNO",
+            stock_column="STOCK",
+            product_name_column="DESC",
+        )
+
+    def _record_all(self):
+        frames = [
+            _frame({f"P{i}": 5 for i in range(10)}),
+            _frame({**{f"P{i}": 5 for i in range(10)}, "P1": 0}),
+            _frame({**{f"P{i}": 5 for i in range(1, 10)}, "P1": 0, "N1": 2}),
+            _frame({**{f"P{i}": 5 for i in range(1, 10)}, "P1": 3, "N1": 2}, prices={"P1": 2}),
+            _frame({**{f"P{i}": 5 for i in range(1, 10)}, "N1": 2}),
+        ]
+        for i, frame in enumerate(frames, start=1):
+            self.assertIsNotNone(record_version(self.supplier, frame, f"dia{i}.xlsx"))
+        return frames
+
+    def test_versions_are_stored_as_deltas_and_rebuilt(self):
+        frames = self._record_all()
+        versions = {v.number: v for v in self.supplier.versions.all()}
+        # Checkpoints at 1 and every 3 versions; the rest hold only changed rows.
+        self.assertEqual([n for n, v in sorted(versions.items()) if v.is_checkpoint], [1, 4])
+        self.assertEqual(versions[2].stored_rows, 1)
+        self.assertEqual(versions[3].stored_rows, 2)  # N1 added, P0 deleted
+
+        for number, frame in enumerate(frames, start=1):
+            self.assertEqual(_records(load_version(self.supplier, number)), _records(frame), number)
+
+        comp = compare_versions(self.supplier, 1, 3)
+        expected = compare_stock(frames[0], frames[2])
+        for section in ("removed_or_out_of_stock", "new_products", "stock_changes"):
+            self.assertEqual(sorted(comp[section]["id"].tolist()), sorted(expected[section]["id"].tolist()), section)
+
+    def test_compaction_keeps_recent_versions_rebuildable(self):
+        frames = self._record_all()
+        self.assertEqual(compact_history(self.supplier, max_versions=2), 3)
+        self.assertEqual(sorted(self.supplier.versions.values_list("number", flat=True)), [4, 5])
+        storage = self.supplier.current_file.storage
+        self.assertFalse(storage.exists(version_path(self.supplier, 3)))
+        self.assertEqual(_records(load_version(self.supplier, 5)), _records(frames[4]))
+
+    @patch("accounts.views.get_supabase_storage_service", autospec=True)
+    def test_history_view_compares_two_uploaded_versions(self, mock_get_service):
+        mock_get_service.return_value = _FakeSupabaseService()
+        self.client.login(username="u1", password="pw")
+        upload_url = reverse("supplier_upload", args=[self.supplier.id])
+        columns = ("COD. INTERNO", "STOCK", "DESC")
+        for name, rows in (
+            ("lunes.xlsx", [{"id": "A1", "stock": 1, "name": "A"}, {"id": "B2", "stock": 4, "name": "B"}]),
+            ("martes.xlsx", [{"id": "A1", "stock": 2, "name": "A"}]),
+            ("miercoles.xlsx", [{"id": "A1", "stock": 2, "name": "A"}, {"id": "C3", "stock": 1, "name": "C"}]),
+        ):
+            f = SimpleUploadedFile(name, make_excel_bytes(rows, columns=columns))
+            self.client.post(upload_url, {"file": f})
+        self.assertEqual(self.supplier.versions.count(), 3)
+
+        history_url = reverse("supplier_history", args=[self.supplier.id])
+        resp = self.client.get(history_url)
+        self.assertContains(resp, "martes.xlsx")
+
+        resp = self.client.post(history_url, {"old_version": 1, "new_version": 3})
+        self.assertRedirects(resp, reverse("supplier_comparison", args=[self.supplier.id]))
+        data = self.client.session["comparison_results"]
+        self.assertEqual(data["old_file_name"], "lunes.xlsx (v1)")
+        comparison = session_comparison(self.supplier, data)
+        self.assertEqual([r["id"] for r in comparison.records("removed_or_out_of_stock")], ["B2"])
+        self.assertEqual([r["id"] for r in comparison.records("new_products")], ["C3"])
+        self.assertEqual([r["id"] for r in comparison.records("stock_changes")], ["A1"])
+
+        resp = self.client.post(history_url, {"old_version": 2, "new_version": 2})
+        self.assertEqual(resp.status_code, 200)
+
+
+@override_settings(
+    DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+    STOCK_HISTORY_MAX_VERSIONS=0,
+)
+class ConcurrentHistoryTests(TransactionTestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username="u1", password="pw")
+        self.supplier = Supplier.objects.create(owner=user, name="Proveedor", product_id_column="ID", stock_column="STOCK")
+
+    def test_overlapping_saves_get_distinct_versions(self):
+        base, first, second = _frame({"A": 1, "B": 1}), _frame({"A": 0, "B": 1}), _frame({"A": 1, "B": 0, "C": 2})
+        self.assertIsNotNone(record_version(self.supplier, base, "base.xlsx"))
+        write_version = history._write_version
+        other, started = [], threading.Event()
+
+        def run_other_save():
+            try:
+                other.append(record_version(Supplier.objects.get(pk=self.supplier.pk), second, "second.xlsx"))
+            finally:
+                connections.close_all()
+
+        def write_after_other_save(supplier, number, frame, kind):
+            # The second save runs to completion while the first is about to write its file.
+            if not started.is_set():
+                started.set()
+                thread = threading.Thread(target=run_other_save)
+                thread.start()
+                thread.join(timeout=30)
+            write_version(supplier, number, frame, kind)
+
+        with patch.object(history, "_write_version", write_after_other_save):
+            version = record_version(self.supplier, first, "first.xlsx")
+
+        self.assertEqual((version.number, other[0].number), (2, 3))
+        names = dict(self.supplier.versions.values_list("number", "file_name"))
+        self.assertEqual(names, {1: "base.xlsx", 2: "first.xlsx", 3: "second.xlsx"})
+        for number, frame in ((1, base), (2, first), (3, second)):
+            self.assertEqual(_records(load_version(self.supplier, number)), _records(frame))
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import io
+import os
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from accounts.services.excel_compare import _coerce_excel_buffer, read_excel_dynamic
+from accounts.services.supabase_storage import SupabaseStorageError, SupabaseStorageService
+from accounts.storage_backends import SupabaseDjangoStorage
+from accounts.tests.supabase_stub import SupabaseStub
+from accounts.tests.utils import make_excel_bytes
+
+CHUNK = 64 * 1024
+
+
+class _TrackingReader(io.BytesIO):
+    """A file object that records how much each read asked for."""
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.reads = []
+
+    def read(self, size=-1):
+        self.reads.append(size)
+        return super().read(size)
+
+
+class _UnseekableReader:
+    def __init__(self, data: bytes):
+        self._buffer = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self._buffer.read(size)
+
+
+class SupabaseUploadTests(SimpleTestCase):
+    def _service(self, stub, **options):
+        options = {"chunk_size": CHUNK, "resumable_threshold": 2 * CHUNK, "retry_backoff": 0, **options}
+        return SupabaseStorageService(base_url=stub.url, api_key="key", bucket=stub.bucket, **options)
+
+    def assertBoundedReads(self, reader):
+        self.assertTrue(reader.reads)
+        self.assertTrue(all(size is not None and 0 <= size <= CHUNK for size in reader.reads), reader.reads)
+
+    def test_small_upload_streams_one_put(self):
+        data = os.urandom(CHUNK + 123)
+        reader = _TrackingReader(data)
+        with SupabaseStub(fail_puts=1) as stub:
+            self.assertEqual(self._service(stub).upload("/user_1/stock.xlsx", reader), "user_1/stock.xlsx")
+        self.assertEqual(stub.objects["user_1/stock.xlsx"].data, data)
+        self.assertEqual(stub.methods(), ["PUT", "PUT"])  # the 503 is retried
+        self.assertBoundedReads(reader)
+        self.assertEqual(reader.tell(), 0)
+
+    def test_large_upload_is_sent_in_resumable_parts(self):
+        data = os.urandom(5 * CHUNK + 10)
+        reader = _TrackingReader(data)
+        with SupabaseStub() as stub:
+            self._service(stub).upload("user_1/big.xlsx", reader)
+        self.assertEqual(stub.objects["user_1/big.xlsx"].data, data)
+        self.assertEqual(stub.methods(), ["POST"] + ["PATCH"] * 6)
+        self.assertTrue(all(size <= CHUNK for method, _path, size in stub.requests if method == "PATCH"))
+        self.assertBoundedReads(reader)
+
+    def test_failed_part_resumes_from_server_offset(self):
+        data = os.urandom(4 * CHUNK)
+        with SupabaseStub(fail_patches={2, 3}) as stub:
+            self._service(stub).upload("user_1/big.xlsx", io.BytesIO(data))
+        self.assertEqual(stub.objects["user_1/big.xlsx"].data, data)
+        self.assertEqual(stub.methods(), ["POST", "PATCH", "PATCH", "HEAD", "PATCH", "HEAD", "PATCH", "PATCH", "PATCH"])
+        # Resumed parts only send what the server is missing.
+        patch_sizes = [size for method, _path, size in stub.requests if method == "PATCH"]
+        self.assertEqual(patch_sizes[:4], [CHUNK, CHUNK, CHUNK // 2, CHUNK // 4])
+
+    def test_unseekable_content_and_bytes_are_uploaded(self):
+        data = os.urandom(3 * CHUNK)
+        with SupabaseStub() as stub:
+            service = self._service(stub)
+            service.upload("a.bin", _UnseekableReader(data))
+            service.upload("b.bin", data[:100])
+            service.upload("c.txt", "hola")
+        self.assertEqual(stub.objects["a.bin"].data, data)
+        self.assertEqual(stub.objects["b.bin"].data, data[:100])
+        self.assertEqual(stub.objects["c.txt"].data, b"hola")
+
+    def test_gives_up_after_retries(self):
+        with SupabaseStub(fail_patches=set(range(1, 10))) as stub:
+            with self.assertRaisesMessage(SupabaseStorageError, "Failed to upload file to Supabase."):
+                self._service(stub, max_retries=2).upload("big.bin", os.urandom(3 * CHUNK))
+        self.assertEqual(stub.methods().count("PATCH"), 3)
+        self.assertNotIn("big.bin", stub.objects)
+
+
+class SupabaseDownloadTests(SimpleTestCase):
+    def _service(self, stub):
+        return SupabaseStorageService(base_url=stub.url, api_key="key", bucket=stub.bucket, download_spool_size=CHUNK)
+
+    def test_download_is_spooled_to_disk_past_the_threshold(self):
+        small, large = os.urandom(100), os.urandom(3 * CHUNK + 5)
+        with SupabaseStub() as stub:
+            service = self._service(stub)
+            service.upload("small.bin", small)
+            service.upload("large.bin", large)
+            with service.open_download("small.bin") as fh:
+                self.assertFalse(fh._rolled)
+                self.assertEqual(fh.read(), small)
+            with service.open_download("large.bin") as fh:
+                self.assertTrue(fh._rolled)
+                self.assertEqual(fh.read(), large)
+            with self.assertRaisesMessage(SupabaseStorageError, "File not found in Supabase."):
+                service.open_download("missing.bin")
+
+    def test_storage_files_are_downloaded_on_first_read_and_parsed_in_place(self):
+        excel_bytes = make_excel_bytes([{"id": "A1", "stock": 1, "name": "Prod A", "price": 10}])
+        with SupabaseStub() as stub:
+            service = self._service(stub)
+            service.upload("user_1/stock.xlsx", excel_bytes)
+            with patch("accounts.storage_backends.get_supabase_storage_service", lambda: service):
+                storage = SupabaseDjangoStorage()
+            missing = storage.open("user_1/missing.xlsx", "rb")
+            with storage.open("user_1/stock.xlsx", "rb") as fh:
+                self.assertEqual(stub.methods(), ["PUT"])  # nothing downloaded yet
+                self.assertIs(_coerce_excel_buffer(fh), fh)
+                df_raw = read_excel_dynamic(fh, "COD. INTERNO")
+            self.assertTrue(fh.closed)
+            self.assertEqual(df_raw["COD. INTERNO"].tolist(), ["A1"])
+            self.assertEqual(stub.methods(), ["PUT", "GET"])
+            with self.assertRaisesMessage(SupabaseStorageError, "File not found in Supabase."):
+                missing.read()
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import ProductChange, Supplier
+from accounts.services.excel_compare import compare_stock, normalize_columns
+from accounts.services.timeseries import _copy_batch, change_rows, changes_between, product_history, record_changes
+from accounts.tests.utils import make_excel_bytes
+
+
+class _FakeSupabaseService:
+    def upload(self, path: str, content: bytes):
+        return path
+
+
+class _CopyCursor:
+    def __init__(self):
+        self.statements = []
+
+    def copy_expert(self, sql, buffer):
+        self.statements.append((sql, buffer.read()))
+
+
+def _frame(rows):
+    raw = pd.DataFrame(rows, columns=["ID", "STOCK", "PRECIO"]).astype(str)
+    return normalize_columns(raw, "ID", "STOCK", "PRECIO", None)
+
+
+@override_settings(
+    DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+    STOCK_TIMESERIES_BATCH_ROWS=2,
+)
+class ProductTimeSeriesTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="u1", password="pw")
+        self.supplier = Supplier.objects.create(
+            owner=self.user,
+            name="Proveedor",
+            product_id_column="COD. INTERNO",
+            stock_column="STOCK",
+            price_column="PRECIO",
+        )
+
+    def test_only_changed_products_are_recorded_and_queried(self):
+        day1 = _frame([("A1", 5, 10), ("B2", 3, 20), ("C3", 1, 30), ("D4", 2, 40)])
+        day2 = _frame([("A1", 5, 10), ("B2", 0, 20), ("C3", 4, 35), ("E5", 7, 50)])
+        start = timezone.now() - timedelta(days=7)
+        self.assertEqual(record_changes(self.supplier, compare_stock(None, day1), start), 4)
+        yesterday = timezone.now() - timedelta(days=1)
+        self.assertEqual(record_changes(self.supplier, compare_stock(day1, day2), yesterday), 4)
+
+        latest = {c.product_id: c for c in changes_between(self.supplier, yesterday)}
+        self.assertEqual(sorted(latest), ["B2", "C3", "D4", "E5"])  # A1 did not change
+        self.assertEqual((latest["B2"].status, latest["B2"].stock, latest["B2"].price), ("changed", 0, None))
+        self.assertEqual((latest["C3"].stock, latest["C3"].price), (4, Decimal("35.00")))
+        self.assertEqual((latest["D4"].status, latest["D4"].stock), ("removed", None))
+        self.assertEqual((latest["E5"].status, latest["E5"].price), ("new", Decimal("50.00")))
+
+        history = list(product_history(self.supplier, "C3").values_list("stock", "price"))
+        self.assertEqual(history, [(4, Decimal("35.00")), (1, Decimal("30.00"))])
+        self.assertEqual(product_history(self.supplier, "C3", since=yesterday).count(), 1)
+        self.assertEqual(changes_between(self.supplier, start, yesterday).count(), 4)
+
+    def test_copy_batch_writes_null_for_unchanged_values(self):
+        rows = change_rows(compare_stock(_frame([("A1", 5, 10)]), _frame([("A1", 2, 10)])))
+        cursor = _CopyCursor()
+        _copy_batch(cursor, ProductChange._meta.db_table, ["product_id", "status", "stock", "price"], rows)
+        sql, data = cursor.statements[0]
+        self.assertIn('FROM STDIN WITH (FORMAT csv)', sql)
+        self.assertEqual(data, "A1,changed,2.0,\n")
+
+    def test_postgres_copy_receives_escaped_csv_in_column_order(self):
+        old = _frame([('A,1', 5, 10), ('B"2', 3, 20), ("C3", 1, 30)])
+        new = _frame([('A,1', 2, 10), ('B"2', 3, 25), ("D\n4", 7, 50)])
+        recorded_at = timezone.now()
+        cursor = _CopyCursor()
+        connection = MagicMock(vendor="postgresql")
+        connection.ops.quote_name = lambda name: f'"{name}"'
+        connection.cursor.return_value.__enter__.return_value = cursor
+        with patch("accounts.services.timeseries.connection", connection):
+            self.assertEqual(record_changes(self.supplier, compare_stock(old, new), recorded_at), 4)
+
+        # STOCK_TIMESERIES_BATCH_ROWS=2: two COPY statements of two rows each.
+        self.assertEqual(len(cursor.statements), 2)
+        columns = '"supplier_id", "recorded_at", "product_id", "status", "stock", "price"'
+        for sql, _data in cursor.statements:
+            self.assertEqual(sql, f'COPY "accounts_productchange" ({columns}) FROM STDIN WITH (FORMAT csv)')
+        at, sid = recorded_at.isoformat(), self.supplier.id
+        self.assertEqual(
+            "".join(data for _sql, data in cursor.statements),
+            f'{sid},{at},"A,1",changed,2.0,\n'        # price unchanged: empty unquoted field is NULL
+            f'{sid},{at},"B""2",changed,,25.0\n'      # quotes are doubled
+            f'{sid},{at},C3,removed,,\n'
+            f'{sid},{at},"D\n4",new,7.0,50.0\n',     # embedded newline stays inside quotes
+        )
+
+    @patch("accounts.views.get_supabase_storage_service", autospec=True)
+    def test_upload_appends_changed_products(self, mock_get_service):
+        mock_get_service.return_value = _FakeSupabaseService()
+        self.client.login(username="u1", password="pw")
+        upload_url = reverse("supplier_upload", args=[self.supplier.id])
+        for name, rows in (
+            ("lunes.xlsx", [{"id": "A1", "stock": 1, "price": 10}, {"id": "B2", "stock": 4, "price": 5}]),
+            ("martes.xlsx", [{"id": "A1", "stock": 2, "price": 10}, {"id": "B2", "stock": 4, "price": 5}]),
+        ):
+            f = SimpleUploadedFile(name, make_excel_bytes(rows))
+            self.client.post(upload_url, {"file": f})
+        self.assertEqual(self.supplier.product_changes.count(), 3)
+        self.assertEqual(list(product_history(self.supplier, "A1").values_list("stock", flat=True)), [2, 1])
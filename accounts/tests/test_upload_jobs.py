@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Supplier, UploadJob
+from accounts.services.jobs import (
+    ABANDONED_ERROR,
+    MAX_JOB_ATTEMPTS,
+    STAGE_COMPARING,
+    STAGE_SAVING,
+    claim_next_job,
+    requeue_stale_jobs,
+)
+from accounts.tests.utils import make_excel_bytes
+
+
+class _FakeSupabaseService:
+    def upload(self, path: str, content: bytes):
+        return path
+
+
+@override_settings(
+    DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+    STOCK_UPLOAD_JOBS_EAGER=False,
+)
+@patch("accounts.services.uploads.get_supabase_storage_service", lambda: _FakeSupabaseService())
+class UploadJobQueueTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="u1", password="pw")
+        self.client.login(username="u1", password="pw")
+        self.supplier = Supplier.objects.create(
+            owner=self.user,
+            name="Proveedor",
+            product_id_column="COD. INTERNO",
+            stock_column="STOCK",
+            price_column="PRECIO",
+        )
+
+    def _upload(self, content: bytes, filename: str = "stock.xlsx"):
+        url = reverse("supplier_upload", args=[self.supplier.id])
+        return self.client.post(url, {"file": SimpleUploadedFile(filename, content)})
+
+    def _process(self):
+        call_command("process_upload_jobs", "--once", stdout=StringIO())
+
+    def test_upload_is_queued_and_shown_once_processed(self):
+        resp = self._upload(make_excel_bytes([{"id": "A1", "stock": 1, "price": 10}]), "lunes.xlsx")
+        job = self.supplier.upload_jobs.get()
+        job_url = reverse("supplier_upload_job", args=[self.supplier.id, job.id])
+        status_url = reverse("supplier_upload_job_status", args=[self.supplier.id, job.id])
+        self.assertRedirects(resp, job_url)
+        self.assertEqual((job.status, job.original_name), ("queued", "lunes.xlsx"))
+        self.assertTrue(job.file_name.endswith(".xlsx"))
+        # Nothing is compared or saved until a worker runs.
+        self.supplier.refresh_from_db()
+        self.assertFalse(self.supplier.current_file)
+        self.assertEqual(self.client.get(status_url).json()["status"], "queued")
+        self.assertContains(self.client.get(job_url), status_url)
+
+        self._process()
+        job.refresh_from_db()
+        self.assertEqual(self.client.get(status_url).json()["status"], "done")
+        self.assertEqual(job.counts["new_products"], 1)
+        self.assertFalse(self.supplier.current_file.storage.exists(job.file_name))
+
+        resp = self.client.get(job_url)
+        self.assertRedirects(resp, reverse("supplier_comparison", args=[self.supplier.id]))
+        session_data = self.client.session["comparison_results"]
+        self.assertEqual((session_data["new_file_name"], session_data["old_file_name"]), ("lunes.xlsx", None))
+        self.supplier.refresh_from_db()
+        self.assertEqual(self.supplier.last_uploaded_filename, "lunes.xlsx")
+
+        self._upload(make_excel_bytes([{"id": "A1", "stock": 0, "price": 10}]), "martes.xlsx")
+        self._process()
+        job = self.supplier.upload_jobs.first()
+        self.client.get(reverse("supplier_upload_job", args=[self.supplier.id, job.id]))
+        session_data = self.client.session["comparison_results"]
+        self.assertEqual((session_data["new_file_name"], session_data["old_file_name"]), ("martes.xlsx", "lunes.xlsx"))
+        self.assertEqual(session_data["counts"]["removed_or_out_of_stock"], 1)
+
+    def test_failed_job_reports_its_error(self):
+        self._upload(make_excel_bytes([{"id": "A1", "stock": 1}], columns=("COD. INTERNO", "SIN_STOCK")))
+        self._process()
+        job = self.supplier.upload_jobs.get()
+        self.assertEqual(job.status, "failed")
+        self.assertIn("Missing expected columns", job.error)
+
+        resp = self.client.get(reverse("supplier_upload_job", args=[self.supplier.id, job.id]), follow=True)
+        self.assertRedirects(resp, reverse("supplier_upload", args=[self.supplier.id]))
+        self.assertTrue(any("Missing expected columns" in str(m) for m in resp.context["messages"]))
+
+    def test_jobs_of_other_users_are_hidden(self):
+        self._upload(make_excel_bytes([{"id": "A1", "stock": 1}]))
+        job = self.supplier.upload_jobs.get()
+        get_user_model().objects.create_user(username="u2", password="pw")
+        self.client.login(username="u2", password="pw")
+        resp = self.client.get(reverse("supplier_upload_job_status", args=[self.supplier.id, job.id]))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_claims_oldest_queued_job_once(self):
+        first = self.supplier.upload_jobs.create(file_name="a.xlsx", original_name="a.xlsx")
+        second = self.supplier.upload_jobs.create(file_name="b.xlsx", original_name="b.xlsx")
+        claimed = claim_next_job("worker-1")
+        self.assertEqual(claimed.pk, first.pk)
+        self.assertEqual((claimed.status, claimed.worker, claimed.attempts), ("running", "worker-1", 1))
+        self.assertEqual(claim_next_job("worker-2").pk, second.pk)
+        self.assertIsNone(claim_next_job("worker-3"))
+
+    def test_abandoned_jobs_are_requeued_or_failed(self):
+        long_ago = timezone.now() - timedelta(hours=2)
+        comparing = self.supplier.upload_jobs.create(file_name="a.xlsx", original_name="a.xlsx", status="running", stage=STAGE_COMPARING, attempts=1, started_at=long_ago)
+        saving = self.supplier.upload_jobs.create(file_name="b.xlsx", original_name="b.xlsx", status="running", stage=STAGE_SAVING, attempts=1, started_at=long_ago)
+        exhausted = self.supplier.upload_jobs.create(file_name="c.xlsx", original_name="c.xlsx", status="running", stage=STAGE_COMPARING, attempts=MAX_JOB_ATTEMPTS, started_at=long_ago)
+        recent = self.supplier.upload_jobs.create(file_name="d.xlsx", original_name="d.xlsx", status="running", stage=STAGE_COMPARING, attempts=1, started_at=timezone.now())
+
+        self.assertEqual(requeue_stale_jobs(timeout=60), 1)
+        statuses = dict(UploadJob.objects.values_list("pk", "status"))
+        self.assertEqual(
+            [statuses[job.pk] for job in (comparing, saving, exhausted, recent)],
+            ["queued", "failed", "failed", "running"],
+        )
+        saving.refresh_from_db()
+        self.assertEqual(saving.error, ABANDONED_ERROR)
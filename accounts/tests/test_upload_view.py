@@ -1,14 +1,20 @@
 from __future__ import annotations
 
+import threading
 from io import BytesIO
 from unittest.mock import patch
 
+import pandas as pd
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from accounts.models import Supplier
+from accounts.services.history import version_path
+from accounts.services.snapshots import snapshot_path
+from accounts.services import uploads
+from accounts.services.uploads import comparison_path, session_comparison
 from accounts.tests.utils import make_excel_bytes
 
 
@@ -21,8 +27,8 @@ class _FakeSupabaseService:
         self.uploads.append((path, len(content)))
         return path
 
-    def download(self, path: str) -> bytes:  # pragma: no cover
-        raise AssertionError("download() should not be called in these view tests")
+    def open_download(self, path: str):  # pragma: no cover
+        raise AssertionError("open_download() should not be called in these view tests")
 
     def delete(self, path: str) -> None:  # pragma: no cover
         return
@@ -30,7 +36,6 @@ class _FakeSupabaseService:
 
 @override_settings(
     DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
-    MEDIA_ROOT="/tmp/stacktracker-test-media",
 )
 class SupplierUploadViewTests(TestCase):
     def setUp(self):
@@ -55,6 +60,10 @@ class SupplierUploadViewTests(TestCase):
         )
         return self.client.post(url, {"file": f}, follow=True)
 
+    def _comparison(self):
+        self.supplier.refresh_from_db()
+        return session_comparison(self.supplier, self.client.session.get("comparison_results"))
+
     @patch("accounts.views.get_supabase_storage_service", autospec=True)
     def test_first_upload_no_previous_file(self, mock_get_service):
         mock_get_service.return_value = _FakeSupabaseService()
@@ -72,6 +81,21 @@ class SupplierUploadViewTests(TestCase):
         session_data = self.client.session.get("comparison_results")
         self.assertEqual(session_data.get("supplier_id"), self.supplier.id)
 
+    @patch("accounts.views.get_supabase_storage_service", autospec=True)
+    def test_eager_upload_is_not_staged_in_storage(self, mock_get_service):
+        mock_get_service.return_value = _FakeSupabaseService()
+        excel_bytes = make_excel_bytes(
+            [{"id": "A1", "stock": 1, "name": "Prod A"}],
+            columns=("COD. INTERNO", "STOCK", "DESC"),
+        )
+        with patch("accounts.views.enqueue_upload") as enqueue, \
+                patch("accounts.services.jobs.File") as staged_file:
+            self._upload(excel_bytes, filename="primero.xlsx")
+        enqueue.assert_not_called()
+        staged_file.assert_not_called()
+        job = self.supplier.upload_jobs.get()
+        self.assertEqual((job.status, job.file_name), ("done", ""))
+
     @patch("accounts.views.get_supabase_storage_service", autospec=True)
     def test_second_upload_uses_previous_file(self, mock_get_service):
         mock_get_service.return_value = _FakeSupabaseService()
@@ -99,7 +123,7 @@ class SupplierUploadViewTests(TestCase):
         self.assertEqual(session_data.get("supplier_id"), self.supplier.id)
         self.assertEqual(session_data.get("new_file_name"), "segundo.xlsx")
         # must not treat all as "new" products
-        self.assertEqual(len(session_data.get("new_products") or []), 0)
+        self.assertEqual(session_data["counts"]["new_products"], 0)
 
     @patch("accounts.views.get_supabase_storage_service", autospec=True)
     def test_when_previous_file_corrupt_it_shows_error_and_aborts(self, mock_get_service):
@@ -112,11 +136,13 @@ class SupplierUploadViewTests(TestCase):
         )
         self._upload(base_bytes, filename="base.xlsx")
 
-        # Corrupt the stored current_file on disk by overwriting it with junk
+        # Corrupt the stored current_file on disk by overwriting it with junk,
+        # and drop its parsed snapshot so the file itself has to be read.
         self.supplier.refresh_from_db()
         stored_path = self.supplier.current_file.path
         with open(stored_path, "wb") as fh:
             fh.write(b"NOT AN EXCEL")
+        self.supplier.current_file.storage.delete(snapshot_path(self.supplier))
 
         # Upload a new valid Excel; the view should fail while reading previous and not proceed.
         new_bytes = make_excel_bytes(
@@ -167,3 +193,250 @@ class SupplierUploadViewTests(TestCase):
         # Should not overwrite previous stored file.
         with open(stored_path, "rb") as fh:
             self.assertEqual(fh.read(), old_content)
+
+        # A large upload is rejected before the previous file is spilled to disk.
+        with override_settings(STOCK_OUT_OF_CORE_ROWS=1), \
+                patch("accounts.services.ingestion.compare_stock_out_of_core") as compare:
+            resp = self._upload(bad_bytes, filename="sin_columna.xlsx")
+        compare.assert_not_called()
+        self.assertTrue(any("Missing expected columns" in str(m) for m in resp.context.get("messages")))
+
+    @patch("accounts.views.get_supabase_storage_service", autospec=True)
+    def test_upload_stores_layout_and_settings_edit_clears_it(self, mock_get_service):
+        mock_get_service.return_value = _FakeSupabaseService()
+        excel_bytes = make_excel_bytes(
+            [{"id": "A1", "stock": 1, "name": "Prod A"}],
+            columns=("COD. INTERNO", "STOCK", "DESC"),
+        )
+        self._upload(excel_bytes)
+        self.supplier.refresh_from_db()
+        self.assertEqual(self.supplier.layout_header_row, 4)
+        self.assertEqual(self.supplier.layout_columns, {"COD. INTERNO": 0, "STOCK": 1, "DESC": 2})
+        self.assertTrue(self.supplier.layout_header_hash)
+
+        url = reverse("supplier_settings", args=[self.supplier.id])
+        self.client.post(url, {
+            "product_id_column": "COD. INTERNO",
+            "product_name_column": "DESC",
+            "stock_column": "STOCK",
+            "price_column": "PRECIO",
+            "stock_aggregation": "sum",
+        })
+        self.supplier.refresh_from_db()
+        self.assertEqual(self.supplier.price_column, "PRECIO")
+        self.assertIsNone(self.supplier.layout_header_row)
+        self.assertIsNone(self.supplier.layout_header_hash)
+
+    @patch("accounts.views.get_supabase_storage_service", autospec=True)
+    def test_diff_rules_filter_changes_and_keep_layout(self, mock_get_service):
+        mock_get_service.return_value = _FakeSupabaseService()
+        columns = ("COD. INTERNO", "STOCK", "DESC")
+        self._upload(make_excel_bytes(
+            [{"id": "A1", "stock": 10, "name": "Prod A"}, {"id": "B2", "stock": 10, "name": "Prod B"}],
+            columns=columns,
+        ))
+
+        # Diff rules only filter results, so they keep the learned layout.
+        self.client.post(reverse("supplier_settings", args=[self.supplier.id]), {
+            "product_id_column": "COD. INTERNO",
+            "product_name_column": "DESC",
+            "stock_column": "STOCK",
+            "stock_aggregation": "sum",
+            "min_stock_change": "5",
+        })
+        self.supplier.refresh_from_db()
+        self.assertEqual(self.supplier.min_stock_change, 5)
+        self.assertEqual(self.supplier.layout_header_row, 4)
+
+        self._upload(make_excel_bytes(
+            [{"id": "A1", "stock": 12, "name": "Prod A"}, {"id": "B2", "stock": 20, "name": "Prod B"}],
+            columns=columns,
+        ))
+        self.assertEqual([r["id"] for r in self._comparison().records("stock_changes")], ["B2"])
+
+    @patch("accounts.views.get_supabase_storage_service", autospec=True)
+    def test_second_upload_reads_previous_snapshot_instead_of_file(self, mock_get_service):
+        mock_get_service.return_value = _FakeSupabaseService()
+        base_bytes = make_excel_bytes(
+            [{"id": "A1", "stock": 1, "name": "Prod A"}],
+            columns=("COD. INTERNO", "STOCK", "DESC"),
+        )
+        self._upload(base_bytes, filename="base.xlsx")
+        self.supplier.refresh_from_db()
+        self.assertTrue(self.supplier.current_file_digest)
+        self.assertTrue(self.supplier.current_file.storage.exists(snapshot_path(self.supplier)))
+
+        # The stored file is unreadable, but the snapshot still describes it.
+        with open(self.supplier.current_file.path, "wb") as fh:
+            fh.write(b"NOT AN EXCEL")
+
+        new_bytes = make_excel_bytes(
+            [{"id": "A1", "stock": 0, "name": "Prod A"}],
+            columns=("COD. INTERNO", "STOCK", "DESC"),
+        )
+        self._upload(new_bytes, filename="nuevo.xlsx")
+        session_data = self.client.session.get("comparison_results")
+        self.assertEqual(session_data.get("new_file_name"), "nuevo.xlsx")
+        self.assertEqual([r["id"] for r in self._comparison().records("removed_or_out_of_stock")], ["A1"])
+
+    @patch("accounts.views.get_supabase_storage_service", autospec=True)
+    def test_previous_file_is_read_while_upload_is_parsed(self, mock_get_service):
+        mock_get_service.return_value = _FakeSupabaseService()
+        columns = ("COD. INTERNO", "STOCK", "DESC")
+        self._upload(make_excel_bytes([{"id": "A1", "stock": 1, "name": "Prod A"}], columns=columns), filename="base.xlsx")
+
+        new_side_started = threading.Event()
+        seen = {}
+        load_previous_frame = uploads.load_previous_frame
+        load_supplier_frame = uploads.load_supplier_frame
+
+        def previous_side(supplier):
+            # Only returns in time if the upload is being parsed at the same moment.
+            seen["overlapped"] = new_side_started.wait(timeout=10)
+            seen["thread"] = threading.current_thread().name
+            return load_previous_frame(supplier)
+
+        def new_side(supplier, file_obj):
+            new_side_started.set()
+            return load_supplier_frame(supplier, file_obj)
+
+        with patch("accounts.services.uploads.load_previous_frame", previous_side), \
+                patch("accounts.services.uploads.load_supplier_frame", new_side), \
+                self.assertLogs("accounts.services.uploads", level="INFO") as logs:
+            self._upload(make_excel_bytes([{"id": "A1", "stock": 0, "name": "Prod A"}], columns=columns), filename="nuevo.xlsx")
+        self.assertTrue(seen["overlapped"])
+        self.assertTrue(seen["thread"].startswith("stock-fetch"))
+        self.assertTrue(any("previous=" in line and "concurrent" in line for line in logs.output))
+        self.assertEqual([r["id"] for r in self._comparison().records("removed_or_out_of_stock")], ["A1"])
+
+    @patch("accounts.views.get_supabase_storage_service", autospec=True)
+    def test_previous_file_error_wins_over_upload_error(self, mock_get_service):
+        mock_get_service.return_value = _FakeSupabaseService()
+        columns = ("COD. INTERNO", "STOCK", "DESC")
+        self._upload(make_excel_bytes([{"id": "A1", "stock": 1, "name": "Prod A"}], columns=columns), filename="base.xlsx")
+        self.supplier.refresh_from_db()
+        with open(self.supplier.current_file.path, "wb") as fh:
+            fh.write(b"NOT AN EXCEL")
+        self.supplier.current_file.storage.delete(snapshot_path(self.supplier))
+
+        bad_bytes = make_excel_bytes([{"id": "A1", "stock": 0}], columns=("COD. INTERNO", "SIN_STOCK"))
+        for threads in (0, 2):
+            with self.subTest(threads=threads), override_settings(STOCK_FETCH_THREADS=threads):
+                resp = self._upload(bad_bytes, filename="nuevo.xlsx")
+                msgs = [str(m) for m in resp.context.get("messages")]
+                self.assertTrue(any("No se pudo leer el archivo anterior" in m for m in msgs))
+
+    @patch("accounts.views.get_supabase_storage_service", autospec=True)
+    def test_config_change_makes_snapshot_stale(self, mock_get_service):
+        mock_get_service.return_value = _FakeSupabaseService()
+        base_bytes = make_excel_bytes(
+            [{"id": "A1", "stock": 1, "name": "Prod A"}],
+            columns=("COD. INTERNO", "STOCK", "DESC"),
+        )
+        self._upload(base_bytes, filename="base.xlsx")
+
+        # Changing the parsing config invalidates the snapshot, so the stored
+        # (here corrupted) file is read again and the upload is aborted.
+        self.supplier.refresh_from_db()
+        with open(self.supplier.current_file.path, "wb") as fh:
+            fh.write(b"NOT AN EXCEL")
+        self.supplier.stock_aggregation = "max"
+        self.supplier.save(update_fields=["stock_aggregation"])
+
+        resp = self._upload(base_bytes, filename="nuevo.xlsx")
+        msgs = list(resp.context.get("messages"))
+        self.assertTrue(any("No se pudo leer el archivo anterior" in str(m) for m in msgs))
+
+    @patch("accounts.views.get_supabase_storage_service", autospec=True)
+    def test_large_upload_is_compared_out_of_core(self, mock_get_service):
+        mock_get_service.return_value = _FakeSupabaseService()
+        base_bytes = make_excel_bytes(
+            [
+                {"id": "A1", "stock": 1, "name": "Prod A"},
+                {"id": "B2", "stock": 1, "name": "Prod B"},
+            ],
+            columns=("COD. INTERNO", "STOCK", "DESC"),
+        )
+        self._upload(base_bytes, filename="base.xlsx")
+
+        new_bytes = make_excel_bytes(
+            [
+                {"id": "C3", "stock": 2, "name": "Prod C"},
+                {"id": "A1", "stock": 0, "name": "Prod A"},
+            ],
+            columns=("COD. INTERNO", "STOCK", "DESC"),
+        )
+        with override_settings(STOCK_OUT_OF_CORE_ROWS=1, STOCK_CHUNK_ROWS=1), \
+                patch("accounts.services.uploads.load_supplier_frame") as load_frame:
+            self._upload(new_bytes, filename="grande.xlsx")
+        load_frame.assert_not_called()
+
+        session_data = self.client.session.get("comparison_results")
+        self.assertEqual(session_data.get("new_file_name"), "grande.xlsx")
+        comparison = self._comparison()
+        self.assertEqual(sorted(r["id"] for r in comparison.records("removed_or_out_of_stock")), ["A1", "B2"])
+        self.assertEqual([r["id"] for r in comparison.records("new_products")], ["C3"])
+        # No merged frame exists, so the previous snapshot is dropped rather than left stale.
+        self.supplier.refresh_from_db()
+        self.assertFalse(self.supplier.current_file.storage.exists(snapshot_path(self.supplier)))
+
+    @override_settings(COMPARISON_PAGE_ROWS=1)
+    @patch("accounts.views.get_supabase_storage_service", autospec=True)
+    def test_comparison_page_and_export_read_stored_sections(self, mock_get_service):
+        mock_get_service.return_value = _FakeSupabaseService()
+        rows = [
+            {"id": "A1", "stock": 1, "name": "Prod A"},
+            {"id": "B2", "stock": 1, "name": "Prod B"},
+        ]
+        self._upload(make_excel_bytes(rows, columns=("COD. INTERNO", "STOCK", "DESC")), filename="base.xlsx")
+        resp = self._upload(make_excel_bytes([{"id": "C3", "stock": 1, "name": "Prod C"}],
+                                             columns=("COD. INTERNO", "STOCK", "DESC")), filename="nuevo.xlsx")
+
+        # The session holds counts and a key, not rows.
+        session_data = self.client.session.get("comparison_results")
+        self.assertNotIn("removed_or_out_of_stock", session_data)
+        self.assertEqual(session_data["counts"]["removed_or_out_of_stock"], 2)
+
+        page = resp.context["removed_or_out_of_stock"]
+        self.assertEqual(page.paginator.count, 2)
+        self.assertEqual([r["id"] for r in page], ["A1"])
+        url = reverse("supplier_comparison", args=[self.supplier.id])
+        resp = self.client.get(url, {"removed_or_out_of_stock_page": 2})
+        self.assertEqual([r["id"] for r in resp.context["removed_or_out_of_stock"]], ["B2"])
+
+        resp = self.client.get(reverse("supplier_comparison_download", args=[self.supplier.id]))
+        self.assertEqual(resp.status_code, 200)
+        exported = pd.read_excel(BytesIO(resp.content), sheet_name=None)
+        self.assertEqual(exported["Removed_or_OutOfStock"]["id"].tolist(), ["A1", "B2"])
+        self.assertEqual(exported["New_Products"]["id"].tolist(), ["C3"])
+
+        # A newer comparison replaces the stored sections; the old session key no longer matches.
+        self._upload(make_excel_bytes(rows, columns=("COD. INTERNO", "STOCK", "DESC")), filename="otro.xlsx")
+        session = self.client.session
+        session["comparison_results"] = session_data
+        session.save()
+        resp = self.client.get(url)
+        self.assertRedirects(resp, reverse("supplier_upload", args=[self.supplier.id]))
+
+    @patch("accounts.views.get_supabase_storage_service", autospec=True)
+    def test_deleting_supplier_removes_its_stored_files(self, mock_get_service):
+        mock_get_service.return_value = _FakeSupabaseService()
+        columns = ("COD. INTERNO", "STOCK", "DESC")
+        self._upload(make_excel_bytes([{"id": "A1", "stock": 1, "name": "Prod A"}], columns=columns))
+        self._upload(make_excel_bytes([{"id": "A1", "stock": 0, "name": "Prod A"}], columns=columns))
+        self.supplier.refresh_from_db()
+        storage = self.supplier.current_file.storage
+        names = [
+            self.supplier.current_file.name,
+            snapshot_path(self.supplier),
+            comparison_path(self.supplier, "stock_changes"),
+            *(version_path(self.supplier, number) for number in self.supplier.versions.values_list("number", flat=True)),
+        ]
+        self.assertEqual(len(names), 5)
+        self.assertTrue(all(storage.exists(name) for name in names))
+
+        resp = self.client.post(reverse("supplier_delete", args=[self.supplier.id]), follow=True)
+        self.assertRedirects(resp, reverse("home"))
+        self.assertContains(resp, "deleted successfully")
+        self.assertFalse(Supplier.objects.filter(pk=self.supplier.pk).exists())
+        self.assertEqual([name for name in names if storage.exists(name)], [])
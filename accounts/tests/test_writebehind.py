@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import PendingWrite, Supplier
+from accounts.services import writebehind
+from accounts.services.snapshots import snapshot_path
+from accounts.services.supabase_storage import SupabaseStorageError
+from accounts.services.writebehind import MAX_WRITE_ATTEMPTS, retry_pending_writes, submit
+from accounts.tests.utils import make_excel_bytes
+
+
+class _FakeSupabaseService:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.uploads = []
+
+    def upload(self, path: str, content: bytes):
+        if self.fail:
+            raise SupabaseStorageError("Supabase is down")
+        self.uploads.append(path)
+        return path
+
+
+def _make_due():
+    PendingWrite.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+
+
+@override_settings(
+    DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+)
+class WriteBehindRetryTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="u1", password="pw")
+        self.client.login(username="u1", password="pw")
+        self.supplier = Supplier.objects.create(
+            owner=self.user,
+            name="Proveedor",
+            product_id_column="COD. INTERNO",
+            stock_column="STOCK",
+            price_column="PRECIO",
+        )
+
+    def _upload(self, service, rows, filename="stock.xlsx"):
+        with patch("accounts.views.get_supabase_storage_service", lambda: service):
+            url = reverse("supplier_upload", args=[self.supplier.id])
+            return self.client.post(url, {"file": SimpleUploadedFile(filename, make_excel_bytes(rows))})
+
+    def test_failed_comparison_excel_is_retried_then_surfaced(self):
+        self._upload(_FakeSupabaseService(fail=True), [{"id": "A1", "stock": 1, "price": 10}])
+        write = PendingWrite.objects.get()
+        self.assertEqual((write.kind, write.status, write.attempts), ("last_comparison", "pending", 1))
+        self.assertIn("Supabase is down", write.last_error)
+        self.assertGreater(write.next_attempt_at, timezone.now())
+        self.assertEqual(retry_pending_writes(), 0)  # not due yet
+
+        # Retries rebuild the Excel from the stored comparison.
+        service = _FakeSupabaseService()
+        _make_due()
+        with patch("accounts.services.uploads.get_supabase_storage_service", lambda: service):
+            self.assertEqual(retry_pending_writes(), 1)
+        self.assertEqual(service.uploads, [f"user_{self.user.id}/supplier_{self.supplier.id}/last_comparison.xlsx"])
+        self.assertFalse(PendingWrite.objects.exists())
+
+        self._upload(_FakeSupabaseService(fail=True), [{"id": "A1", "stock": 2, "price": 10}])
+        with patch("accounts.services.uploads.get_supabase_storage_service", lambda: _FakeSupabaseService(fail=True)):
+            for _attempt in range(MAX_WRITE_ATTEMPTS - 1):
+                _make_due()
+                retry_pending_writes()
+        write = PendingWrite.objects.get()
+        self.assertEqual((write.status, write.attempts), ("failed", MAX_WRITE_ATTEMPTS))
+        _make_due()
+        self.assertEqual(retry_pending_writes(), 0)  # failed writes are not retried
+
+        resp = self.client.get(reverse("supplier_comparison", args=[self.supplier.id]))
+        self.assertContains(resp, "Some files could not be stored")
+        self.assertContains(resp, "Last comparison Excel")
+
+        # The next successful write of the same kind resolves the failure.
+        self._upload(_FakeSupabaseService(), [{"id": "A1", "stock": 3, "price": 10}])
+        self.assertFalse(PendingWrite.objects.exists())
+
+    def test_failed_writes_are_retried_by_the_command(self):
+        other = Supplier.objects.create(owner=self.user, name="Otro", product_id_column="COD. INTERNO", stock_column="STOCK")
+        self._upload(_FakeSupabaseService(fail=True), [{"id": "A1", "stock": 1, "price": 10}])
+        with patch("accounts.views.get_supabase_storage_service", lambda: _FakeSupabaseService(fail=True)):
+            self.client.post(
+                reverse("supplier_upload", args=[other.id]),
+                {"file": SimpleUploadedFile("stock.xlsx", make_excel_bytes([{"id": "B1", "stock": 1}]))},
+            )
+        self.assertEqual(PendingWrite.objects.count(), 2)
+        _make_due()
+
+        service = _FakeSupabaseService()
+        with patch("accounts.services.uploads.get_supabase_storage_service", lambda: service):
+            self.assertEqual(retry_pending_writes(supplier=other), 1)
+            self.assertEqual(list(PendingWrite.objects.values_list("supplier_id", flat=True)), [self.supplier.id])
+            out = StringIO()
+            call_command("retry_pending_writes", stdout=out)
+        self.assertIn("Stored 1 pending writes.", out.getvalue())
+        self.assertEqual(len(service.uploads), 2)
+        self.assertFalse(PendingWrite.objects.exists())
+
+    def test_snapshot_retry_rebuilds_it_unless_the_file_was_replaced(self):
+        self._upload(_FakeSupabaseService(), [{"id": "A1", "stock": 1, "price": 10}])
+        self.supplier.refresh_from_db()
+        storage = self.supplier.current_file.storage
+        storage.delete(snapshot_path(self.supplier))
+
+        submit(self.supplier, "snapshot", {"digest": "0" * 64}, None)
+        self.assertFalse(PendingWrite.objects.exists())  # superseded: another file is stored
+        self.assertFalse(storage.exists(snapshot_path(self.supplier)))
+
+        with override_settings(STOCK_WRITE_BEHIND=True), patch.object(writebehind, "_writer_queue") as writer_queue:
+            submit(self.supplier, "snapshot", {"digest": self.supplier.current_file_digest}, None)
+        writer_queue.return_value.put_nowait.assert_called_once()
+        _make_due()
+        self.assertEqual(retry_pending_writes(), 1)
+        self.assertTrue(storage.exists(snapshot_path(self.supplier)))
+        self.assertFalse(PendingWrite.objects.exists())
+
+    def test_history_version_is_written_behind_the_upload(self):
+        with override_settings(STOCK_WRITE_BEHIND=True), patch.object(writebehind, "_writer_queue") as writer_queue:
+            self._upload(_FakeSupabaseService(), [{"id": "A1", "stock": 1, "price": 10}])
+        kinds = [item[2] for (item,), _kwargs in writer_queue.return_value.put_nowait.call_args_list]
+        self.assertIn("version", kinds)
+        self.assertFalse(self.supplier.versions.exists())
+
+        # A retry rebuilds the version from the stored file while it is still current.
+        _make_due()
+        retry_pending_writes()
+        self.assertEqual(list(self.supplier.versions.values_list("number", "file_name")), [(1, "stock.xlsx")])
+        self.assertFalse(PendingWrite.objects.filter(kind="version").exists())
+
+
+@override_settings(STOCK_WRITE_BEHIND=True)
+class WriteBehindQueueTests(TransactionTestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username="u1", password="pw")
+        self.supplier = Supplier.objects.create(owner=user, name="Proveedor", product_id_column="ID", stock_column="STOCK")
+
+    def test_submit_returns_before_the_write_and_flush_waits_for_it(self):
+        release = threading.Event()
+        written = []
+
+        def slow_write(supplier, args, payload):
+            release.wait(timeout=10)
+            written.append((threading.current_thread().name, args["n"], payload))
+
+        writebehind.register_handler("test", slow_write)
+        self.addCleanup(writebehind._handlers.pop, "test")
+        submit(self.supplier, "test", {"n": 1}, "payload")
+        self.assertEqual(written, [])
+        self.assertTrue(self.supplier.pending_writes.filter(kind="test").exists())
+        self.assertFalse(writebehind.flush(timeout=0.05))
+
+        release.set()
+        self.assertTrue(writebehind.flush(timeout=10))
+        self.assertEqual(written, [("stock-write-behind", 1, "payload")])
+        self.assertFalse(self.supplier.pending_writes.exists())
@@ -3,6 +3,7 @@ from __future__ import annotations
 from io import BytesIO
 from typing import Iterable, Mapping, Any
 
+import numpy as np
 import pandas as pd
 
 
@@ -40,6 +41,23 @@ def make_excel_bytes(
     return out.getvalue()
 
 
+def make_csv_bytes(
+    rows: Iterable[Mapping[str, Any]],
+    *,
+    header_row_index: int = 2,
+    columns=("COD. INTERNO", "STOCK", "DESC", "PRECIO"),
+    delimiter: str = ";",
+    encoding: str = "utf-8",
+) -> bytes:
+    """Create a delimited text export with a title preamble before the header."""
+    lines = ["Lista de precios"] + [""] * (header_row_index - 1)
+    lines.append(delimiter.join(columns))
+    for r in rows:
+        values = [r.get("id"), r.get("stock"), r.get("name", ""), r.get("price", "")]
+        lines.append(delimiter.join("" if v is None else str(v) for v in values))
+    return ("\n".join(lines) + "\n").encode(encoding)
+
+
 class DummyFile:
     """A minimal non-seekable file-like object for testing."""
 
@@ -53,3 +71,31 @@ class DummyFile:
         chunk = self._data[self._pos : self._pos + n]
         self._pos += len(chunk)
         return chunk
+
+
+RAW_SHEET_COLUMNS = ("COD. INTERNO", "STOCK", "PRECIO", "DESC")
+
+
+def make_raw_sheet(rows: int, seed: int) -> pd.DataFrame:
+    """A raw sheet mixing the cases normalization handles: duplicate and blank ids,
+    text stock, comma/dot prices with thousands separators, separator rows and blanks."""
+    rng = np.random.default_rng(seed)
+    ids = np.char.add(" SKU", rng.integers(0, rows * 0.8, size=rows).astype(str)).astype(object)
+    ids[rng.random(rows) < 0.005] = "  "
+    stock = rng.integers(-2, 40, size=rows).astype(str).astype(object)
+    texts = np.array(["EN STOCK", "agotado", " Disponible ", "POCAS UNIDADES", "consultar", "nan", "1,5"], dtype=object)
+    use_text = rng.random(rows) < 0.1
+    stock[use_text] = rng.choice(texts, size=int(use_text.sum()))
+    cents = rng.integers(0, 500_000_000, size=rows)
+    units, decimals = (cents // 100).astype(str), pd.Series(cents % 100).astype(str).str.zfill(2).to_numpy()
+    comma = pd.Series(units).str.replace(r"\B(?=(\d{3})+$)", ".", regex=True) + "," + decimals
+    dot = pd.Series(units).str.replace(r"\B(?=(\d{3})+$)", ",", regex=True) + "." + decimals
+    prices = np.where(rng.random(rows) < 0.7, "$ " + comma, dot + " USD").astype(object)
+    prices[rng.random(rows) < 0.05] = np.nan
+    prices[rng.random(rows) < 0.02] = "a consultar"
+    names = np.char.add("Producto ", rng.integers(0, 500, size=rows).astype(str)).astype(object)
+    names[rng.random(rows) < 0.05] = " "
+    frame = pd.DataFrame(dict(zip(RAW_SHEET_COLUMNS, (ids, stock, prices, names))))
+    separators = rng.random(rows) < 0.01
+    frame.loc[separators, list(RAW_SHEET_COLUMNS[1:])] = np.nan
+    return frame
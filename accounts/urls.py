@@ -7,9 +7,12 @@ from .views import (
     SupplierListView,
     SupplierCreateView,
     SupplierUploadView,
+    UploadJobView,
+    UploadJobStatusView,
     ComparisonResultView,
     ComparisonDownloadView,
     LastComparisonView,
+    SupplierHistoryView,
     SupplierDeleteView,
     SupplierSettingsView,
 )
@@ -23,9 +26,12 @@ urlpatterns = [
     path('suppliers/', SupplierListView.as_view(), name='supplier_list'),
     path('suppliers/create/', SupplierCreateView.as_view(), name='supplier_create'),
     path('suppliers/<int:pk>/upload/', SupplierUploadView.as_view(), name='supplier_upload'),
+    path('suppliers/<int:pk>/upload/jobs/<int:job_id>/', UploadJobView.as_view(), name='supplier_upload_job'),
+    path('suppliers/<int:pk>/upload/jobs/<int:job_id>/status/', UploadJobStatusView.as_view(), name='supplier_upload_job_status'),
     path('suppliers/<int:pk>/comparison/', ComparisonResultView.as_view(), name='supplier_comparison'),
     path('suppliers/<int:pk>/comparison/download/', ComparisonDownloadView.as_view(), name='supplier_comparison_download'),
     path('suppliers/<int:pk>/comparison/last/', LastComparisonView.as_view(), name='supplier_last_comparison'),
+    path('suppliers/<int:pk>/history/', SupplierHistoryView.as_view(), name='supplier_history'),
     path('suppliers/<int:pk>/settings/', SupplierSettingsView.as_view(), name='supplier_settings'),
     path('suppliers/<int:pk>/delete/', SupplierDeleteView.as_view(), name='supplier_delete'),
 ]
@@ -1,11 +1,12 @@
 import logging
-from io import BytesIO
 
 import pandas as pd
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.forms import UserCreationForm
-from django.http import HttpResponse
+from django.core.paginator import Paginator
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import redirect, render, get_object_or_404
 from django.urls import reverse_lazy
 from django.utils import timezone
@@ -14,72 +15,26 @@ from django.views.generic import TemplateView, FormView, ListView, CreateView, V
 from django.contrib.auth.mixins import LoginRequiredMixin
 
 from .models import Supplier
-from .forms import SupplierForm, SupplierUploadForm, SupplierConfigForm
-from .services.excel_compare import read_excel_dynamic, normalize_columns, compare_stock
+from .forms import SupplierForm, SupplierUploadForm, SupplierConfigForm, VersionCompareForm
+from .services.comparison_result import COMPARISON_SECTIONS, ComparisonResult
+from .services.history import VersionUnavailableError, compare_versions, delete_history
+from .services.jobs import SAVE_ERROR, enqueue_upload, job_payload, job_status, run_upload
+from .services.snapshots import delete_snapshot
 from .services.supabase_storage import SupabaseStorageError, get_supabase_storage_service
+from .services.uploads import (
+	ComparisonUnavailableError,
+	build_comparison_excel_bytes,
+	comparison_payload,
+	delete_comparison,
+	last_comparison_path,
+	save_comparison,
+	session_comparison,
+)
 
 logger = logging.getLogger(__name__)
 
-
-def _clean_comparison_value(value):
-	"""Normalize values for JSON/session storage and template rendering.
-
-	Converts NaN-like values to None and strips simple string wrappers while
-	leaving valid numbers and strings intact.
-	"""
-	try:
-		if value is None:
-			return None
-		# Convert NaN / <NA> textual representations to None
-		s = str(value).strip().lower()
-		if s in ("nan", "<na>"):
-			return None
-		return value
-	except Exception:
-		return None
-
-
-def dataframe_to_records(df: pd.DataFrame):
-	"""Convert a pandas DataFrame to a list of cleaned dict records.
-
-	This mirrors the sanitisation previously done inline in SupplierUploadView.
-	"""
-	if df is None or df.empty:
-		return []
-	try:
-		records = df.to_dict("records")
-		return [
-			{k: _clean_comparison_value(v) for k, v in rec.items()}
-			for rec in records
-		]
-	except Exception:
-		return []
-
-
-def build_comparison_excel_bytes(data: dict) -> bytes:
-	"""Build an in-memory Excel file from comparison result data.
-
-	`data` is expected to be the same structure stored in the session under
-	`comparison_results`, with keys matching section names.
-	"""
-	output = BytesIO()
-	with pd.ExcelWriter(output, engine="openpyxl") as writer:
-		sections = [
-			("removed_or_out_of_stock", "Removed_or_OutOfStock"),
-			("new_products", "New_Products"),
-			("stock_changes", "Stock_Changes"),
-			("price_changes", "Price_Changes"),
-		]
-		for key, sheet_name in sections:
-			rows = data.get(key) or []
-			if rows:
-				df = pd.DataFrame(rows)
-			else:
-				df = pd.DataFrame()
-			df.to_excel(writer, index=False, sheet_name=sheet_name[:31])
-
-	output.seek(0)
-	return output.getvalue()
+# Rows shown per page in each comparison section (see COMPARISON_PAGE_ROWS).
+DEFAULT_COMPARISON_PAGE_ROWS = 200
 
 
 class WelcomeView(TemplateView):
@@ -179,116 +134,56 @@ class SupplierUploadView(LoginRequiredMixin, View):
 			return render(request, self.template_name, {'form': form, 'supplier': supplier})
 
 		upload_file = form.cleaned_data['file']
-
-		# Capture file names for UI
-		old_original_name = supplier.last_uploaded_filename
 		new_original_name = getattr(upload_file, 'name', 'stock.xlsx')
 
-		# Load previous file (if exists) into memory for comparison
-		old_df = None
-		if supplier.current_file and supplier.current_file.name:
+		# With eager jobs off the file is staged and processed by a
+		# `process_upload_jobs` worker, so large files do not hold this request.
+		if not getattr(settings, 'STOCK_UPLOAD_JOBS_EAGER', True):
 			try:
-				with supplier.current_file.open('rb') as previous_file:
-					try:
-						prev_name = getattr(previous_file, 'name', None) or supplier.current_file.name
-					except Exception:
-						prev_name = supplier.current_file.name
-					# Read a couple bytes for diagnostics, then rewind.
-					try:
-						header_probe = previous_file.read(16)
-						if hasattr(previous_file, 'seek'):
-							previous_file.seek(0)
-						logger.info(
-							"Reading previous supplier Excel: supplier=%s path=%s head=%s",
-							supplier.name,
-							prev_name,
-							header_probe.hex(),
-						)
-					except Exception as probe_exc:
-						logger.debug("Failed probing previous Excel header bytes: %s", probe_exc)
-					old_df_raw = read_excel_dynamic(previous_file, supplier.product_id_column)
-				old_df = normalize_columns(
-					old_df_raw,
-					product_id=supplier.product_id_column,
-					stock_col=supplier.stock_column,
-					price_col=supplier.price_column,
-					name_col=supplier.product_name_column,
-					stock_in_text=supplier.stock_in_text,
-					stock_out_text=supplier.stock_out_text,
-				)
-				logger.info('Loaded previous file for supplier %s', supplier.name)
+				job = enqueue_upload(supplier, upload_file, new_original_name)
 			except Exception as exc:
-				# Important: if we cannot read the previous file, we should not silently
-				# treat everything as new, because that produces misleading comparisons.
-				logger.exception('Failed to read previous file for %s (path=%s): %s', supplier.name, supplier.current_file.name, exc)
-				messages.error(
-					request,
-					'No se pudo leer el archivo anterior para comparar. Intenta volver a subir el archivo. '
-					'Si el problema persiste, revisa que el archivo sea un .xlsx válido.',
-				)
+				logger.exception('Failed to queue uploaded file: %s', exc)
+				messages.error(request, SAVE_ERROR)
 				return render(request, self.template_name, {'form': form, 'supplier': supplier})
+			return redirect('supplier_upload_job', pk=supplier.id, job_id=job.pk)
 
-		# Read new upload into memory before saving
-		try:
-			new_df_raw = read_excel_dynamic(upload_file, supplier.product_id_column)
-			new_df = normalize_columns(
-				new_df_raw,
-				product_id=supplier.product_id_column,
-				stock_col=supplier.stock_column,
-				price_col=supplier.price_column,
-				name_col=supplier.product_name_column,
-				stock_in_text=supplier.stock_in_text,
-				stock_out_text=supplier.stock_out_text,
-			)
-		except Exception as exc:
-			logger.exception('Error reading uploaded Excel: %s', exc)
-			messages.error(request, f'Error reading Excel file: {exc}')
+		job = run_upload(supplier, upload_file, new_original_name, get_supabase_storage_service)
+		if job.status == 'failed':
+			messages.error(request, job.error)
 			return render(request, self.template_name, {'form': form, 'supplier': supplier})
+		return show_job_comparison(request, supplier, job)
 
-		# Compare old vs new
-		comparison = compare_stock(old_df, new_df)
 
-		# Overwrite previous file with the new one: delete then save with fixed name
-		try:
-			if supplier.current_file and supplier.current_file.name:
-				supplier.current_file.delete(save=False)
-			fixed_name = f"user_{request.user.id}/supplier_{supplier.id}/stock.xlsx"
-			supplier.current_file.save(fixed_name, upload_file, save=False)
-			supplier.last_uploaded_filename = new_original_name
-			supplier.save(update_fields=['current_file', 'last_uploaded_filename', 'updated_at'])
-			logger.info('Saved new file for supplier %s (original: %s)', supplier.name, supplier.last_uploaded_filename)
-		except Exception as exc:
-			logger.exception('Failed to save uploaded file: %s', exc)
-			messages.error(request, 'Failed to save uploaded file.')
-			return render(request, self.template_name, {'form': form, 'supplier': supplier})
+def show_job_comparison(request, supplier, job):
+	"""Point the session at the comparison stored by a finished job and show it."""
+	request.session['comparison_results'] = job_payload(job)
+	messages.success(request, 'File uploaded and comparison completed.')
+	return redirect('supplier_comparison', pk=supplier.id)
 
-		# Prepare data for UI: convert DataFrames to records for session storage
-		comparison_payload = {
-			'supplier_id': supplier.id,
-			'supplier_name': supplier.name,
-			'old_file_name': old_original_name,
-			'new_file_name': new_original_name,
-			'removed_or_out_of_stock': dataframe_to_records(comparison['removed_or_out_of_stock']),
-			'new_products': dataframe_to_records(comparison['new_products']),
-			'stock_changes': dataframe_to_records(comparison['stock_changes']),
-			'price_changes': dataframe_to_records(comparison['price_changes']),
-		}
-		request.session['comparison_results'] = comparison_payload
 
-		# Automatically persist the last comparison Excel in Supabase storage
-		# This is best-effort only and must not break the existing flow.
-		try:
-			service = get_supabase_storage_service()
-			excel_bytes = build_comparison_excel_bytes(comparison_payload)
-			storage_path = f"user_{request.user.id}/supplier_{supplier.id}/last_comparison.xlsx"
-			service.upload(storage_path, excel_bytes)
-			logger.info('Stored last comparison Excel for supplier %s at %s', supplier.name, storage_path)
-		except SupabaseStorageError as exc:
-			logger.warning('Failed to store last comparison Excel for %s: %s', supplier.name, exc)
-		except Exception as exc:  # pragma: no cover - defensive
-			logger.exception('Unexpected error storing last comparison Excel for %s: %s', supplier.name, exc)
-		messages.success(request, 'File uploaded and comparison completed.')
-		return redirect('supplier_comparison', pk=supplier.id)
+class UploadJobView(LoginRequiredMixin, View):
+	"""Progress page of a queued upload; shows the comparison once the job is done."""
+
+	template_name = 'suppliers/upload_job.html'
+
+	def get(self, request, pk, job_id):
+		supplier = get_object_or_404(Supplier, pk=pk, owner=request.user)
+		job = get_object_or_404(supplier.upload_jobs, pk=job_id)
+		if job.status == 'done':
+			return show_job_comparison(request, supplier, job)
+		if job.status == 'failed':
+			messages.error(request, job.error)
+			return redirect('supplier_upload', pk=supplier.id)
+		return render(request, self.template_name, {'supplier': supplier, 'job': job})
+
+
+class UploadJobStatusView(LoginRequiredMixin, View):
+	"""JSON progress of a queued upload, polled by the progress page."""
+
+	def get(self, request, pk, job_id):
+		supplier = get_object_or_404(Supplier, pk=pk, owner=request.user)
+		job = get_object_or_404(supplier.upload_jobs, pk=job_id)
+		return JsonResponse(job_status(job))
 
 
 class ComparisonResultView(LoginRequiredMixin, View):
@@ -297,7 +192,8 @@ class ComparisonResultView(LoginRequiredMixin, View):
 	def get(self, request, pk):
 		supplier = get_object_or_404(Supplier, pk=pk, owner=request.user)
 		data = request.session.get('comparison_results') or {}
-		if not data or data.get('supplier_id') != supplier.id:
+		result = session_comparison(supplier, data)
+		if result is None:
 			messages.info(request, 'No comparison data available for this supplier. Please upload a file.')
 			return redirect('supplier_upload', pk=supplier.id)
 
@@ -305,23 +201,45 @@ class ComparisonResultView(LoginRequiredMixin, View):
 			'supplier': supplier,
 			'old_file_name': data.get('old_file_name'),
 			'new_file_name': data.get('new_file_name'),
-			'removed_or_out_of_stock': data.get('removed_or_out_of_stock', []),
-			'new_products': data.get('new_products', []),
-			'stock_changes': data.get('stock_changes', []),
-			'price_changes': data.get('price_changes', []),
+			'pagers': {},
+			# Files that kept failing to be written behind the upload.
+			'failed_writes': supplier.pending_writes.filter(status='failed'),
 		}
+		per_page = getattr(settings, 'COMPARISON_PAGE_ROWS', DEFAULT_COMPARISON_PAGE_ROWS)
+		try:
+			# Only the requested page of each section is turned into records.
+			for section in COMPARISON_SECTIONS:
+				param = f'{section}_page'
+				page = Paginator(result.section_records(section), per_page).get_page(request.GET.get(param))
+				context[section] = page
+				context['pagers'][section] = {
+					'page': page,
+					'previous': self._page_query(request, param, page.previous_page_number()) if page.has_previous() else None,
+					'next': self._page_query(request, param, page.next_page_number()) if page.has_next() else None,
+				}
+		except ComparisonUnavailableError as exc:
+			logger.warning('Comparison for supplier %s is no longer available: %s', supplier.name, exc)
+			messages.info(request, 'No comparison data available for this supplier. Please upload a file.')
+			return redirect('supplier_upload', pk=supplier.id)
 		return render(request, self.template_name, context)
 
+	@staticmethod
+	def _page_query(request, param: str, number: int) -> str:
+		"""Current query string with `param` set to `number`, keeping other sections' pages."""
+		query = request.GET.copy()
+		query[param] = number
+		return query.urlencode()
+
 
 class LastComparisonView(LoginRequiredMixin, View):
 	template_name = 'suppliers/comparison.html'
 
 	def get(self, request, pk):
 		supplier = get_object_or_404(Supplier, pk=pk, owner=request.user)
-		storage_path = f"user_{request.user.id}/supplier_{supplier.id}/last_comparison.xlsx"
+		storage_path = last_comparison_path(supplier)
 		try:
 			service = get_supabase_storage_service()
-			content = service.download(storage_path)
+			fh = service.open_download(storage_path)
 		except SupabaseStorageError as exc:
 			message = str(exc)
 			if 'File not found' in message:
@@ -332,8 +250,7 @@ class LastComparisonView(LoginRequiredMixin, View):
 			return redirect('supplier_upload', pk=supplier.id)
 
 		try:
-			buffer = BytesIO(content)
-			with pd.ExcelFile(buffer) as xls:
+			with fh, pd.ExcelFile(fh) as xls:
 				def read_sheet(sheet_name: str) -> pd.DataFrame:
 					try:
 						return pd.read_excel(xls, sheet_name=sheet_name)
@@ -346,19 +263,16 @@ class LastComparisonView(LoginRequiredMixin, View):
 				stock_df = read_sheet('Stock_Changes')
 				price_df = read_sheet('Price_Changes')
 
-			# Rebuild the same structure used by ComparisonResultView / ComparisonDownloadView
-			data = {
-				'supplier_id': supplier.id,
-				'supplier_name': supplier.name,
-				# Original filenames are not embedded in the Excel; mark as unknown.
-				'old_file_name': None,
-				'new_file_name': None,
-				'removed_or_out_of_stock': dataframe_to_records(removed_df),
-				'new_products': dataframe_to_records(new_df),
-				'stock_changes': dataframe_to_records(stock_df),
-				'price_changes': dataframe_to_records(price_df),
-			}
-			request.session['comparison_results'] = data
+			# Store it like a fresh comparison and reuse ComparisonResultView
+			result = ComparisonResult({
+				'removed_or_out_of_stock': removed_df,
+				'new_products': new_df,
+				'stock_changes': stock_df,
+				'price_changes': price_df,
+			})
+			key = save_comparison(supplier, result)
+			# Original filenames are not embedded in the Excel; mark as unknown.
+			request.session['comparison_results'] = comparison_payload(supplier, result, key, None, None)
 		except Exception as exc:  # pragma: no cover - defensive
 			logger.exception('Failed to reconstruct last comparison for supplier %s: %s', supplier.name, exc)
 			messages.error(request, 'Could not read the last comparison file. Please upload a new file.')
@@ -374,20 +288,22 @@ class ComparisonDownloadView(LoginRequiredMixin, View):
 	def get(self, request, pk):
 		supplier = get_object_or_404(Supplier, pk=pk, owner=request.user)
 		data = request.session.get('comparison_results') or {}
-		if not data or data.get('supplier_id') != supplier.id:
+		result = session_comparison(supplier, data)
+		if result is None:
 			messages.info(request, 'No comparison data available to export. Please upload a file first.')
 			return redirect('supplier_upload', pk=supplier.id)
 
 		try:
+			counts = result.counts()
 			logger.info(
 				'Preparing comparison Excel for supplier %s: removed=%d, new=%d, stock_changes=%d, price_changes=%d',
 				supplier.name,
-				len(data.get('removed_or_out_of_stock') or []),
-				len(data.get('new_products') or []),
-				len(data.get('stock_changes') or []),
-				len(data.get('price_changes') or []),
+				counts['removed_or_out_of_stock'],
+				counts['new_products'],
+				counts['stock_changes'],
+				counts['price_changes'],
 			)
-			excel_bytes = build_comparison_excel_bytes(data)
+			excel_bytes = build_comparison_excel_bytes(result)
 			slug_name = slugify(supplier.name) or f'supplier-{supplier.id}'
 			date_str = timezone.now().strftime('%Y%m%d')
 			filename = f'comparison_{slug_name}_{date_str}.xlsx'
@@ -404,6 +320,50 @@ class ComparisonDownloadView(LoginRequiredMixin, View):
 			return redirect('supplier_comparison', pk=supplier.id)
 
 
+class SupplierHistoryView(LoginRequiredMixin, View):
+	"""List a supplier's stored versions and compare any two of them."""
+
+	template_name = 'suppliers/history.html'
+
+	def get(self, request, pk):
+		supplier = get_object_or_404(Supplier, pk=pk, owner=request.user)
+		versions = list(supplier.versions.all())
+		initial = {}
+		if len(versions) >= 2:
+			initial = {'old_version': versions[1].number, 'new_version': versions[0].number}
+		form = VersionCompareForm(initial=initial, versions=versions)
+		return render(request, self.template_name, {'supplier': supplier, 'versions': versions, 'form': form})
+
+	def post(self, request, pk):
+		supplier = get_object_or_404(Supplier, pk=pk, owner=request.user)
+		versions = list(supplier.versions.all())
+		form = VersionCompareForm(request.POST, versions=versions)
+		if not form.is_valid():
+			messages.error(request, 'Please choose two different versions.')
+			return render(request, self.template_name, {'supplier': supplier, 'versions': versions, 'form': form})
+
+		old_number = form.cleaned_data['old_version']
+		new_number = form.cleaned_data['new_version']
+		try:
+			result = compare_versions(supplier, old_number, new_number)
+			key = save_comparison(supplier, result)
+		except VersionUnavailableError as exc:
+			logger.warning('Could not rebuild versions of supplier %s: %s', supplier.name, exc)
+			messages.error(request, 'One of the selected versions is no longer available.')
+			return render(request, self.template_name, {'supplier': supplier, 'versions': versions, 'form': form})
+		except Exception as exc:
+			logger.exception('Failed to compare versions of supplier %s: %s', supplier.name, exc)
+			messages.error(request, 'Failed to compare the selected versions.')
+			return render(request, self.template_name, {'supplier': supplier, 'versions': versions, 'form': form})
+
+		names = {v.number: f"{v.file_name or 'unknown file'} (v{v.number})" for v in versions}
+		request.session['comparison_results'] = comparison_payload(
+			supplier, result, key, names[old_number], names[new_number],
+		)
+		logger.info('Compared versions %d and %d of supplier %s', old_number, new_number, supplier.name)
+		return redirect('supplier_comparison', pk=supplier.id)
+
+
 class SupplierDeleteView(LoginRequiredMixin, DeleteView):
 	model = Supplier
 	template_name = 'suppliers/delete.html'
@@ -412,17 +372,21 @@ class SupplierDeleteView(LoginRequiredMixin, DeleteView):
 	def get_queryset(self):
 		return Supplier.objects.filter(owner=self.request.user)
 
-	def delete(self, request, *args, **kwargs):
-		obj = self.get_object()
+	def form_valid(self, form):
+		# DeleteView handles POST here; `delete()` is not called since Django 4.0.
+		obj = self.object
 		name = obj.name
 		try:
+			delete_comparison(obj)
+			delete_history(obj)
 			if obj.current_file:
+				delete_snapshot(obj)
 				obj.current_file.delete(save=False)
 		except Exception as exc:
 			logger.warning('Failed to delete file for supplier %s: %s', name, exc)
-		logger.info('Supplier deleted: %s by %s', name, request.user.username)
-		messages.success(request, f'Supplier "{name}" deleted successfully.')
-		return super().delete(request, *args, **kwargs)
+		logger.info('Supplier deleted: %s by %s', name, self.request.user.username)
+		messages.success(self.request, f'Supplier "{name}" deleted successfully.')
+		return super().form_valid(form)
 
 
 class SupplierSettingsView(LoginRequiredMixin, CreateView):
@@ -0,0 +1,41 @@
+"""Synthetic supplier sheets shared by the benchmark scripts."""
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+
+COLUMNS = ("COD. INTERNO", "STOCK", "PRECIO", "DESC")
+
+
+def make_raw_frame(rows: int, seed: int = 0, start: int = 0) -> pd.DataFrame:
+    """Build a raw (string-typed) sheet like `read_excel_dynamic` returns.
+
+    Product ids run from SKU<start>. About 1% of rows are section separators
+    with a single non-empty cell and prices mix comma- and dot-decimal notations.
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.char.add("SKU", np.arange(start, start + rows).astype(str)).astype(object)
+    stock = rng.integers(0, 50, size=rows).astype(str).astype(object)
+    cents = rng.integers(100, 10_000_000, size=rows)
+    prices = pd.Series(cents // 100).astype(str) + "," + pd.Series(cents % 100).astype(str).str.zfill(2)
+    prices = ("$ " + prices).astype(object).to_numpy()
+    names = np.char.add("Producto ", (np.arange(rows) % 5000).astype(str)).astype(object)
+    frame = pd.DataFrame({
+        COLUMNS[0]: ids,
+        COLUMNS[1]: stock,
+        COLUMNS[2]: prices,
+        COLUMNS[3]: names,
+    })
+    separators = rng.random(rows) < 0.01
+    frame.loc[separators, list(COLUMNS[1:])] = np.nan
+    frame.loc[separators, COLUMNS[0]] = "-- SECCION --"
+    return frame
+
+
+@contextmanager
+def timed(label: str, results: dict):
+    start = time.perf_counter()
+    yield
+    results[label] = time.perf_counter() - start
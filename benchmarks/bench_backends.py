@@ -0,0 +1,52 @@
+"""Benchmark the pandas and Polars DataFrame backends on normalize and compare.
+
+Run from the repository root (the Polars backend needs the polars package):
+
+    python -m benchmarks.bench_backends [--rows 100000 1000000] [--change-rate 0.05]
+"""
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+from accounts.services.backends import get_backend
+from benchmarks._data import COLUMNS, make_raw_frame, timed
+
+
+def changed_copy(raw, rate: float, seed: int = 1):
+    """Return `raw` with about `rate` of its rows given a different stock value."""
+    rng = np.random.default_rng(seed)
+    raw = raw.copy()
+    mask = (rng.random(len(raw)) < rate) & raw[COLUMNS[1]].notna().to_numpy()
+    raw.loc[mask, COLUMNS[1]] = "999"
+    return raw
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--change-rate", type=float, default=0.05)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    backends = [get_backend("pandas"), get_backend("polars")]
+
+    print(f"{'rows':>10} {'backend':>8} {'normalize (s)':>14} {'compare (s)':>12}")
+    for rows in args.rows:
+        old_raw = make_raw_frame(rows)
+        new_raw = changed_copy(old_raw, args.change_rate)
+        outputs = []
+        for backend in backends:
+            results = {}
+            with timed("normalize", results):
+                old = backend.normalize_columns(old_raw, *COLUMNS[:3], name_col=COLUMNS[3])
+                new = backend.normalize_columns(new_raw, *COLUMNS[:3], name_col=COLUMNS[3])
+            with timed("compare", results):
+                outputs.append(backend.compare_stock(old, new))
+            print(f"{rows:>10} {backend.name:>8} {results['normalize']:>14.3f} {results['compare']:>12.3f}")
+        for section in outputs[0]:
+            pd.testing.assert_frame_equal(outputs[1][section], outputs[0][section])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Benchmark `compare_stock` with and without the row-fingerprint pre-filter.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_compare [--rows 1000000] [--change-rates 0 0.01 0.05 0.5]
+"""
+import argparse
+import logging
+
+import numpy as np
+
+from accounts.services.excel_compare import ROW_HASH_COLUMN, compare_stock, normalize_columns
+from benchmarks._data import COLUMNS, make_raw_frame, timed
+
+
+def changed_copy(raw, rate: float, seed: int = 1):
+    """Return `raw` with about `rate` of its rows given a different stock value."""
+    rng = np.random.default_rng(seed)
+    raw = raw.copy()
+    mask = (rng.random(len(raw)) < rate) & raw[COLUMNS[1]].notna().to_numpy()
+    raw.loc[mask, COLUMNS[1]] = "999"
+    return raw
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--change-rates", type=float, nargs="+", default=[0.0, 0.01, 0.05, 0.5])
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    raw = make_raw_frame(args.rows)
+    old = normalize_columns(raw, *COLUMNS[:3], name_col=COLUMNS[3])
+    old_plain = old.drop(columns=[ROW_HASH_COLUMN])
+
+    print(f"{'rows':>10} {'changed':>8} {'full (s)':>10} {'fingerprint (s)':>16} {'speedup':>8}")
+    for rate in args.change_rates:
+        new = normalize_columns(changed_copy(raw, rate), *COLUMNS[:3], name_col=COLUMNS[3])
+        results = {}
+        with timed("full", results):
+            expected = compare_stock(old_plain, new.drop(columns=[ROW_HASH_COLUMN]))
+        with timed("fingerprint", results):
+            actual = compare_stock(old, new)
+        for section, frame in expected.items():
+            assert frame.values.tolist() == actual[section].values.tolist(), f"{section} differs"
+        speedup = results["full"] / results["fingerprint"]
+        print(f"{args.rows:>10} {rate:>8.0%} {results['full']:>10.3f} {results['fingerprint']:>16.3f} {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
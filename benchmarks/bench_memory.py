@@ -0,0 +1,53 @@
+"""Benchmark the memory footprint of normalized supplier frames.
+
+Compares the compact schema produced by `normalize_columns` with the
+previous representation (object strings, float64 stock and price).
+Run from the repository root:
+
+    python -m benchmarks.bench_memory [--rows 100000 1000000]
+"""
+import argparse
+
+import pandas as pd
+
+from accounts.services.excel_compare import cents_to_price, normalize_columns
+from benchmarks._data import COLUMNS, make_raw_frame
+
+
+def legacy_representation(frame: pd.DataFrame) -> pd.DataFrame:
+    """Rebuild the pre-compaction dtypes from a compact normalized frame."""
+    legacy = pd.DataFrame({
+        'id': frame['id'].astype(object),
+        'stock': frame['stock'].astype('float64'),
+        'price': cents_to_price(frame['price_cents']),
+        'name': frame['name'].astype(object),
+        'stock_raw': frame['stock_raw'].astype(object),
+    })
+    return legacy
+
+
+def footprint_mb(frame: pd.DataFrame) -> float:
+    return frame.memory_usage(deep=True).sum() / 2**20
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'legacy (MB)':>12} {'compact (MB)':>13} {'reduction':>10}")
+    for rows in args.rows:
+        compact = normalize_columns(
+            make_raw_frame(rows),
+            product_id=COLUMNS[0],
+            stock_col=COLUMNS[1],
+            price_col=COLUMNS[2],
+            name_col=COLUMNS[3],
+        )
+        legacy_mb = footprint_mb(legacy_representation(compact))
+        compact_mb = footprint_mb(compact)
+        print(f"{rows:>10} {legacy_mb:>12.1f} {compact_mb:>13.1f} {legacy_mb / compact_mb:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
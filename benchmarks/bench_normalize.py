@@ -0,0 +1,45 @@
+"""Benchmark separator-row filtering in `normalize_columns`.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_normalize [--rows 100000 1000000]
+"""
+import argparse
+from typing import Any
+
+import pandas as pd
+
+from accounts.services.excel_compare import _nonempty_counts
+from benchmarks._data import COLUMNS, make_raw_frame, timed
+
+
+def legacy_nonempty_counts(frame: pd.DataFrame) -> pd.Series:
+    """The previous row-wise implementation, kept as the baseline."""
+    def _is_nonempty(v: Any) -> bool:
+        if pd.isna(v):
+            return False
+        s = str(v).strip()
+        return s != ''
+    return frame.apply(lambda r: sum(_is_nonempty(r[c]) for c in frame.columns), axis=1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>8}")
+    for rows in args.rows:
+        frame = make_raw_frame(rows)[list(COLUMNS)]
+        results = {}
+        with timed("legacy", results):
+            expected = legacy_nonempty_counts(frame)
+        with timed("vectorized", results):
+            actual = _nonempty_counts(frame)
+        assert (expected.to_numpy() == actual.to_numpy()).all(), "results differ"
+        speedup = results["legacy"] / results["vectorized"]
+        print(f"{rows:>10} {results['legacy']:>12.3f} {results['vectorized']:>15.3f} {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
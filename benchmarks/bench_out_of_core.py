@@ -0,0 +1,74 @@
+"""Benchmark peak memory of in-memory vs out-of-core `compare_stock`.
+
+Each mode runs in a fresh process so its peak RSS is measured on its own.
+Run from the repository root:
+
+    python -m benchmarks.bench_out_of_core [--rows 2000000] [--chunk-rows 100000] [--first-upload]
+
+With --first-upload there is no previous file, so every row is a new product.
+"""
+import argparse
+import logging
+import multiprocessing
+import resource
+import time
+
+import pandas as pd
+
+from accounts.services.excel_compare import compare_stock, normalize_columns
+from accounts.services.external_compare import compare_stock_out_of_core
+from benchmarks._data import COLUMNS, make_raw_frame
+from benchmarks.bench_compare import changed_copy
+
+
+def normalize(raw):
+    return normalize_columns(raw, *COLUMNS[:3], name_col=COLUMNS[3])
+
+
+def raw_chunks(rows: int, chunk_rows: int, changed: bool):
+    """Raw sheet chunks; the changed sheet has about 1% of stock values altered."""
+    for start in range(0, rows, chunk_rows):
+        raw = make_raw_frame(min(chunk_rows, rows - start), seed=start, start=start)
+        yield changed_copy(raw, 0.01, seed=start) if changed else raw
+
+
+def run(mode: str, rows: int, chunk_rows: int, first_upload: bool, queue) -> None:
+    logging.disable(logging.INFO)
+    started = time.perf_counter()
+    if mode == "in-memory":
+        old = None if first_upload else normalize(pd.concat(raw_chunks(rows, chunk_rows, False), ignore_index=True))
+        new = normalize(pd.concat(raw_chunks(rows, chunk_rows, True), ignore_index=True))
+        result = compare_stock(old, new)
+    else:
+        result = compare_stock_out_of_core(
+            None if first_upload else (normalize(raw) for raw in raw_chunks(rows, chunk_rows, False)),
+            (normalize(raw) for raw in raw_chunks(rows, chunk_rows, True)),
+        )
+    elapsed = time.perf_counter() - started
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((elapsed, peak_mb, result.count("new_products" if first_upload else "stock_changes")))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[2_000_000])
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    parser.add_argument("--modes", nargs="+", default=["in-memory", "out-of-core"])
+    parser.add_argument("--first-upload", action="store_true")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    counted = "new products" if args.first_upload else "stock changes"
+    print(f"{'rows':>10} {'mode':>12} {'time (s)':>9} {'peak RSS (MB)':>14} {counted:>14}")
+    for rows in args.rows:
+        for mode in args.modes:
+            queue = context.Queue()
+            process = context.Process(target=run, args=(mode, rows, args.chunk_rows, args.first_upload, queue))
+            process.start()
+            elapsed, peak_mb, changes = queue.get()
+            process.join()
+            print(f"{rows:>10} {mode:>12} {elapsed:>9.1f} {peak_mb:>14.0f} {changes:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Benchmark chunked `normalize_columns_parallel` against serial `normalize_columns`.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_parallel_normalize [--rows 500000 2000000] [--workers 2 4 8] [--chunk-rows 100000]
+"""
+import argparse
+import logging
+
+import pandas as pd
+
+from accounts.services.excel_compare import normalize_columns, normalize_columns_parallel
+from benchmarks._data import COLUMNS, make_raw_frame, timed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[500_000, 2_000_000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    print(f"{'rows':>10} {'workers':>8} {'time (s)':>9} {'speedup':>8}")
+    for rows in args.rows:
+        raw = make_raw_frame(rows)
+        results = {}
+        with timed("serial", results):
+            expected = normalize_columns(raw, *COLUMNS[:3], name_col=COLUMNS[3])
+        print(f"{rows:>10} {'serial':>8} {results['serial']:>9.3f} {1:>7.1f}x")
+        for workers in args.workers:
+            with timed(workers, results):
+                actual = normalize_columns_parallel(
+                    raw, *COLUMNS[:3], name_col=COLUMNS[3], workers=workers, chunk_rows=args.chunk_rows,
+                )
+            pd.testing.assert_frame_equal(actual, expected)
+            print(f"{rows:>10} {workers:>8} {results[workers]:>9.3f} {results['serial'] / results[workers]:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
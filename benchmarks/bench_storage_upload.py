@@ -0,0 +1,60 @@
+"""Benchmark streaming uploads through `SupabaseStorageService.upload`.
+
+Uploads files of the given sizes from disk to the local Supabase stand-in
+server (resumable parts, with one part failing halfway) and reports the
+time taken and the peak Python memory allocated during the upload.
+Run from the repository root:
+
+    python -m benchmarks.bench_storage_upload [--sizes-mb 50 300]
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+import tracemalloc
+
+from accounts.services.supabase_storage import DEFAULT_UPLOAD_CHUNK_SIZE, SupabaseStorageService
+from accounts.tests.supabase_stub import SupabaseStub
+
+_BLOCK = 2**20
+
+
+def write_random_file(path: str, size_mb: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "wb") as fh:
+        for _ in range(size_mb):
+            block = os.urandom(_BLOCK)
+            digest.update(block)
+            fh.write(block)
+    return digest.hexdigest()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[50, 300])
+    parser.add_argument("--chunk-mb", type=int, default=DEFAULT_UPLOAD_CHUNK_SIZE // _BLOCK)
+    args = parser.parse_args()
+
+    print(f"{'size (MB)':>10} {'seconds':>8} {'MB/s':>7} {'peak (MB)':>10} {'ok':>4}")
+    for size_mb in args.sizes_mb:
+        with tempfile.TemporaryDirectory() as tmp, SupabaseStub(keep_data=False, fail_patches={3}) as stub:
+            path = os.path.join(tmp, "stock.bin")
+            expected = write_random_file(path, size_mb)
+            service = SupabaseStorageService(
+                base_url=stub.url, api_key="key", bucket=stub.bucket,
+                chunk_size=args.chunk_mb * _BLOCK, retry_backoff=0,
+            )
+            tracemalloc.start()
+            started = time.perf_counter()
+            with open(path, "rb") as fh:
+                service.upload("bench/stock.bin", fh)
+            seconds = time.perf_counter() - started
+            _current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            ok = stub.objects["bench/stock.bin"].sha256 == expected
+            print(f"{size_mb:>10} {seconds:>8.2f} {size_mb / seconds:>7.1f} {peak / 2**20:>10.1f} {'yes' if ok else 'NO':>4}")
+
+
+if __name__ == "__main__":
+    main()
@@ -158,10 +158,64 @@ SUPABASE_URL = os.environ.get('SUPABASE_URL') or (
 SUPABASE_ANON_KEY = os.environ.get('SUPABASE_ANON_KEY')
 SUPABASE_SERVICE_ROLE_KEY = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
 SUPABASE_BUCKET = os.environ.get('SUPABASE_BUCKET', 'provider-files')
+# Uploads are streamed; files larger than SUPABASE_RESUMABLE_THRESHOLD bytes use
+# the resumable endpoint in parts of SUPABASE_UPLOAD_CHUNK_SIZE bytes, each
+# retried up to SUPABASE_UPLOAD_RETRIES times.
+SUPABASE_UPLOAD_CHUNK_SIZE = int(os.environ.get('SUPABASE_UPLOAD_CHUNK_SIZE', str(6 * 1024 * 1024)))
+SUPABASE_RESUMABLE_THRESHOLD = int(os.environ.get('SUPABASE_RESUMABLE_THRESHOLD', str(6 * 1024 * 1024)))
+SUPABASE_UPLOAD_RETRIES = int(os.environ.get('SUPABASE_UPLOAD_RETRIES', '3'))
+SUPABASE_TIMEOUT = int(os.environ.get('SUPABASE_TIMEOUT', '60'))
+# Downloads are streamed into a temporary file kept in memory up to this many bytes.
+SUPABASE_DOWNLOAD_SPOOL_SIZE = int(os.environ.get('SUPABASE_DOWNLOAD_SPOOL_SIZE', str(16 * 1024 * 1024)))
 
 # Use Supabase as the default storage backend for uploaded media files
 DEFAULT_FILE_STORAGE = 'accounts.storage_backends.SupabaseDjangoStorage'
 
+# Supplier file ingestion
+# Number of leading rows searched for the header row before an upload is rejected.
+STOCK_HEADER_SCAN_ROWS = int(os.environ.get('STOCK_HEADER_SCAN_ROWS', '50'))
+# Uploads with more rows than this are compared out of core, streaming both
+# files in chunks of STOCK_CHUNK_ROWS rows through sorted runs on disk (0 disables).
+STOCK_OUT_OF_CORE_ROWS = int(os.environ.get('STOCK_OUT_OF_CORE_ROWS', '500000'))
+STOCK_CHUNK_ROWS = int(os.environ.get('STOCK_CHUNK_ROWS', '100000'))
+# In-memory sheets longer than STOCK_NORMALIZE_CHUNK_ROWS are normalized in
+# chunks by this many worker processes (1 keeps normalization serial).
+STOCK_NORMALIZE_WORKERS = int(os.environ.get('STOCK_NORMALIZE_WORKERS', '1'))
+STOCK_NORMALIZE_CHUNK_ROWS = int(os.environ.get('STOCK_NORMALIZE_CHUNK_ROWS', '100000'))
+# Threads per process that fetch and parse the stored file while an upload is
+# parsed (0 reads them one after the other).
+STOCK_FETCH_THREADS = int(os.environ.get('STOCK_FETCH_THREADS', '4'))
+# DataFrame library used to normalize and compare sheets: 'pandas' (default)
+# or 'polars' (multi-threaded; requires the polars package).
+STOCK_DATAFRAME_BACKEND = os.environ.get('STOCK_DATAFRAME_BACKEND', 'pandas')
+# Version history of normalized uploads: a full checkpoint at least every N
+# versions, and at most this many versions kept per supplier (0 keeps all).
+STOCK_HISTORY_CHECKPOINT_EVERY = int(os.environ.get('STOCK_HISTORY_CHECKPOINT_EVERY', '10'))
+STOCK_HISTORY_MAX_VERSIONS = int(os.environ.get('STOCK_HISTORY_MAX_VERSIONS', '90'))
+# Rows written per COPY statement (PostgreSQL) or bulk_create batch when
+# appending changed products to their stock and price time series.
+STOCK_TIMESERIES_BATCH_ROWS = int(os.environ.get('STOCK_TIMESERIES_BATCH_ROWS', '5000'))
+# Uploads are processed inside the upload request by default. Set
+# STOCK_UPLOAD_JOBS_EAGER=False only where `manage.py process_upload_jobs`
+# workers are deployed (docker-compose runs one); otherwise queued uploads are
+# never processed. Running jobs older than STOCK_UPLOAD_JOB_TIMEOUT seconds are
+# considered abandoned.
+STOCK_UPLOAD_JOBS_EAGER = os.environ.get('STOCK_UPLOAD_JOBS_EAGER', 'True').lower() in ('1', 'true', 'yes')
+STOCK_UPLOAD_JOB_TIMEOUT = int(os.environ.get('STOCK_UPLOAD_JOB_TIMEOUT', '1800'))
+# Snapshots, history versions and the last comparison Excel are written behind
+# uploads by a background thread (queue of STOCK_WRITE_BEHIND_QUEUE writes);
+# failed writes are retried after STOCK_WRITE_BEHIND_RETRY_DELAY seconds and
+# doubling by the upload worker, by refresh_suppliers and by `manage.py
+# retry_pending_writes` (schedule it, e.g. with cron, when no worker runs;
+# requests never retry). At exit, queued writes get
+# STOCK_WRITE_BEHIND_FLUSH_TIMEOUT seconds.
+STOCK_WRITE_BEHIND = os.environ.get('STOCK_WRITE_BEHIND', 'True').lower() in ('1', 'true', 'yes')
+STOCK_WRITE_BEHIND_QUEUE = int(os.environ.get('STOCK_WRITE_BEHIND_QUEUE', '32'))
+STOCK_WRITE_BEHIND_RETRY_DELAY = int(os.environ.get('STOCK_WRITE_BEHIND_RETRY_DELAY', '60'))
+STOCK_WRITE_BEHIND_FLUSH_TIMEOUT = int(os.environ.get('STOCK_WRITE_BEHIND_FLUSH_TIMEOUT', '30'))
+# Rows shown per page in each section of the comparison page.
+COMPARISON_PAGE_ROWS = int(os.environ.get('COMPARISON_PAGE_ROWS', '200'))
+
 # Authentication redirects
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
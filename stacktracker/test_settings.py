@@ -7,6 +7,10 @@ Supabase is not used by tests: view tests mock the service and storage is
 forced to local FileSystemStorage via override_settings.
 """
 
+import atexit
+import shutil
+import tempfile
+
 from .settings import *  # noqa: F401,F403
 
 # Use SQLite (in-memory) for tests to avoid needing a Postgres service.
@@ -24,3 +28,16 @@ STATICFILES_STORAGE = "django.contrib.staticfiles.storage.StaticFilesStorage"
 
 # Don't use Supabase storage in tests.
 DEFAULT_FILE_STORAGE = "django.core.files.storage.FileSystemStorage"
+
+# Files written by tests (stored uploads, snapshots, history versions) go to a
+# temporary directory removed at exit, never into the project's supplier_files/.
+MEDIA_ROOT = tempfile.mkdtemp(prefix="stacktracker-test-media-")
+atexit.register(shutil.rmtree, MEDIA_ROOT, True)
+
+# Process uploads inside the request so view tests see the finished comparison;
+# the queued path is exercised explicitly in test_upload_jobs.
+STOCK_UPLOAD_JOBS_EAGER = True
+
+# Write snapshots and comparison Excels in the calling thread so tests see
+# them right away; the background queue is exercised in test_writebehind.
+STOCK_WRITE_BEHIND = False